@@ -1,7 +1,10 @@
+import uuid
+from collections import deque
+
 import streamlit as st
 from langchain_core.messages import HumanMessage, AIMessage
 from config import get_streamlit_config
-from config import config
+from config import config, MAX_MEMORY_ITEMS
 
 # Apply Streamlit configurations
 st_config = get_streamlit_config()
@@ -11,11 +14,22 @@ os.environ["GEMINI_API_KEY"] = config.get("ai", "GEMINI_API_KEY")
 
 
 from memory_agent.chatbot import agent
+from memory_agent.archive import get_chat_archiver
+from memory_agent.persistence import database
+from memory_agent.taste import preload_aroma_catalog
+
+# Idempotent, Streamlit reruns this script on every interaction
+database.retention.start()
+preload_aroma_catalog()
 
 
 def init_session_state():
+    # The agent's checkpointer keeps the full conversation per thread_id;
+    # the session only keeps a window of it for rendering.
+    if "thread_id" not in st.session_state:
+        st.session_state.thread_id = str(uuid.uuid4())
     if "messages" not in st.session_state:
-        st.session_state.messages = []
+        st.session_state.messages = deque(maxlen=MAX_MEMORY_ITEMS)
 
 def main():
     st.title("🍷 Wine Chatbot")
@@ -42,10 +56,14 @@ def main():
         # Get bot response
         with st.chat_message("assistant"):
             with st.spinner("Thinking..."):
-                response = agent.invoke({"messages": st.session_state.messages})
+                response = agent.invoke(
+                    {"messages": [HumanMessage(content=prompt)]},
+                    config={"configurable": {"thread_id": st.session_state.thread_id}},
+                )
                 assistant_message = response["messages"][-1]
                 st.session_state.messages.append(assistant_message)
                 st.write(assistant_message.content)
+        get_chat_archiver().archive_turn(st.session_state.thread_id, prompt, assistant_message.content)
 
 if __name__ == "__main__":
     main()
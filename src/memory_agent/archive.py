@@ -0,0 +1,239 @@
+"""Batched, asynchronous archival of completed chat turns.
+
+`ChatArchiver.archive_turn` appends the turn to a local SQLite spool, so it
+survives a restart as soon as the call returns. The spool runs in WAL mode
+with `synchronous=NORMAL`, so an append is a single small write without an
+fsync. A background thread flushes the spool in batches to the chat history
+table, so the request path never waits on the archive database.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Optional, Protocol
+
+from memory_agent.settings import get_settings
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ChatTurn:
+    thread_id: str
+    user_message: str
+    assistant_message: str
+    user_id: str = "default"
+    created_at: float = field(default_factory=time.time)
+    metadata: dict[str, Any] = field(default_factory=dict)
+
+
+class ChatHistorySink(Protocol):
+    def write_batch(self, turns: list[ChatTurn]) -> None: ...
+
+
+class DbApiChatHistorySink:
+    """Write turns to any DB-API 2 connection, e.g. `sqlite3` or `psycopg`.
+
+    Args:
+        connect: Callable returning a new connection.
+        table: Name of the chat history table, created if missing.
+        paramstyle: "?" for sqlite3, "%s" for psycopg.
+    """
+
+    def __init__(self, connect: Callable[[], Any], table: str, paramstyle: str = "?") -> None:
+        self.connect = connect
+        self.table = table
+        self.paramstyle = paramstyle
+        self._conn = None
+
+    def _connection(self):
+        if self._conn is None:
+            self._conn = self.connect()
+            cur = self._conn.cursor()
+            cur.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                "thread_id TEXT NOT NULL, user_id TEXT NOT NULL, user_message TEXT, "
+                "assistant_message TEXT, metadata TEXT, created_at DOUBLE PRECISION NOT NULL)"
+            )
+            self._conn.commit()
+        return self._conn
+
+    def write_batch(self, turns: list[ChatTurn]) -> None:
+        conn = self._connection()
+        placeholders = ", ".join([self.paramstyle] * 6)
+        try:
+            cur = conn.cursor()
+            cur.executemany(
+                f"INSERT INTO {self.table} (thread_id, user_id, user_message, assistant_message, metadata, created_at) "
+                f"VALUES ({placeholders})",
+                [
+                    (t.thread_id, t.user_id, t.user_message, t.assistant_message, json.dumps(t.metadata), t.created_at)
+                    for t in turns
+                ],
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            self._conn = None
+            raise
+
+
+@dataclass
+class ArchiveMetrics:
+    enqueued: int = 0
+    dropped: int = 0
+    flushed: int = 0
+    failed_flushes: int = 0
+    spool_depth: int = 0
+    """Turns spooled but not written to the sink yet, updated on every append and flush."""
+    flush_lag_seconds: float = 0.0
+    """Age of the oldest turn not yet written to the sink, as of the last flush check."""
+    last_flush_seconds: float = 0.0
+
+
+class ChatArchiver:
+    """Spool chat turns and flush them to a `ChatHistorySink` off the request path.
+
+    Args:
+        sink: Destination of the flushed batches.
+        spool_path: SQLite file holding turns that were archived but not flushed yet.
+        batch_size: Maximum number of turns per `write_batch` call.
+        flush_interval: Seconds between flushes when the batch is not full.
+        max_spool: Turns waiting in the spool before new ones are dropped.
+    """
+
+    def __init__(
+        self,
+        sink: ChatHistorySink,
+        spool_path: str = "state_db/chat_archive_spool.db",
+        batch_size: int = 100,
+        flush_interval: float = 5.0,
+        max_spool: int = 10_000,
+    ) -> None:
+        self.sink = sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_spool = max_spool
+        self.metrics = ArchiveMetrics()
+        os.makedirs(os.path.dirname(spool_path), exist_ok=True)
+        self._spool = sqlite3.connect(spool_path, check_same_thread=False)
+        self._spool.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            PRAGMA synchronous=NORMAL;
+            CREATE TABLE IF NOT EXISTS spool (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at REAL NOT NULL,
+                turn TEXT NOT NULL
+            );
+            """
+        )
+        # Guards the spool connection only, never held while writing to the sink
+        self._lock = threading.Lock()
+        # Serialises flushes, so a batch is never written twice
+        self._flush_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self._lock:
+            self._update_depths()
+
+    def archive_turn(self, thread_id: str, user_message: str, assistant_message: str, **kwargs: Any) -> bool:
+        """Spool a completed turn. Returns False if the turn was dropped."""
+        return self.archive(ChatTurn(thread_id, user_message, assistant_message, **kwargs))
+
+    def archive(self, turn: ChatTurn) -> bool:
+        with self._lock:
+            if self.metrics.spool_depth >= self.max_spool:
+                self.metrics.dropped += 1
+                logger.warning("Chat archive spool is full, dropping turn")
+                return False
+            self._spool.execute(
+                "INSERT INTO spool (created_at, turn) VALUES (?, ?)", (turn.created_at, json.dumps(asdict(turn)))
+            )
+            self._spool.commit()
+            self.metrics.spool_depth += 1
+            self.metrics.enqueued += 1
+        return True
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="chat-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread after a last flush."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def flush(self) -> int:
+        """Write spooled turns to the sink in batches and return how many were written."""
+        with self._flush_lock:
+            written = 0
+            while True:
+                with self._lock:
+                    rows = self._spool.execute(
+                        "SELECT id, turn FROM spool ORDER BY id LIMIT ?", (self.batch_size,)
+                    ).fetchall()
+                if not rows:
+                    break
+                start = time.perf_counter()
+                try:
+                    self.sink.write_batch([ChatTurn(**json.loads(turn)) for _, turn in rows])
+                except Exception as e:
+                    # Keep the batch in the spool and retry on the next flush
+                    self.metrics.failed_flushes += 1
+                    logger.error(f"Chat archive flush failed: {e}")
+                    break
+                self.metrics.last_flush_seconds = time.perf_counter() - start
+                with self._lock:
+                    self._spool.execute("DELETE FROM spool WHERE id <= ?", (rows[-1][0],))
+                    self._spool.commit()
+                    self.metrics.spool_depth -= len(rows)
+                written += len(rows)
+                self.metrics.flushed += len(rows)
+            with self._lock:
+                self._update_depths()
+            return written
+
+    def _update_depths(self) -> None:
+        count, oldest = self._spool.execute("SELECT COUNT(*), MIN(created_at) FROM spool").fetchone()
+        self.metrics.spool_depth = count
+        self.metrics.flush_lag_seconds = time.time() - oldest if oldest else 0.0
+
+    def _loop(self) -> None:
+        last_flush = time.monotonic()
+        while not self._stop.is_set():
+            self._stop.wait(min(1.0, self.flush_interval))
+            try:
+                if self.metrics.spool_depth >= self.batch_size or time.monotonic() - last_flush >= self.flush_interval:
+                    self.flush()
+                    last_flush = time.monotonic()
+                else:
+                    with self._lock:
+                        self._update_depths()
+            except Exception as e:
+                logger.error(f"Chat archiver error: {e}")
+        self.flush()
+
+
+@lru_cache
+def get_chat_archiver() -> ChatArchiver:
+    s = get_settings()
+    # Local SQLite stand-in for the `chat_history_database` Postgres database;
+    # swap the connect callable for psycopg with paramstyle="%s" in production.
+    sink = DbApiChatHistorySink(
+        lambda: sqlite3.connect(f"state_db/{s.chat_history_database}.db", check_same_thread=False),
+        table=s.chat_history_table,
+    )
+    archiver = ChatArchiver(sink)
+    archiver.start()
+    return archiver
@@ -0,0 +1,250 @@
+"""Content-addressed storage for large payloads kept out of graph state.
+
+Checkpoints serialise the whole state on every step, so a wine result page
+held in state or in a `ToolMessage` is copied into every later checkpoint of
+the thread. Payloads above a size threshold are written once to a `BlobStore`
+keyed by their sha256 and the state only keeps a small reference.
+
+Blobs are deleted by `BlobStore.sweep` once no checkpoint references them;
+`retention.CheckpointRetention` finds the references with `blob_references`.
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Iterator, Optional
+
+from langchain_core.messages import BaseMessage, ToolMessage
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+from pydantic import BaseModel
+from typing_extensions import TypedDict
+
+from memory_agent.metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+BlobRef = TypedDict("BlobRef", {"$blob": str, "size": int})
+"""Reference to a JSON payload stored in a `BlobStore`."""
+
+BLOB_URI_PREFIX = "blob://sha256/"
+"""Prefix of message contents that were moved to a `BlobStore`."""
+
+DEFAULT_MIN_BYTES = 2048
+# Content of a message whose blob was deleted, instead of the bare reference
+MISSING_BLOB_CONTENT = "[This tool result is no longer available. Run the tool again if it is needed.]"
+# Re-touching a blob on every checkpoint would turn reads into writes
+_TOUCH_INTERVAL_SECONDS = 3600
+
+
+class BlobStore:
+    """SQLite-backed, deduplicated store of JSON payloads with an LRU read cache."""
+
+    def __init__(self, db_path: str = "state_db/blobs.db", cache_size: int = 256) -> None:
+        os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.executescript(
+            """
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS blobs (
+                digest TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                data BLOB NOT NULL,
+                last_used REAL NOT NULL
+            );
+            """
+        )
+        self.lock = threading.Lock()
+        self.cache_size = cache_size
+        self._cache: OrderedDict[str, bytes] = OrderedDict()
+        self._touched: dict[str, float] = {}
+        # Last `put_bytes` of each digest since the last sweep, which may not be checkpointed yet
+        self._seen: dict[str, float] = {}
+
+    def put_bytes(self, data: bytes) -> str:
+        """Store raw bytes and return their digest."""
+        digest = hashlib.sha256(data).hexdigest()
+        now = time.time()
+        with self.lock:
+            self._seen[digest] = now
+            if now - self._touched.get(digest, 0) > _TOUCH_INTERVAL_SECONDS:
+                self.conn.execute(
+                    "INSERT INTO blobs (digest, size, data, last_used) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT(digest) DO UPDATE SET last_used = excluded.last_used",
+                    (digest, len(data), data, now),
+                )
+                self.conn.commit()
+                self._touched[digest] = now
+            self._remember(digest, data)
+        return digest
+
+    def get_bytes(self, digest: str) -> bytes:
+        """Return the bytes stored under `digest`."""
+        with self.lock:
+            data = self._cache.get(digest)
+            cache_lookup("blobs", data is not None)
+            if data is not None:
+                self._cache.move_to_end(digest)
+                return data
+            row = self.conn.execute("SELECT data FROM blobs WHERE digest = ?", (digest,)).fetchone()
+            if row is None:
+                raise MissingBlobError(digest)
+            self._remember(digest, row[0])
+            return row[0]
+
+    def put(self, value: Any) -> BlobRef:
+        """Store a JSON-serialisable value and return a reference to it."""
+        data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        return {"$blob": self.put_bytes(data), "size": len(data)}
+
+    def get(self, ref: BlobRef) -> Any:
+        """Load the value behind a reference returned by `put`."""
+        return json.loads(self.get_bytes(ref["$blob"]))
+
+    def sweep(self, referenced: set[str], marked_at: float) -> int:
+        """Delete the blobs that are not in `referenced`.
+
+        Args:
+            referenced: Digests referenced by the checkpoints, read after `marked_at`.
+            marked_at: Unix time the references started being collected. Blobs stored
+                or re-stored since then may belong to checkpoints written after they
+                were read, so they are kept.
+        """
+        with self.lock:
+            keep = referenced | {digest for digest, seen in self._seen.items() if seen >= marked_at}
+            rows = self.conn.execute("SELECT digest FROM blobs WHERE last_used < ?", (marked_at,)).fetchall()
+            unreferenced = [(digest,) for (digest,) in rows if digest not in keep]
+            self.conn.executemany("DELETE FROM blobs WHERE digest = ?", unreferenced)
+            self.conn.commit()
+            for (digest,) in unreferenced:
+                self._cache.pop(digest, None)
+                self._touched.pop(digest, None)
+            self._seen = {digest: seen for digest, seen in self._seen.items() if seen >= marked_at}
+            return len(unreferenced)
+
+    def _remember(self, digest: str, data: bytes) -> None:
+        self._cache[digest] = data
+        self._cache.move_to_end(digest)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+
+@lru_cache
+def get_blob_store() -> BlobStore:
+    return BlobStore()
+
+
+class MissingBlobError(KeyError):
+    """A referenced blob was deleted, e.g. after its thread expired."""
+
+    def __init__(self, digest: str) -> None:
+        super().__init__(f"Blob {digest} is no longer stored; the data it held has to be fetched again")
+        self.digest = digest
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, dict) and "$blob" in value and len(value) == 2
+
+
+def blob_references(obj: Any) -> Iterator[str]:
+    """Yield the digest of every `BlobRef` and blob URI in a deserialized checkpoint or write."""
+    if isinstance(obj, str):
+        if obj.startswith(BLOB_URI_PREFIX):
+            yield obj.removeprefix(BLOB_URI_PREFIX)
+    elif isinstance(obj, dict):
+        if is_blob_ref(obj):
+            yield obj["$blob"]
+        else:
+            for value in obj.values():
+                yield from blob_references(value)
+    elif isinstance(obj, (list, tuple, set)):
+        for value in obj:
+            yield from blob_references(value)
+    elif isinstance(obj, BaseModel):
+        # Messages, including the tool call arguments of an `AIMessage`
+        for value in obj.__dict__.values():
+            yield from blob_references(value)
+
+
+def offload(value: Any, store: Optional[BlobStore] = None, min_bytes: int = DEFAULT_MIN_BYTES) -> Any:
+    """Replace a large JSON value by a `BlobRef`; small values are returned as is."""
+    if value is None or is_blob_ref(value):
+        return value
+    store = store or get_blob_store()
+    data = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    if len(data) < min_bytes:
+        return value
+    return {"$blob": store.put_bytes(data), "size": len(data)}
+
+
+def hydrate(value: Any, store: Optional[BlobStore] = None) -> Any:
+    """Resolve a `BlobRef` back to its value; anything else is returned as is."""
+    if not is_blob_ref(value):
+        return value
+    return (store or get_blob_store()).get(value)
+
+
+class BlobOffloadingSerializer(SerializerProtocol):
+    """Checkpoint serde that moves large `ToolMessage` contents to a `BlobStore`.
+
+    The message keeps a `blob://sha256/<digest>` content in the checkpoint and is
+    hydrated again when the checkpoint is loaded. Identical tool results across
+    turns and threads share one blob.
+    """
+
+    def __init__(
+        self,
+        store: Optional[BlobStore] = None,
+        serde: Optional[SerializerProtocol] = None,
+        min_bytes: int = DEFAULT_MIN_BYTES,
+    ) -> None:
+        self.store = store or get_blob_store()
+        self.serde = serde or JsonPlusSerializer()
+        self.min_bytes = min_bytes
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        return self.serde.dumps_typed(self._map(obj, self._offload_message))
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        return self._map(self.serde.loads_typed(data), self._hydrate_message)
+
+    def references(self, data: tuple[str, bytes]) -> set[str]:
+        """Digests of the blobs a serialized value refers to, without loading them."""
+        return set(blob_references(self.serde.loads_typed(data)))
+
+    def _map(self, obj: Any, fn) -> Any:
+        # Checkpoints carry messages in `channel_values`, pending writes carry them directly
+        if isinstance(obj, BaseMessage):
+            return fn(obj)
+        if isinstance(obj, list) and any(isinstance(m, BaseMessage) for m in obj):
+            return [fn(m) if isinstance(m, BaseMessage) else m for m in obj]
+        if isinstance(obj, dict) and isinstance(obj.get("channel_values"), dict):
+            return {
+                **obj,
+                "channel_values": {k: self._map(v, fn) for k, v in obj["channel_values"].items()},
+            }
+        return obj
+
+    def _offload_message(self, message: BaseMessage) -> BaseMessage:
+        content = message.content
+        if not isinstance(message, ToolMessage) or not isinstance(content, str) or len(content) < self.min_bytes:
+            return message
+        digest = self.store.put_bytes(content.encode("utf-8"))
+        return message.model_copy(update={"content": f"{BLOB_URI_PREFIX}{digest}"})
+
+    def _hydrate_message(self, message: BaseMessage) -> BaseMessage:
+        content = message.content
+        if not isinstance(content, str) or not content.startswith(BLOB_URI_PREFIX):
+            return message
+        try:
+            data = self.store.get_bytes(content.removeprefix(BLOB_URI_PREFIX))
+        except MissingBlobError:
+            logger.warning(f"Missing blob for message {message.id}")
+            return message.model_copy(update={"content": MISSING_BLOB_CONTENT})
+        return message.model_copy(update={"content": data.decode("utf-8")})
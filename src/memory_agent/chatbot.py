@@ -1,10 +1,17 @@
 from langgraph.prebuilt import create_react_agent
 from langchain.chat_models import init_chat_model
-from memory_agent.tools import wine_search, sort_wines
+from memory_agent.tools import wine_search, sort_wines, similar_wines
 from memory_agent.prompts import SYSTEM_PROMPT
 from langgraph.managed import IsLastStep, RemainingSteps
 from typing import List, TypedDict
 from langchain_core.messages import BaseMessage
+from memory_agent.blobs import BlobRef
+from memory_agent.persistence import memory
+from memory_agent.ledger import ledger_callbacks
+from memory_agent.metrics import metrics_callbacks
+from memory_agent.profiling import profiling_callbacks
+from memory_agent.similarity import similarity_index_path
+from memory_agent.tracing import tracing_callbacks
 import logging
 import os
 from dotenv import load_dotenv
@@ -12,7 +19,7 @@ load_dotenv()
 
 class AgentStateWithWines(TypedDict):
     messages: List[BaseMessage]
-    wines: list[dict] | None
+    wines: list[dict] | BlobRef | None
     is_last_step: IsLastStep
     remaining_steps: RemainingSteps
 
@@ -23,6 +30,11 @@ if not api_key:
 
 logging.info("Initializing chat model...")
 tools = [wine_search, sort_wines]
+# Built offline with `python -m memory_agent.similarity build`
+if similarity_index_path().exists():
+    tools.append(similar_wines)
+else:
+    logging.info("No similarity index built, similar_wines is not offered")
 
 try:
     model = init_chat_model(
@@ -36,15 +48,18 @@ except Exception as e:
     logging.error(f"Failed to initialize chat model: {str(e)}")
     raise
 
-agent = create_react_agent(model, tools, prompt=SYSTEM_PROMPT)
+# Conversation history lives in the checkpointer, callers only send the new message
+agent = create_react_agent(model, tools, prompt=SYSTEM_PROMPT, checkpointer=memory).with_config(
+    callbacks=[*tracing_callbacks(), *ledger_callbacks(), *metrics_callbacks(), *profiling_callbacks()]
+)
 
 if __name__ == "__main__":
-    messages = []
+    import uuid
+
+    config = {"configurable": {"thread_id": str(uuid.uuid4())}}
     while True:
         user_input = input("User: ")
-        messages.append({"role": "user", "content": user_input})
-        response = agent.invoke({"messages": messages})
-        messages.append(response["messages"][-1])
+        response = agent.invoke({"messages": [{"role": "user", "content": user_input}]}, config)
         print("*" * 50)
         print("Assistant:", response["messages"][-1].content)
         print("*" * 50)
\ No newline at end of file
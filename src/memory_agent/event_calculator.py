@@ -0,0 +1,230 @@
+"""Bottle quantities and costs for events.
+
+Consumption follows the usual catering rule of two glasses per guest in the
+first hour and one per hour after that. The wine volume is split across
+categories (a wine colour or type, e.g. "Red" or "Sparkling") by a drink mix
+and then across the selected wines of each category, rounding up to whole
+bottles.
+"""
+
+import math
+import re
+from dataclasses import dataclass, field
+from typing import Optional
+
+DEFAULT_BOTTLE_ML = 750
+DEFAULT_MIX = {"Red": 0.5, "White": 0.5}
+CATEGORIES = ("Red", "White", "Rose", "Sparkling", "Fortified", "Dessert")
+
+
+@dataclass(kw_only=True)
+class ConsumptionModel:
+    """How much wine guests drink."""
+
+    first_hour_glasses: float = 2.0
+    """Glasses per guest during the first hour."""
+    later_hour_glasses: float = 1.0
+    """Glasses per guest for every following hour."""
+    glass_ml: float = 150.0
+    """Volume of one glass."""
+
+    def glasses_per_guest(self, duration_hours: float) -> float:
+        return self.first_hour_glasses * min(duration_hours, 1.0) + self.later_hour_glasses * max(
+            duration_hours - 1.0, 0.0
+        )
+
+
+@dataclass
+class CategoryEstimate:
+    category: str
+    share: float
+    ml: float
+    bottles: int
+    """Bottles of `DEFAULT_BOTTLE_ML` or the requested bottle size."""
+
+
+@dataclass
+class WineAllocation:
+    title: str
+    category: str
+    bottles: int
+    bottle_ml: float
+    price: Optional[float] = None
+    subtotal: Optional[float] = None
+
+
+@dataclass
+class EventEstimate:
+    guests: int
+    duration_hours: float
+    glasses: float
+    total_ml: float
+    categories: list[CategoryEstimate] = field(default_factory=list)
+    allocations: list[WineAllocation] = field(default_factory=list)
+    """Bottles of each selected wine; empty when no wines were given."""
+    unallocated: list[str] = field(default_factory=list)
+    """Categories of the mix without any selected wine."""
+    total_bottles: int = 0
+    total_cost: Optional[float] = None
+    """Cost of the allocated bottles with a price, None when no price is known."""
+    cost_per_guest: Optional[float] = None
+    unpriced: list[str] = field(default_factory=list)
+    """Titles of allocated wines without a price."""
+
+
+def _bottles(ml: float, bottle_ml: float) -> int:
+    # Tolerance so that float noise does not add a bottle
+    return max(0, math.ceil(ml / bottle_ml - 1e-9))
+
+
+def _bottle_ml(wine: dict, default: float) -> float:
+    volume = wine.get("bottle_volume")
+    if isinstance(volume, str):
+        volume = int(match.group()) if (match := re.search(r"\d+", volume)) else None
+    return float(volume) if volume else default
+
+
+def _wine_price(wine: dict) -> Optional[float]:
+    if wine.get("price") is not None:
+        return wine["price"]
+    prices = wine.get("shopping_prices") or []
+    return prices[0]["price_amount"] if prices else None
+
+
+def wine_category(wine: dict, categories: Optional[list[str]] = None) -> Optional[str]:
+    """Return the category of the mix `wine` belongs to, its type before its colour."""
+    candidates = [wine.get("wine_type") or wine.get("type"), wine.get("wine_color") or wine.get("color")]
+    for value in candidates:
+        if not value:
+            continue
+        for category in categories or CATEGORIES:
+            if str(value).lower() == category.lower():
+                return category
+    return None
+
+
+def _normalise_mix(mix: Optional[dict[str, float]], wines: list[dict]) -> dict[str, float]:
+    if not mix:
+        # One equal share per category of the selected wines
+        found = list(dict.fromkeys(c for c in (wine_category(w) for w in wines) if c))
+        mix = {c: 1.0 for c in found} or DEFAULT_MIX
+    mix = {category: max(float(weight), 0.0) for category, weight in mix.items()}
+    total = sum(mix.values())
+    if total <= 0:
+        raise ValueError(f"Invalid drink mix {mix}")
+    return {category: weight / total for category, weight in mix.items() if weight > 0}
+
+
+def estimate_event(
+    guests: int,
+    duration_hours: float = 3.0,
+    mix: Optional[dict[str, float]] = None,
+    wines: Optional[list[dict]] = None,
+    bottle_ml: float = DEFAULT_BOTTLE_ML,
+    model: Optional[ConsumptionModel] = None,
+) -> EventEstimate:
+    """Estimate the bottles and cost of wine for an event.
+
+    Args:
+        guests: Number of guests drinking wine.
+        duration_hours: Length of the event.
+        mix: Relative share of each category, e.g. `{"Red": 2, "White": 1}`. Defaults
+            to an equal share per category of `wines`, or half red and half white.
+        wines: Selected wines. Each category's volume is split evenly across its wines.
+        bottle_ml: Bottle size of the category estimates and of wines without a `bottle_volume`.
+        model: Consumption assumptions.
+    """
+    if guests < 0 or duration_hours < 0:
+        raise ValueError("guests and duration_hours must not be negative")
+    model = model or ConsumptionModel()
+    wines = wines or []
+    shares = _normalise_mix(mix, wines)
+    glasses = guests * model.glasses_per_guest(duration_hours)
+    total_ml = glasses * model.glass_ml
+    estimate = EventEstimate(guests=guests, duration_hours=duration_hours, glasses=glasses, total_ml=total_ml)
+    for category, share in shares.items():
+        ml = total_ml * share
+        estimate.categories.append(CategoryEstimate(category, share, ml, _bottles(ml, bottle_ml)))
+
+    by_category: dict[str, list[dict]] = {}
+    for wine in wines:
+        if (category := wine_category(wine, list(shares))) is not None:
+            by_category.setdefault(category, []).append(wine)
+    for category_estimate in estimate.categories:
+        selected = by_category.get(category_estimate.category)
+        if not selected:
+            if wines:
+                estimate.unallocated.append(category_estimate.category)
+            continue
+        for wine in selected:
+            volume = _bottle_ml(wine, bottle_ml)
+            bottles = _bottles(category_estimate.ml / len(selected), volume)
+            price = _wine_price(wine)
+            estimate.allocations.append(
+                WineAllocation(
+                    title=wine.get("title", ""),
+                    category=category_estimate.category,
+                    bottles=bottles,
+                    bottle_ml=volume,
+                    price=price,
+                    subtotal=round(price * bottles, 2) if price is not None else None,
+                )
+            )
+
+    if estimate.allocations:
+        estimate.total_bottles = sum(a.bottles for a in estimate.allocations)
+        # Categories without a selected wine still need bottles
+        estimate.total_bottles += sum(c.bottles for c in estimate.categories if c.category in estimate.unallocated)
+    else:
+        estimate.total_bottles = sum(c.bottles for c in estimate.categories)
+    priced = [a for a in estimate.allocations if a.subtotal is not None]
+    estimate.unpriced = [a.title for a in estimate.allocations if a.subtotal is None]
+    if priced:
+        estimate.total_cost = round(sum(a.subtotal for a in priced), 2)
+        estimate.cost_per_guest = round(estimate.total_cost / guests, 2) if guests else None
+    return estimate
+
+
+_GUESTS = re.compile(r"(\d+)\s*(?:guests?|people|persons?|attendees|adults)", re.IGNORECASE)
+_HOURS = re.compile(r"(\d+(?:\.\d+)?)\s*(?:-\s*)?(?:hours?|hrs?|h)\b", re.IGNORECASE)
+_SHARE = re.compile(r"(\d+(?:\.\d+)?)\s*%\s*(?:of\s+)?(red|white|ros[eé]|sparkling|fortified|dessert)", re.IGNORECASE)
+_QUANTITY_WORDS = re.compile(r"\b(?:bottles?|quantit(?:y|ies)|how many|how much wine|amount of wine)\b", re.IGNORECASE)
+
+
+def parse_event_request(text: str) -> Optional[dict]:
+    """Extract `estimate_event` arguments from a plan step, or None if it is not a quantity step."""
+    if not _QUANTITY_WORDS.search(text) or not (guests := _GUESTS.search(text)):
+        return None
+    request: dict = {"guests": int(guests.group(1))}
+    if hours := _HOURS.search(text):
+        request["duration_hours"] = float(hours.group(1))
+    if shares := _SHARE.findall(text):
+        request["mix"] = {wine_category({"wine_color": name.replace("é", "e")}): float(share) for share, name in shares}
+    else:
+        mentioned = [c for c in CATEGORIES if re.search(rf"\b{c}\b", text.replace("é", "e"), re.IGNORECASE)]
+        if mentioned:
+            request["mix"] = {c: 1.0 for c in mentioned}
+    return request
+
+
+def format_event_estimate(estimate: EventEstimate) -> str:
+    """Summarise an estimate in Markdown."""
+    lines = [
+        f"Estimated wine for {estimate.guests} guests over {estimate.duration_hours:g} hours: "
+        f"{estimate.glasses:g} glasses ({estimate.total_ml / 1000:.1f} L), {estimate.total_bottles} bottles.",
+        "",
+        "| Category | Share | Bottles |",
+        "|----------|-------|---------|",
+    ]
+    lines += [f"| {c.category} | {c.share:.0%} | {c.bottles} |" for c in estimate.categories]
+    if estimate.allocations:
+        lines += ["", "| Wine | Category | Bottles | Price per Bottle | Total Price |", "|---|---|---|---|---|"]
+        for a in estimate.allocations:
+            price = f"${a.price:.2f}" if a.price is not None else "-"
+            subtotal = f"${a.subtotal:.2f}" if a.subtotal is not None else "-"
+            lines.append(f"| {a.title} | {a.category} | {a.bottles} | {price} | {subtotal} |")
+    if estimate.total_cost is not None:
+        lines += ["", f"Total cost: ${estimate.total_cost:.2f} (${estimate.cost_per_guest or 0:.2f} per guest)"]
+    if estimate.unallocated:
+        lines.append(f"No wine selected yet for: {', '.join(estimate.unallocated)}")
+    return "\n".join(lines)
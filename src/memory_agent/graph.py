@@ -15,6 +15,11 @@ from datetime import datetime
 import logging
 import json
 from memory_agent.utils import format_data_to_string
+from memory_agent.blobs import BlobRef, offload
+from memory_agent.ledger import ledger_callbacks
+from memory_agent.metrics import metrics_callbacks
+from memory_agent.profiling import profiling_callbacks
+from memory_agent.tracing import tracing_callbacks
 
 
 logger = logging.getLogger(__name__)
@@ -22,7 +27,8 @@ tools = [wine_search, sort_wines]
 model = init_chat_model(model="gemini-2.0-flash-lite", model_provider="google_genai").bind_tools(tools)
 
 class ConversationState(MessagesState):
-    wines: list[dict] | None = None
+    # Large result pages are kept as a blob reference, see `memory_agent.blobs`
+    wines: list[dict] | BlobRef | None = None
 
 # Define the logic to call the model
 def assistant_bot(state: ConversationState):
@@ -45,7 +51,7 @@ def assistant_bot(state: ConversationState):
         vintages_dict = json.loads(messages[-1].content)
         vintages =  [format_data_to_string(res["data"]) for res in vintages_dict]
         messages[-1].content = "\n\n".join(vintages)
-        state["wines"] = [res["data"] for res in vintages_dict]
+        state["wines"] = offload([res["data"] for res in vintages_dict])
     
     if isinstance(messages[-1], ToolMessage) and messages[-1].name == "sort_wines":
         wines = json.loads(messages[-1].content)
@@ -57,6 +63,7 @@ def assistant_bot(state: ConversationState):
     response = model.invoke(messages)
 
     if len(response.tool_calls) == 1 and response.tool_calls[0]["name"] == "sort_wines":
+        # Pass the reference, `sort_wines` hydrates it so the tool call stays small
         response.tool_calls[0]["args"]["wines"] = state.get("wines")
     
     return {"messages": [response], "wines": state.get("wines")}
@@ -91,7 +98,9 @@ graph_builder.add_edge("wine_analysis", "assistant_bot")
 graph_builder.add_edge("tools", "wine_analysis")
 graph_builder.add_conditional_edges("wine_analysis", tools_condition)
 graph_builder.set_entry_point("assistant_bot")
-graph = graph_builder.compile(memory)
+graph = graph_builder.compile(memory).with_config(
+    callbacks=[*tracing_callbacks(), *ledger_callbacks(), *metrics_callbacks(), *profiling_callbacks()]
+)
 save_graph_image(graph)
 
 # Create a thread
@@ -11,6 +11,7 @@ from langgraph.store.base import BaseStore
 from memory_agent import configuration, tools, utils
 from memory_agent.state import State
 from langgraph.graph import MessagesState
+from memory_agent.ledger import ledger_callbacks
 from memory_agent.persistence import memory
 from memory_agent.utils import save_graph_image
 from langchain_core.messages import SystemMessage, HumanMessage, RemoveMessage
@@ -110,7 +111,7 @@ def create_graph(checkpointer=None):
     workflow.add_edge("summarize_conversation", END)
 
     # Compile
-    graph = workflow.compile(checkpointer=checkpointer)
+    graph = workflow.compile(checkpointer=checkpointer).with_config(callbacks=ledger_callbacks())
     graph.name = "MemoryAgent"
     save_graph_image(graph)
     
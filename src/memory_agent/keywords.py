@@ -0,0 +1,246 @@
+"""Match occasions, foods, grapes and regions in free text in one pass.
+
+The keywords of `wine_keywords.json` are compiled into a single Aho-Corasick
+automaton. `KeywordMatcher.match` scans a text once and returns every keyword
+found at word boundaries, longest first where keywords overlap, together with
+the search filter fragments of their entries. Results are memoised, so the
+matcher is cheap enough to fill slots before calling an LLM.
+"""
+
+import json
+import re
+import unicodedata
+from collections import deque
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional
+
+KEYWORDS_FILE = Path(__file__).with_name("wine_keywords.json")
+KINDS = ("occasions", "foods", "grapes", "regions")
+# Filters listing the names of the matched entries of a kind
+KIND_FILTERS = {"grapes": "grapes", "regions": "regions"}
+
+
+def normalise(text: str) -> str:
+    """Lowercase, strip accents and turn punctuation into single spaces."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[\W_]+", " ", text).split())
+
+
+class KeywordAutomaton:
+    """Aho-Corasick automaton over characters.
+
+    Args:
+        keywords: `(keyword, payload)` pairs. Keywords should be normalised.
+    """
+
+    def __init__(self, keywords: Iterable[tuple[str, Any]]) -> None:
+        self._goto: list[dict[str, int]] = [{}]
+        self._fail: list[int] = [0]
+        self._output: list[list[tuple[int, Any]]] = [[]]
+        for keyword, payload in keywords:
+            state = 0
+            for char in keyword:
+                if char not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                    self._goto[state][char] = len(self._goto) - 1
+                state = self._goto[state][char]
+            self._output[state].append((len(keyword), payload))
+
+        # Breadth first, so the fail state of a node is complete before its children
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, child in self._goto[state].items():
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._output[child] = self._output[child] + self._output[self._fail[child]]
+                queue.append(child)
+
+    def __len__(self) -> int:
+        return len(self._goto)
+
+    def iter_matches(self, text: str) -> Iterator[tuple[int, int, Any]]:
+        """Yield `(start, end, payload)` of every occurrence of a keyword in `text`."""
+        state = 0
+        for i, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for length, payload in self._output[state]:
+                yield i + 1 - length, i + 1, payload
+
+
+@dataclass(frozen=True)
+class KeywordEntry:
+    kind: str
+    name: str
+    priority: int
+    """Position in the data file. Earlier entries win when fragments disagree."""
+    filters: tuple[tuple[str, Any], ...] = ()
+    query: Optional[str] = None
+    """Search query term of an occasion."""
+
+
+@dataclass(frozen=True)
+class KeywordMatch:
+    entry: KeywordEntry
+    keyword: str
+    start: int
+    """Offset in the normalised text."""
+
+
+@dataclass(frozen=True)
+class Slots:
+    """Entries found in a text, in text order."""
+
+    matches: tuple[KeywordMatch, ...] = ()
+
+    def names(self, kind: str) -> list[str]:
+        """Names of the matched entries of `kind`, each once."""
+        return list(dict.fromkeys(m.entry.name for m in self.matches if m.entry.kind == kind))
+
+    def first(self, kind: str) -> Optional[KeywordEntry]:
+        """Return the matched entry of `kind` listed first in the data file."""
+        entries = [m.entry for m in self.matches if m.entry.kind == kind]
+        return min(entries, key=lambda e: e.priority) if entries else None
+
+    def filters(self, kinds: Iterable[str] = KINDS) -> dict[str, Any]:
+        """Merge the filter fragments of the matched entries of `kinds`.
+
+        A fragment key is taken from the matched entry listed first in the data
+        file, e.g. "steak and fish" gives red wines since meat comes before
+        seafood. Grapes and regions list every matched name.
+        """
+        kinds = set(kinds)
+        entries = sorted({m.entry for m in self.matches if m.entry.kind in kinds}, key=lambda e: e.priority)
+        filters: dict[str, Any] = {}
+        for entry in entries:
+            for key, value in entry.filters:
+                filters.setdefault(key, list(value) if isinstance(value, tuple) else value)
+        for kind, key in KIND_FILTERS.items():
+            if kind in kinds and (names := self.names(kind)):
+                filters[key] = names
+        return filters
+
+
+class KeywordMatcher:
+    """Memoised keyword lookup built from a keyword data file.
+
+    Args:
+        data: Entries of each kind, as in `wine_keywords.json`.
+        cache_size: Texts whose matches are memoised.
+    """
+
+    def __init__(self, data: dict[str, list[dict]], cache_size: int = 4096) -> None:
+        keywords: list[tuple[str, tuple[KeywordEntry, str]]] = []
+        priority = 0
+        for kind in KINDS:
+            for item in data.get(kind, []):
+                filters = tuple(
+                    (key, tuple(value) if isinstance(value, list) else value)
+                    for key, value in item.get("filters", {}).items()
+                )
+                entry = KeywordEntry(kind, item["name"], priority, filters, item.get("query"))
+                priority += 1
+                for keyword in item["keywords"]:
+                    if keyword := normalise(keyword):
+                        keywords.append((keyword, (entry, keyword)))
+        self.automaton = KeywordAutomaton(keywords)
+        self.match = lru_cache(maxsize=cache_size)(self._match)
+
+    @classmethod
+    def load(cls, path: Path = KEYWORDS_FILE) -> "KeywordMatcher":
+        with open(path, encoding="utf8") as f:
+            return cls(json.load(f))
+
+    @staticmethod
+    def _at_word_boundary(text: str, start: int, end: int) -> bool:
+        if start > 0 and text[start - 1] != " ":
+            return False
+        # Plurals of a keyword match too, e.g. "oysters"
+        for suffix in ("", "s", "es"):
+            if text.startswith(suffix, end) and (end + len(suffix) == len(text) or text[end + len(suffix)] == " "):
+                return True
+        return False
+
+    def _match(self, text: str) -> Slots:
+        text = normalise(text)
+        found = [
+            (start, end, payload)
+            for start, end, payload in self.automaton.iter_matches(text)
+            if self._at_word_boundary(text, start, end)
+        ]
+        # Leftmost longest, without overlaps: "blue cheese" rather than "cheese"
+        found.sort(key=lambda m: (m[0], m[0] - m[1]))
+        matches, covered = [], 0
+        for start, end, (entry, keyword) in found:
+            if start >= covered:
+                matches.append(KeywordMatch(entry, keyword, start))
+                covered = end
+        return Slots(tuple(matches))
+
+
+@lru_cache
+def get_keyword_matcher() -> KeywordMatcher:
+    return KeywordMatcher.load()
+
+
+def _filter_text(filters: dict) -> str:
+    return "; ".join(f"{key} {', '.join(map(str, value)) if isinstance(value, list) else value}" for key, value in filters.items())
+
+
+def keyword_reference(path: Path = KEYWORDS_FILE) -> str:
+    """Foods, grapes and regions of the keyword data file, as text for a tool description."""
+    with open(path, encoding="utf8") as f:
+        data = json.load(f)
+    lines = ["food_pairings:"]
+    for food in data.get("foods", []):
+        filters = f": {_filter_text(food['filters'])}" if food.get("filters") else ""
+        lines.append(f"- {food['name']} ({', '.join(food['keywords'])}){filters}")
+    lines.append("grapes:")
+    by_color: dict[str, list[str]] = {}
+    for grape in data.get("grapes", []):
+        colors = grape.get("filters", {}).get("wine_colors") or ["Any colour"]
+        for color in colors:
+            by_color.setdefault(color, []).append(grape["name"])
+    lines += [f"- {color}: {', '.join(names)}" for color, names in by_color.items()]
+    regions = [
+        f"{region['name']} ({_filter_text(region['filters'])})" if region.get("filters") else region["name"]
+        for region in data.get("regions", [])
+    ]
+    lines.append(f"regions: {', '.join(regions)}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import time
+
+    texts = [
+        "Wedding reception for 80 guests with grilled salmon and lamb chops",
+        "a birthday dinner, we love Napa Cabernet and Burgundy pinot noir",
+        "cheese board with brie, blue cheese and some crème brûlée for dessert",
+        "Something to go with spicy Thai food at a casual get-together",
+    ]
+    start = time.perf_counter()
+    matcher = KeywordMatcher.load()
+    print(f"Compiled {len(matcher.automaton)} states in {(time.perf_counter() - start) * 1000:.1f}ms")
+    for text in texts:
+        slots = matcher.match(text)
+        print(f"{text!r}\n  -> {[(m.entry.kind, m.entry.name) for m in slots.matches]} {slots.filters()}")
+    rounds = 10_000
+    start = time.perf_counter()
+    for i in range(rounds):
+        matcher._match(texts[i % len(texts)])
+    uncached = (time.perf_counter() - start) / rounds * 1e6
+    start = time.perf_counter()
+    for i in range(rounds):
+        matcher.match(texts[i % len(texts)])
+    cached = (time.perf_counter() - start) / rounds * 1e6
+    print(f"match: {uncached:.1f}us per text, {cached:.2f}us memoised")
@@ -0,0 +1,343 @@
+"""Ledger of LLM calls with token, latency and cost accounting.
+
+`LedgerCallbackHandler` records one `LLMCall` per model call of a graph run:
+model, graph node, thread and user, tokens, time to first token (streamed
+calls only), latency and estimated cost. The ledger rolls calls up per turn,
+thread and node, appends them to a JSONL file when `LLM_LEDGER_FILE` is set,
+and calls the budget alert hooks when a thread or turn goes over its budget.
+
+    python -m memory_agent.ledger <ledger file> [node|thread|model]
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import asdict, dataclass, field, replace
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Callable, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+# Calls kept in memory for inspection; rollups are kept for the most recent threads
+MAX_CALLS = 10_000
+MAX_THREADS = 10_000
+
+
+@dataclass(kw_only=True)
+class ModelPrice:
+    """List price in USD per million tokens."""
+
+    input: float
+    output: float
+    cached_input: Optional[float] = None
+    """Price of input tokens read from the context cache, `input` if None."""
+
+
+# Update when the provider's pricing changes; models missing here have no cost
+MODEL_PRICES: dict[str, ModelPrice] = {
+    "gemini-2.0-flash-lite": ModelPrice(input=0.075, output=0.30),
+    "gemini-2.0-flash": ModelPrice(input=0.10, output=0.40, cached_input=0.025),
+    "gemini-2.5-flash-preview-05-20": ModelPrice(input=0.15, output=0.60, cached_input=0.0375),
+}
+
+
+@dataclass
+class LLMCall:
+    model: str
+    node: Optional[str] = None
+    """Graph node that made the call."""
+    thread_id: Optional[str] = None
+    user_id: Optional[str] = None
+    """From the run metadata, e.g. `config={"metadata": {"user_id": ...}}`."""
+    turn_id: Optional[str] = None
+    """Run id of the graph run the call belongs to."""
+    started_at: float = field(default_factory=time.time)
+    first_token_seconds: Optional[float] = None
+    latency_seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cached_tokens: int = 0
+    cost: Optional[float] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class Usage:
+    calls: int = 0
+    errors: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cost: float = 0.0
+    latency_seconds: float = 0.0
+
+    @property
+    def total_tokens(self) -> int:
+        return self.input_tokens + self.output_tokens
+
+    def add(self, call: LLMCall) -> None:
+        self.calls += 1
+        self.errors += call.error is not None
+        self.input_tokens += call.input_tokens
+        self.output_tokens += call.output_tokens
+        self.cost += call.cost or 0.0
+        self.latency_seconds += call.latency_seconds
+
+
+@dataclass(kw_only=True)
+class Budget:
+    """Limits that trigger an alert once per thread or turn. None disables a limit."""
+
+    thread_tokens: Optional[int] = None
+    thread_cost: Optional[float] = None
+    turn_tokens: Optional[int] = None
+    turn_cost: Optional[float] = None
+
+
+@dataclass
+class BudgetAlert:
+    scope: str
+    """"thread" or "turn"."""
+    key: str
+    limit: str
+    """Name of the exceeded `Budget` field."""
+    usage: Usage
+    """Usage of the thread or turn when the limit was exceeded."""
+    call: LLMCall
+    """The call that went over the budget."""
+
+
+def call_cost(model: str, input_tokens: int, output_tokens: int, cached_tokens: int = 0) -> Optional[float]:
+    """Estimated cost in USD, None for a model without a known price."""
+    price = MODEL_PRICES.get(model) or MODEL_PRICES.get(model.removeprefix("models/"))
+    if price is None:
+        return None
+    cached_price = price.cached_input if price.cached_input is not None else price.input
+    return ((input_tokens - cached_tokens) * price.input + cached_tokens * cached_price + output_tokens * price.output) / 1e6
+
+
+def log_budget_alert(alert: BudgetAlert) -> None:
+    logger.warning(
+        f"LLM budget {alert.limit} exceeded for {alert.scope} {alert.key}: "
+        f"{alert.usage.total_tokens} tokens, ${alert.usage.cost:.4f} over {alert.usage.calls} calls "
+        f"(last call by node {alert.call.node} with {alert.call.model})"
+    )
+
+
+class LLMLedger:
+    """Record LLM calls and roll them up per turn, thread, node and model.
+
+    Args:
+        path: JSONL file every call is appended to, None to keep calls in memory only.
+        budget: Limits checked after every call.
+        alert_hooks: Called with a `BudgetAlert` when a limit is first exceeded.
+    """
+
+    def __init__(
+        self,
+        path: Optional[Path] = None,
+        budget: Optional[Budget] = None,
+        alert_hooks: Optional[list[Callable[[BudgetAlert], None]]] = None,
+    ) -> None:
+        self.path = Path(path) if path else None
+        if self.path:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.budget = budget or Budget()
+        self.alert_hooks = alert_hooks if alert_hooks is not None else [log_budget_alert]
+        self.calls: deque[LLMCall] = deque(maxlen=MAX_CALLS)
+        self.by_thread: OrderedDict[str, Usage] = OrderedDict()
+        self.by_turn: OrderedDict[str, Usage] = OrderedDict()
+        self.by_node: dict[str, Usage] = {}
+        self.by_model: dict[str, Usage] = {}
+        self._alerted: set[tuple[str, str, str]] = set()
+        self._lock = threading.Lock()
+
+    def _usage(self, scope: str, rollup: OrderedDict[str, Usage], key: str) -> Usage:
+        usage = rollup.get(key)
+        if usage is None:
+            usage = rollup[key] = Usage()
+            while len(rollup) > MAX_THREADS:
+                evicted, _ = rollup.popitem(last=False)
+                # Alerts are remembered as long as the usage they were raised for
+                self._alerted.difference_update((scope, evicted, f"{scope}_{name}") for name in ("tokens", "cost"))
+        rollup.move_to_end(key)
+        return usage
+
+    def record(self, call: LLMCall) -> None:
+        alerts = []
+        with self._lock:
+            self.calls.append(call)
+            self.by_node.setdefault(call.node or "-", Usage()).add(call)
+            self.by_model.setdefault(call.model, Usage()).add(call)
+            scopes = [("thread", call.thread_id, self.by_thread), ("turn", call.turn_id, self.by_turn)]
+            for scope, key, rollup in scopes:
+                if key is None:
+                    continue
+                usage = self._usage(scope, rollup, key)
+                usage.add(call)
+                alerts += [
+                    BudgetAlert(scope, key, limit, replace(usage), call)
+                    for limit in self._exceeded(scope, usage)
+                    if (scope, key, limit) not in self._alerted
+                ]
+            self._alerted.update((a.scope, a.key, a.limit) for a in alerts)
+            if self.path:
+                with open(self.path, "a", encoding="utf8") as f:
+                    f.write(json.dumps(asdict(call), ensure_ascii=False) + "\n")
+        for alert in alerts:
+            for hook in self.alert_hooks:
+                try:
+                    hook(alert)
+                except Exception as e:
+                    logger.error(f"Budget alert hook {hook} failed: {e}")
+
+    def _exceeded(self, scope: str, usage: Usage) -> list[str]:
+        limits = [(f"{scope}_tokens", usage.total_tokens), (f"{scope}_cost", usage.cost)]
+        return [name for name, value in limits if (limit := getattr(self.budget, name)) is not None and value > limit]
+
+    def report(self, group: str = "node") -> list[tuple[str, Usage]]:
+        """Usage per node, thread, turn or model, the most expensive first."""
+        rollup = {"node": self.by_node, "thread": self.by_thread, "turn": self.by_turn, "model": self.by_model}[group]
+        with self._lock:
+            return sorted(rollup.items(), key=lambda item: (item[1].cost, item[1].total_tokens), reverse=True)
+
+
+class LedgerCallbackHandler(BaseCallbackHandler):
+    """Time and count the tokens of every model call of a run into a `LLMLedger`."""
+
+    def __init__(self, ledger: LLMLedger) -> None:
+        self.ledger = ledger
+        # run id -> root run id of every open run, to tag calls with their turn
+        self._roots: dict[UUID, UUID] = {}
+        self._calls: dict[UUID, tuple[LLMCall, float]] = {}
+        self._lock = threading.Lock()
+
+    def _track(self, run_id: UUID, parent_run_id: Optional[UUID]) -> UUID:
+        with self._lock:
+            root = self._roots.get(parent_run_id, parent_run_id) if parent_run_id else run_id
+            self._roots[run_id] = root
+            return root
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, **kwargs):
+        self._track(run_id, parent_run_id)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        with self._lock:
+            self._roots.pop(run_id, None)
+
+    on_chain_error = on_chain_end
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        self._track(run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        with self._lock:
+            self._roots.pop(run_id, None)
+
+    on_tool_error = on_tool_end
+
+    def _start(self, serialized, run_id: UUID, parent_run_id: Optional[UUID], metadata: Optional[dict], kwargs: dict) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        model = metadata.get("ls_model_name") or params.get("model") or params.get("model_name")
+        call = LLMCall(
+            model=str(model or (serialized or {}).get("name", "unknown")),
+            node=metadata.get("langgraph_node"),
+            thread_id=metadata.get("thread_id"),
+            user_id=metadata.get("user_id"),
+            turn_id=str(self._track(run_id, parent_run_id)),
+        )
+        with self._lock:
+            self._calls[run_id] = (call, time.perf_counter())
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        self._start(serialized, run_id, parent_run_id, metadata, kwargs)
+
+    def on_llm_new_token(self, token, *, run_id, **kwargs):
+        entry = self._calls.get(run_id)
+        if entry is not None and entry[0].first_token_seconds is None:
+            entry[0].first_token_seconds = time.perf_counter() - entry[1]
+
+    def _finish(self, run_id: UUID, response: Optional[LLMResult], error: Optional[BaseException]) -> None:
+        with self._lock:
+            call, start = self._calls.pop(run_id, (None, 0.0))
+            self._roots.pop(run_id, None)
+        if call is None:
+            return
+        call.latency_seconds = time.perf_counter() - start
+        if error is not None:
+            call.error = repr(error)
+        if response is not None:
+            usage = [
+                getattr(getattr(g, "message", None), "usage_metadata", None)
+                for batch in response.generations
+                for g in batch
+            ]
+            if any(usage):
+                call.input_tokens = sum(u.get("input_tokens", 0) for u in usage if u)
+                call.output_tokens = sum(u.get("output_tokens", 0) for u in usage if u)
+                call.cached_tokens = sum((u.get("input_token_details") or {}).get("cache_read", 0) for u in usage if u)
+            elif token_usage := (response.llm_output or {}).get("token_usage"):
+                call.input_tokens = token_usage.get("prompt_tokens", 0)
+                call.output_tokens = token_usage.get("completion_tokens", 0)
+        call.cost = call_cost(call.model, call.input_tokens, call.output_tokens, call.cached_tokens)
+        self.ledger.record(call)
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        self._finish(run_id, response, None)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, None, error)
+
+
+def _optional(name: str, cast: Callable[[str], Any]) -> Any:
+    value = os.getenv(name)
+    return cast(value) if value else None
+
+
+@lru_cache
+def get_ledger() -> LLMLedger:
+    return LLMLedger(
+        path=_optional("LLM_LEDGER_FILE", Path),
+        budget=Budget(
+            thread_tokens=_optional("LLM_BUDGET_THREAD_TOKENS", int),
+            thread_cost=_optional("LLM_BUDGET_THREAD_COST", float),
+            turn_tokens=_optional("LLM_BUDGET_TURN_TOKENS", int),
+            turn_cost=_optional("LLM_BUDGET_TURN_COST", float),
+        ),
+    )
+
+
+def ledger_callbacks() -> list[BaseCallbackHandler]:
+    """Callbacks to add to a graph's config."""
+    return [LedgerCallbackHandler(get_ledger())]
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 2:
+        print("usage: python -m memory_agent.ledger <ledger file> [node|thread|turn|model]")
+        sys.exit(1)
+    group = sys.argv[2] if len(sys.argv) > 2 else "node"
+    ledger = LLMLedger(alert_hooks=[])
+    with open(sys.argv[1], encoding="utf8") as f:
+        for line in f:
+            if line.strip():
+                ledger.record(LLMCall(**json.loads(line)))
+    print(f"{group:<40} {'calls':>6} {'input':>10} {'output':>9} {'cost':>10} {'latency':>9}")
+    for key, usage in ledger.report(group):
+        print(
+            f"{key[:40]:<40} {usage.calls:>6} {usage.input_tokens:>10} {usage.output_tokens:>9} "
+            f"${usage.cost:>9.4f} {usage.latency_seconds:>8.1f}s"
+        )
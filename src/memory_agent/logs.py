@@ -0,0 +1,185 @@
+"""Logging that costs next to nothing on the request path.
+
+- `Truncated` defers rendering a payload until a handler formats the record,
+  and caps it at `LOG_MAX_CHARS`. Pass it as a %-style argument:
+  `logger.debug("results %s", Truncated(items))`. Nothing is rendered when
+  the level is disabled.
+- `Sampler` lets through one in every N high-volume events.
+- `configure_logging` installs a `QueueHandler` on the root logger. Records
+  are formatted and written by a listener thread, so a request only pays for
+  enqueueing them and copying their dict and list arguments. The queue is
+  bounded; when it is full, records are dropped and counted rather than
+  blocking the request.
+
+    python -m memory_agent.logs  # logging overhead per search
+"""
+
+import atexit
+import copy
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from functools import lru_cache
+from typing import Any, Optional, TextIO
+
+DEFAULT_FORMAT = "%(asctime)s %(levelname)s %(name)s  %(message)s"
+MAX_CHARS = int(os.getenv("LOG_MAX_CHARS", "1000"))
+
+
+class Truncated:
+    """A value rendered on demand and cut to `limit` characters.
+
+    Dicts and lists are rendered as JSON, anything else with `str`.
+    """
+
+    __slots__ = ("value", "limit")
+
+    def __init__(self, value: Any, limit: int = MAX_CHARS) -> None:
+        self.value = value
+        self.limit = limit
+
+    def __str__(self) -> str:
+        value = self.value
+        if isinstance(value, (dict, list)):
+            text = json.dumps(value, ensure_ascii=False, default=str)
+        else:
+            text = str(value)
+        if len(text) <= self.limit:
+            return text
+        return f"{text[:self.limit]}... ({len(text) - self.limit} more chars)"
+
+    __repr__ = __str__
+
+
+class Sampler:
+    """Let through the first of every `1 / rate` events.
+
+    Args:
+        rate: Share of events to keep, 1 keeps all of them and 0 none.
+    """
+
+    def __init__(self, rate: float) -> None:
+        self.every = round(1 / rate) if rate > 0 else 0
+        self._count = itertools.count()
+
+    def __call__(self) -> bool:
+        if self.every <= 1:
+            return self.every == 1
+        # next() on itertools.count is atomic under the GIL
+        return next(self._count) % self.every == 0
+
+
+def _snapshot(arg: Any) -> Any:
+    """Shallow copy of a mutable log argument, so that later changes to it are not logged."""
+    if isinstance(arg, Truncated):
+        return Truncated(_snapshot(arg.value), arg.limit)
+    if isinstance(arg, (dict, list, set)):
+        return arg.copy()
+    return arg
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that leaves formatting to the listener and never blocks.
+
+    The stock `QueueHandler.prepare` formats the message in the calling thread
+    so that records can be pickled. The queue here stays in the process, so
+    arguments are rendered by the listener. Only dicts, lists and sets are
+    copied when the record is enqueued, so that changes made to them after the
+    call are not logged; values nested in them are still shared.
+    """
+
+    def __init__(self, queue_: queue.Queue) -> None:
+        super().__init__(queue_)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        if isinstance(record.args, tuple) and record.args:
+            record = copy.copy(record)
+            record.args = tuple(_snapshot(arg) for arg in record.args)
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+@lru_cache
+def configure_logging(
+    level: Optional[str] = None,
+    fmt: str = DEFAULT_FORMAT,
+    queue_size: int = 10_000,
+    stream: Optional[TextIO] = None,
+) -> Optional[DroppingQueueHandler]:
+    """Log asynchronously from the root logger, once per process.
+
+    Like `logging.basicConfig`, does nothing if the root logger already has
+    handlers, e.g. set up by the application or the test runner.
+
+    Args:
+        level: Level name of the root logger, `LOG_LEVEL` or INFO by default.
+        fmt: Format of the records.
+        queue_size: Records waiting to be written before new ones are dropped.
+        stream: Stream the records are written to, stderr by default.
+    """
+    root = logging.getLogger()
+    if root.handlers:
+        return None
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(logging.Formatter(fmt))
+    records: queue.Queue = queue.Queue(queue_size)
+    listener = logging.handlers.QueueListener(records, handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = DroppingQueueHandler(records)
+    root.addHandler(queue_handler)
+    root.setLevel((level or os.getenv("LOG_LEVEL", "INFO")).upper())
+    return queue_handler
+
+
+if __name__ == "__main__":
+    import time
+    from pathlib import Path
+
+    # Overhead of logging one wine search, the previous eager f-string against the lazy log
+    sample = Path(__file__).parents[2] / "vinovoss_sample_output.json"
+    body = sample.read_text() if sample.exists() else json.dumps([{"id": i, "title": "x" * 200} for i in range(20)])
+    payload = {"query": "red wine under 200", "filters": {"wine_colors": ["Red"], "price_max": 200}}
+    logger = logging.getLogger("memory_agent.tools")
+    sampler = Sampler(0.1)
+
+    def eager() -> None:
+        logger.debug(f"query_ai_service(url=..., payload={payload})\n -> Took 0.2s\n -> 200 {json.loads(body)}")
+        json.loads(body)
+
+    def lazy() -> None:
+        items = json.loads(body)
+        if logger.isEnabledFor(logging.DEBUG) and sampler():
+            logger.debug(
+                "query_ai_service(payload=%s) -> 200 in %.3fs, %d items: %s", Truncated(payload), 0.2, len(items), Truncated(items)
+            )
+
+    def parse_only() -> None:
+        json.loads(body)
+
+    queue_handler = configure_logging("INFO", stream=open(os.devnull, "w"))
+    rounds = 500
+    for level in ("INFO", "DEBUG"):
+        logging.getLogger().setLevel(level)
+        baseline = None
+        for name, search in [("parse only", parse_only), ("eager f-string", eager), ("lazy + sampled", lazy)]:
+            timings = []
+            for _ in range(5):
+                start = time.perf_counter()
+                for _ in range(rounds):
+                    search()
+                timings.append((time.perf_counter() - start) / rounds * 1e6)
+            elapsed = min(timings)
+            baseline = baseline if baseline is not None else elapsed
+            print(f"level={level:<5} {name:<15} {elapsed:>8.1f}us per search, +{elapsed - baseline:.1f}us logging")
+    print(f"dropped records: {queue_handler.dropped}")
@@ -0,0 +1,438 @@
+"""In-process metrics in the Prometheus text format.
+
+Counters, gauges and histograms are kept in a `MetricsRegistry` and updated
+on the request path: turns, tool calls and model latency by
+`MetricsCallbackHandler`, search latency by `query_ai_service`, cache lookups
+by the blob store and the plan step cache, checkpoint latency by
+`MeasuredCheckpointer`. An update is a dict lookup and a locked add.
+
+The registry is served on `http://METRICS_HOST:METRICS_PORT/metrics` and/or
+written to `METRICS_FILE` every `METRICS_INTERVAL_SECONDS`, e.g. for the
+node_exporter textfile collector. Both are off unless configured. The Grafana
+dashboard in `dashboards/wine_chatbot.json` charts these metrics.
+"""
+
+import logging
+import math
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Callable, Iterator, Optional, Sequence
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+# Seconds, from a fast cache read to a slow model call
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str]) -> str:
+    if not names:
+        return ""
+    escaped = (v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in values)
+    return "{" + ",".join(f'{n}="{v}"' for n, v in zip(names, escaped)) + "}"
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._children: dict[tuple[str, ...], _Metric] = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values: str, **kwargs: str):
+        """Return the series of a label combination, created on first use."""
+        key = values or tuple(kwargs[n] for n in self.labelnames)
+        child = self._children.get(key)
+        if child is None:
+            if len(key) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}, got {key}")
+            with self._lock:
+                child = self._children.setdefault(tuple(str(v) for v in key), self._new_child())
+        return child
+
+    def _new_child(self) -> "_Metric":
+        return type(self)(self.name, self.documentation)
+
+    def _series(self) -> list[tuple[tuple[str, ...], "_Metric"]]:
+        if self.labelnames:
+            with self._lock:
+                return list(self._children.items())
+        return [((), self)]
+
+    def _samples(self, labels: str) -> list[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in self._series():
+            lines += child._samples(_format_labels(self.labelnames, values))
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def _samples(self, labels: str) -> list[str]:
+        return [f"{self.name}{labels} {_format_value(self.value)}"]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.value = 0.0
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float) -> None:
+        self.value = value
+
+    def inc(self, amount: float = 1) -> None:
+        with self._lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def set_function(self, function: Callable[[], float]) -> None:
+        """Compute the value when the registry is rendered."""
+        self._function = function
+
+    def _samples(self, labels: str) -> list[str]:
+        value = self._function() if self._function else self.value
+        return [f"{self.name}{labels} {_format_value(value)}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> None:
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Observations per bucket, the last one for values above every bound
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def _new_child(self) -> "Histogram":
+        return Histogram(self.name, self.documentation, buckets=self.buckets)
+
+    def observe(self, value: float) -> None:
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    @contextmanager
+    def time(self) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def _samples(self, labels: str) -> list[str]:
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        prefix = labels[:-1] + "," if labels else "{"
+        lines, cumulative = [], 0
+        for bound, count in zip((*self.buckets, math.inf), counts):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{prefix}le="{_format_value(bound)}"}} {cumulative}')
+        lines += [f"{self.name}_sum{labels} {_format_value(total)}", f"{self.name}_count{labels} {cumulative}"]
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self) -> None:
+        self._metrics: dict[str, _Metric] = {}
+
+    def _register(self, metric: _Metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(
+        self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def render(self) -> str:
+        """All metrics in the Prometheus text exposition format."""
+        return "\n".join(metric.render() for metric in self._metrics.values()) + "\n"
+
+    def write(self, path: Path) -> None:
+        """Write the metrics to `path` atomically, so a collector never reads half a file."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+        tmp.write_text(self.render(), encoding="utf8")
+        os.replace(tmp, path)
+
+
+REGISTRY = MetricsRegistry()
+
+TURNS = REGISTRY.counter("wine_chatbot_turns_total", "Graph runs started by a user message.", ["graph", "status"])
+TURN_SECONDS = REGISTRY.histogram("wine_chatbot_turn_seconds", "Duration of a graph run.", ["graph"])
+TOOL_CALLS = REGISTRY.counter("wine_chatbot_tool_calls_total", "Tool calls by tool.", ["tool", "status"])
+TOOL_SECONDS = REGISTRY.histogram("wine_chatbot_tool_seconds", "Duration of a tool call.", ["tool"])
+LLM_SECONDS = REGISTRY.histogram("wine_chatbot_llm_seconds", "Duration of a model call.", ["model", "node"])
+LLM_ERRORS = REGISTRY.counter("wine_chatbot_llm_errors_total", "Failed model calls.", ["model"])
+SEARCH_SECONDS = REGISTRY.histogram(
+    "wine_chatbot_search_seconds", "Duration of a request to the wine search API.", ["status"]
+)
+CACHE_LOOKUPS = REGISTRY.counter("wine_chatbot_cache_lookups_total", "Cache lookups.", ["cache", "result"])
+CHECKPOINT_SECONDS = REGISTRY.histogram(
+    "wine_chatbot_checkpoint_seconds",
+    "Duration of a checkpointer operation.",
+    ["checkpointer", "operation"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+ACTIVE_SESSIONS = REGISTRY.gauge("wine_chatbot_active_sessions", "Threads with a turn in the last SESSION_IDLE_SECONDS.")
+
+
+class SessionTracker:
+    """Last turn of each thread, to count the sessions still in use.
+
+    Args:
+        idle_seconds: Threads without a turn for this long are no longer active.
+        max_threads: Threads remembered; the least recently active is forgotten first.
+    """
+
+    def __init__(self, idle_seconds: float = 1800, max_threads: int = 100_000) -> None:
+        self.idle_seconds = idle_seconds
+        self.max_threads = max_threads
+        self._last_seen: OrderedDict[str, float] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def touch(self, thread_id: str) -> None:
+        with self._lock:
+            self._last_seen[thread_id] = time.monotonic()
+            self._last_seen.move_to_end(thread_id)
+            if len(self._last_seen) > self.max_threads:
+                self._last_seen.popitem(last=False)
+
+    def active(self) -> int:
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            while self._last_seen and next(iter(self._last_seen.values())) < cutoff:
+                self._last_seen.popitem(last=False)
+            return len(self._last_seen)
+
+
+sessions = SessionTracker(idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "1800")))
+ACTIVE_SESSIONS.set_function(sessions.active)
+
+
+def cache_lookup(cache: str, hit: bool) -> None:
+    CACHE_LOOKUPS.labels(cache, "hit" if hit else "miss").inc()
+
+
+class MeasuredCheckpointer:
+    """Mixin timing the reads and writes of a checkpointer.
+
+    List it before the saver class, e.g. `class Saver(MeasuredCheckpointer, SqliteSaver)`.
+    """
+
+    metrics_name = "checkpointer"
+
+    def get_tuple(self, config):
+        with CHECKPOINT_SECONDS.labels(self.metrics_name, "get_tuple").time():
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        with CHECKPOINT_SECONDS.labels(self.metrics_name, "put").time():
+            return super().put(config, checkpoint, metadata, new_versions)
+
+    def put_writes(self, config, writes, task_id, task_path=""):
+        with CHECKPOINT_SECONDS.labels(self.metrics_name, "put_writes").time():
+            return super().put_writes(config, writes, task_id, task_path)
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """Count and time the turns, tool calls and model calls of graph runs."""
+
+    def __init__(self) -> None:
+        # run id -> start time and label of the open runs
+        self._runs: dict[UUID, tuple[float, tuple[str, ...]]] = {}
+
+    def _start(self, run_id: UUID, *labels: str) -> None:
+        self._runs[run_id] = (time.perf_counter(), labels)
+
+    def _end(self, run_id: UUID) -> Optional[tuple[float, tuple[str, ...]]]:
+        entry = self._runs.pop(run_id, None)
+        return (time.perf_counter() - entry[0], entry[1]) if entry else None
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if parent_run_id is None:
+            if thread_id := (metadata or {}).get("thread_id"):
+                sessions.touch(str(thread_id))
+            self._start(run_id, kwargs.get("name") or "graph")
+
+    def _end_turn(self, run_id: UUID, status: str) -> None:
+        if ended := self._end(run_id):
+            elapsed, (graph,) = ended
+            TURNS.labels(graph, status).inc()
+            TURN_SECONDS.labels(graph).observe(elapsed)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end_turn(run_id, "ok")
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end_turn(run_id, "error")
+
+    def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        self._start(run_id, kwargs.get("name") or (serialized or {}).get("name", "unknown"))
+
+    def _end_tool(self, run_id: UUID, status: str) -> None:
+        if ended := self._end(run_id):
+            elapsed, (tool,) = ended
+            TOOL_CALLS.labels(tool, status).inc()
+            TOOL_SECONDS.labels(tool).observe(elapsed)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end_tool(run_id, "ok")
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end_tool(run_id, "error")
+
+    def _start_llm(self, serialized, run_id: UUID, metadata: Optional[dict], kwargs: dict) -> None:
+        metadata = metadata or {}
+        params = kwargs.get("invocation_params") or {}
+        model = metadata.get("ls_model_name") or params.get("model") or (serialized or {}).get("name", "unknown")
+        self._start(run_id, str(model), str(metadata.get("langgraph_node", "-")))
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, metadata=None, **kwargs):
+        self._start_llm(serialized, run_id, metadata, kwargs)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, metadata=None, **kwargs):
+        self._start_llm(serialized, run_id, metadata, kwargs)
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        if ended := self._end(run_id):
+            elapsed, (model, node) = ended
+            LLM_SECONDS.labels(model, node).observe(elapsed)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        if ended := self._end(run_id):
+            LLM_ERRORS.labels(ended[1][0]).inc()
+
+
+class _MetricsRequestHandler(BaseHTTPRequestHandler):
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.render().encode("utf8")
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        pass
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the registry on `/metrics` from a daemon thread."""
+    server = ThreadingHTTPServer((host, port), _MetricsRequestHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
+
+
+def start_file_writer(path: Path, interval_seconds: float = 15) -> threading.Thread:
+    """Write the registry to `path` every `interval_seconds` from a daemon thread."""
+
+    def run() -> None:
+        while True:
+            try:
+                REGISTRY.write(path)
+            except OSError as e:
+                logger.warning(f"Failed to write metrics to {path}: {e}")
+            time.sleep(interval_seconds)
+
+    thread = threading.Thread(target=run, name="metrics-writer", daemon=True)
+    thread.start()
+    return thread
+
+
+@lru_cache
+def start_exporters() -> None:
+    """Start the exporters configured in the environment, once per process."""
+    if port := os.getenv("METRICS_PORT"):
+        try:
+            start_http_server(int(port), os.getenv("METRICS_HOST", "127.0.0.1"))
+        except OSError as e:
+            # e.g. a second Streamlit worker on the same port
+            logger.warning(f"Metrics server not started on port {port}: {e}")
+    if path := os.getenv("METRICS_FILE"):
+        start_file_writer(Path(path), float(os.getenv("METRICS_INTERVAL_SECONDS", "15")))
+
+
+def metrics_callbacks() -> list[BaseCallbackHandler]:
+    """Callbacks to add to a graph's config."""
+    start_exporters()
+    return [MetricsCallbackHandler()]
+
+
+if __name__ == "__main__":
+    rounds = 200_000
+    counter = TOOL_CALLS.labels("wine_search", "ok")
+    for name, update in [
+        ("counter.inc", counter.inc),
+        ("labels().inc", lambda: TOOL_CALLS.labels("wine_search", "ok").inc()),
+        ("histogram.observe", lambda: SEARCH_SECONDS.labels("200").observe(0.12)),
+    ]:
+        start = time.perf_counter()
+        for _ in range(rounds):
+            update()
+        print(f"{name:<20} {(time.perf_counter() - start) / rounds * 1e9:>6.0f}ns")
+    start = time.perf_counter()
+    for _ in range(rounds):
+        with CHECKPOINT_SECONDS.labels("chat", "put").time():
+            pass
+    print(f"{'histogram.time':<20} {(time.perf_counter() - start) / rounds * 1e9:>6.0f}ns")
+    start = time.perf_counter()
+    text = REGISTRY.render()
+    print(f"render: {(time.perf_counter() - start) * 1000:.2f}ms for {len(text.splitlines())} lines")
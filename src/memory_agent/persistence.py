@@ -1,14 +1,40 @@
 import os
 import sqlite3
+from typing import Optional
+
 from langgraph.checkpoint.sqlite import SqliteSaver
 
+from memory_agent.blobs import BlobOffloadingSerializer, get_blob_store
+from memory_agent.metrics import MeasuredCheckpointer
+from memory_agent.serde import CompressedSerializer, load_dictionaries
+from memory_agent.retention import CheckpointRetention, RetentionPolicy
+
+
+class MeasuredSqliteSaver(MeasuredCheckpointer, SqliteSaver):
+    metrics_name = "chat"
+
+
 class Database:
-    def __init__(self, db_path: str = "state_db/example.db") -> None:
+    def __init__(
+        self,
+        db_path: str = "state_db/example.db",
+        retention_policy: Optional[RetentionPolicy] = None,
+    ) -> None:
         # Ensure the directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         conn = sqlite3.connect(db_path, check_same_thread=False)
-        memory = SqliteSaver(conn)
+        # Must be set before the first table is created; no-op on existing databases
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # Large tool results are stored once in the blob store, checkpoints keep references
+        self.blob_store = get_blob_store()
+        # Dictionaries trained with `python -m memory_agent.serde train`
+        dictionaries = load_dictionaries(os.path.join(os.path.dirname(db_path), "dictionaries"))
+        serde = BlobOffloadingSerializer(self.blob_store, serde=CompressedSerializer(dictionaries=dictionaries))
+        memory = MeasuredSqliteSaver(conn, serde=serde)
         self.memory = memory
+        # Started by the application with `database.retention.start()`, not on import
+        self.retention = CheckpointRetention(memory, retention_policy, blob_store=self.blob_store)
 
-memory = Database().memory
+database = Database()
+memory = database.memory
 
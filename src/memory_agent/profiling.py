@@ -0,0 +1,288 @@
+"""Profile single turns of a graph on demand.
+
+A turn is profiled when its thread_id is listed in `PROFILE_THREAD_IDS`, or
+for a `PROFILE_SAMPLE_RATE` share of turns. While it runs:
+
+- a sampling profiler records, every `PROFILE_INTERVAL_MS`, the stacks of the
+  calling thread and of the executor threads while they run a node or tool of
+  the turn;
+- tracemalloc traces allocations.
+
+When the turn ends, two files are written to `PROFILE_DIR`. The first,
+`<time>-<thread_id>-<run>.folded`, holds stacks in the folded format of
+flamegraph.pl, speedscope and inferno. The second, `...allocations.txt`,
+holds the peak traced memory and the lines whose allocations during the turn
+are still held at its end.
+
+Profiling is off by default. `profiling_callbacks` then adds no callback at
+all, so an unprofiled turn pays nothing.
+"""
+
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from dataclasses import dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+@dataclass(kw_only=True)
+class ProfilingConfig:
+    thread_ids: frozenset[str] = field(default_factory=frozenset)
+    """Threads whose every turn is profiled."""
+    sample_rate: float = 0.0
+    """Share of the other turns that are profiled."""
+    output_dir: Path = Path("profiles")
+    interval_seconds: float = 0.005
+    """Time between two stack samples."""
+    traceback_frames: int = 1
+    """Frames tracemalloc keeps per allocation, 0 to skip tracemalloc.
+
+    Allocations are slower the more frames are kept; one is enough to rank lines.
+    """
+    top_allocations: int = 25
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.thread_ids) or self.sample_rate > 0
+
+    def should_profile(self, thread_id: Optional[str]) -> bool:
+        if thread_id is not None and thread_id in self.thread_ids:
+            return True
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    @classmethod
+    def from_env(cls) -> "ProfilingConfig":
+        return cls(
+            thread_ids=frozenset(t.strip() for t in os.getenv("PROFILE_THREAD_IDS", "").split(",") if t.strip()),
+            sample_rate=float(os.getenv("PROFILE_SAMPLE_RATE", "0")),
+            output_dir=Path(os.getenv("PROFILE_DIR", "profiles")),
+            interval_seconds=float(os.getenv("PROFILE_INTERVAL_MS", "5")) / 1000,
+            traceback_frames=int(os.getenv("PROFILE_TRACEMALLOC_FRAMES", "1")),
+        )
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    name = getattr(code, "co_qualname", code.co_name)
+    # Semicolons separate frames in the folded format
+    return f"{name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Count the stacks of the calling thread and of the threads running a run of the turn.
+
+    Executor threads are shared by every graph of the process, so a thread is
+    only sampled between `enter` and `exit`, while it runs a node or tool of
+    the profiled turn.
+
+    Args:
+        interval_seconds: Time between two samples.
+    """
+
+    def __init__(self, interval_seconds: float = 0.005) -> None:
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self._caller = threading.get_ident()
+        # ident -> thread name and runs of the turn the thread is in
+        self._threads: dict[int, tuple[str, int]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def start(self) -> "StackSampler":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def enter(self) -> None:
+        """Sample the current thread until the matching `exit`."""
+        ident = threading.get_ident()
+        with self._lock:
+            name, runs = self._threads.get(ident, (threading.current_thread().name, 0))
+            self._threads[ident] = (name, runs + 1)
+
+    def exit(self) -> None:
+        ident = threading.get_ident()
+        with self._lock:
+            name, runs = self._threads.get(ident, ("", 1))
+            if runs > 1:
+                self._threads[ident] = (name, runs - 1)
+            else:
+                self._threads.pop(ident, None)
+
+    def _targets(self) -> dict[int, str]:
+        with self._lock:
+            targets = {ident: name for ident, (name, _) in self._threads.items()}
+        targets[self._caller] = "caller"
+        return targets
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval_seconds):
+            targets = self._targets()
+            for ident, frame in sys._current_frames().items():
+                if ident not in targets:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(targets[ident])
+                self.stacks[";".join(reversed(frames))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        """Stacks in the folded format, the root frame first, with their sample counts."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class _Tracemalloc:
+    """Reference count of the turns being traced, tracemalloc runs while there is one."""
+
+    def __init__(self) -> None:
+        self._active = 0
+        self._started = False
+        self._lock = threading.Lock()
+
+    def acquire(self, frames: int) -> tracemalloc.Snapshot:
+        """Snapshot at the start of a turn, starting tracemalloc for the first turn."""
+        with self._lock:
+            if self._active == 0 and not tracemalloc.is_tracing():
+                tracemalloc.start(frames)
+                self._started = True
+            self._active += 1
+            return tracemalloc.take_snapshot()
+
+    def release(self) -> tuple[tracemalloc.Snapshot, int]:
+        """Snapshot and peak traced bytes, stopping tracemalloc after the last turn.
+
+        The peak is that of every turn traced at the same time.
+        """
+        with self._lock:
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            self._active -= 1
+            if self._active == 0 and self._started:
+                tracemalloc.stop()
+                self._started = False
+            return snapshot, peak
+
+
+_tracemalloc = _Tracemalloc()
+
+
+@dataclass
+class _Profile:
+    thread_id: str
+    sampler: StackSampler
+    snapshot: Optional[tracemalloc.Snapshot]
+    started_at: float = field(default_factory=time.time)
+    start: float = field(default_factory=time.perf_counter)
+
+
+class ProfilingCallbackHandler(BaseCallbackHandler):
+    """Profile the graph runs selected by a `ProfilingConfig`."""
+
+    def __init__(self, config: ProfilingConfig) -> None:
+        self.config = config
+        self._profiles: dict[UUID, _Profile] = {}
+        # run id -> profile of every open child run of a profiled turn
+        self._runs: dict[UUID, _Profile] = {}
+
+    def _enter(self, run_id: UUID, parent_run_id: UUID) -> None:
+        profile = self._profiles.get(parent_run_id) or self._runs.get(parent_run_id)
+        if profile is not None:
+            self._runs[run_id] = profile
+            profile.sampler.enter()
+
+    def _exit(self, run_id: UUID) -> None:
+        if (profile := self._runs.pop(run_id, None)) is not None:
+            profile.sampler.exit()
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        if parent_run_id is not None:
+            self._enter(run_id, parent_run_id)
+            return
+        thread_id = (metadata or {}).get("thread_id")
+        if not self.config.should_profile(None if thread_id is None else str(thread_id)):
+            return
+        snapshot = _tracemalloc.acquire(self.config.traceback_frames) if self.config.traceback_frames else None
+        sampler = StackSampler(self.config.interval_seconds).start()
+        self._profiles[run_id] = _Profile(str(thread_id or "-"), sampler, snapshot)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._exit(run_id)
+        if (profile := self._profiles.pop(run_id, None)) is not None:
+            self._write(run_id, profile)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self.on_chain_end(None, run_id=run_id)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        if parent_run_id is not None:
+            self._enter(run_id, parent_run_id)
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._exit(run_id)
+
+    def _write(self, run_id: UUID, profile: _Profile) -> None:
+        profile.sampler.stop()
+        elapsed = time.perf_counter() - profile.start
+
+        output_dir = self.config.output_dir
+        output_dir.mkdir(parents=True, exist_ok=True)
+        stamp = time.strftime("%Y%m%dT%H%M%S", time.localtime(profile.started_at))
+        safe_thread_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in profile.thread_id)[:64]
+        base = output_dir / f"{stamp}-{safe_thread_id}-{str(run_id)[:8]}"
+        base.with_suffix(".folded").write_text(profile.sampler.folded(), encoding="utf8")
+
+        lines = [
+            f"thread_id: {profile.thread_id}",
+            f"run_id: {run_id}",
+            f"duration: {elapsed:.3f}s, {profile.sampler.samples} stack samples",
+        ]
+        if profile.snapshot is not None:
+            snapshot, peak = _tracemalloc.release()
+            # Allocations of the profiler and of tracemalloc itself are noise
+            ignored = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+            diff = snapshot.filter_traces(ignored).compare_to(profile.snapshot.filter_traces(ignored), "lineno")
+            lines += [
+                f"peak traced memory: {peak / 1024:.1f} KiB",
+                "",
+                f"Top {self.config.top_allocations} lines by memory allocated during the turn and still held at its end:",
+            ]
+            for stat in diff[: self.config.top_allocations]:
+                frame = stat.traceback[0]
+                lines.append(
+                    f"{stat.size_diff / 1024:>+10.1f} KiB {stat.count_diff:>+8} blocks  {frame.filename}:{frame.lineno}"
+                )
+        base.with_suffix(".allocations.txt").write_text("\n".join(lines) + "\n", encoding="utf8")
+        logger.info(f"Profiled turn of thread {profile.thread_id} in {elapsed:.2f}s, written to {base}.*")
+
+
+@lru_cache
+def get_profiling_config() -> ProfilingConfig:
+    return ProfilingConfig.from_env()
+
+
+def profiling_callbacks() -> list[BaseCallbackHandler]:
+    """Callbacks to add to a graph's config, none while profiling is off."""
+    config = get_profiling_config()
+    return [ProfilingCallbackHandler(config)] if config.enabled else []
@@ -0,0 +1,236 @@
+"""Retention, compaction and vacuum for the SQLite checkpoint database."""
+
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from langgraph.checkpoint.base.id import UUID
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from memory_agent.blobs import BlobOffloadingSerializer, BlobStore, blob_references
+
+logger = logging.getLogger(__name__)
+
+# 100ns intervals between the Gregorian epoch (uuid6) and the Unix epoch
+_UUID_EPOCH_OFFSET = 0x01B21DD213814000
+# Blobs stored this recently are kept by a sweep: the checkpoint referencing
+# them may be serialised but not written yet while the references are read
+_SWEEP_GRACE_SECONDS = 60
+
+
+@dataclass(kw_only=True)
+class RetentionPolicy:
+    """How long checkpoints are kept and how often the database is cleaned up."""
+
+    keep_last: int = 5
+    """Number of most recent checkpoints to keep per thread and namespace."""
+    thread_ttl_seconds: Optional[int] = 7 * 24 * 3600
+    """Threads without a new checkpoint for this long are deleted. None disables expiry."""
+    interval_seconds: int = 10 * 60
+    """Seconds between two background retention passes."""
+    vacuum_pages: int = 500
+    """Maximum number of free pages released by one incremental vacuum."""
+
+
+def checkpoint_timestamp(checkpoint_id: str) -> float:
+    """Return the Unix timestamp encoded in a uuid6 checkpoint id."""
+    return (UUID(checkpoint_id).time - _UUID_EPOCH_OFFSET) / 1e7
+
+
+class CheckpointRetention:
+    """Apply a `RetentionPolicy` to the tables of a `SqliteSaver`.
+
+    Every statement goes through `saver.cursor()` so it shares the saver's lock
+    and never interleaves with a checkpoint write.
+    """
+
+    def __init__(
+        self,
+        saver: SqliteSaver,
+        policy: Optional[RetentionPolicy] = None,
+        blob_store: Optional[BlobStore] = None,
+    ) -> None:
+        self.saver = saver
+        self.policy = policy or RetentionPolicy()
+        self.blob_store = blob_store
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def prune_checkpoints(self) -> int:
+        """Delete all but the latest `keep_last` checkpoints of every thread."""
+        with self.saver.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM checkpoints WHERE rowid IN (
+                    SELECT rowid FROM (
+                        SELECT rowid, ROW_NUMBER() OVER (
+                            PARTITION BY thread_id, checkpoint_ns
+                            ORDER BY checkpoint_id DESC
+                        ) AS rank
+                        FROM checkpoints
+                    ) WHERE rank > ?
+                )
+                """,
+                (self.policy.keep_last,),
+            )
+            return cur.rowcount
+
+    def expire_threads(self, now: float) -> list[str]:
+        """Delete every thread whose latest checkpoint is older than the TTL."""
+        if self.policy.thread_ttl_seconds is None:
+            return []
+        cutoff = now - self.policy.thread_ttl_seconds
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute("SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id")
+            expired = [thread_id for thread_id, last_id in cur.fetchall() if checkpoint_timestamp(last_id) < cutoff]
+        for thread_id in expired:
+            self.saver.delete_thread(thread_id)
+        return expired
+
+    def compact_writes(self) -> int:
+        """Delete pending writes whose checkpoint was pruned or deleted.
+
+        Writes of the checkpoints kept by `keep_last` stay, so those checkpoints
+        can still be replayed or forked.
+        """
+        with self.saver.cursor() as cur:
+            cur.execute(
+                """
+                DELETE FROM writes WHERE NOT EXISTS (
+                    SELECT 1 FROM checkpoints c
+                    WHERE c.thread_id = writes.thread_id
+                      AND c.checkpoint_ns = writes.checkpoint_ns
+                      AND c.checkpoint_id = writes.checkpoint_id
+                )
+                """
+            )
+            return cur.rowcount
+
+    def referenced_blobs(self) -> set[str]:
+        """Digests of the blobs referenced by any checkpoint or pending write."""
+        with self.saver.cursor(transaction=False) as cur:
+            rows = cur.execute("SELECT type, checkpoint FROM checkpoints").fetchall()
+            rows += cur.execute("SELECT type, value FROM writes").fetchall()
+        serde = self.saver.serde
+        referenced: set[str] = set()
+        for type_, data in rows:
+            if isinstance(serde, BlobOffloadingSerializer):
+                referenced |= serde.references((type_, data))
+            else:
+                referenced.update(blob_references(serde.loads_typed((type_, data))))
+        return referenced
+
+    def sweep_blobs(self) -> int:
+        """Delete the blobs no checkpoint or pending write refers to anymore."""
+        if self.blob_store is None:
+            return 0
+        marked_at = time.time() - _SWEEP_GRACE_SECONDS
+        return self.blob_store.sweep(self.referenced_blobs(), marked_at)
+
+    def incremental_vacuum(self) -> int:
+        """Release up to `vacuum_pages` free pages back to the file system.
+
+        Only effective on databases created with `auto_vacuum=INCREMENTAL`; see
+        `persistence.Database`.
+        """
+        with self.saver.cursor() as cur:
+            (auto_vacuum,) = cur.execute("PRAGMA auto_vacuum").fetchone()
+            if auto_vacuum != 2:
+                logger.debug("Checkpoint database is not in incremental auto_vacuum mode, skipping vacuum")
+                return 0
+            (before,) = cur.execute("PRAGMA freelist_count").fetchone()
+            cur.execute(f"PRAGMA incremental_vacuum({int(self.policy.vacuum_pages)})").fetchall()
+            (after,) = cur.execute("PRAGMA freelist_count").fetchone()
+            return before - after
+
+    def run_once(self, now: Optional[float] = None) -> dict[str, int]:
+        """Run one full retention pass and return what it removed."""
+        now = time.time() if now is None else now
+        expired = self.expire_threads(now)
+        pruned = self.prune_checkpoints()
+        compacted = self.compact_writes()
+        evicted = self.sweep_blobs()
+        vacuumed = self.incremental_vacuum()
+        result = {
+            "expired_threads": len(expired),
+            "evicted_blobs": evicted,
+            "pruned_checkpoints": pruned,
+            "compacted_writes": compacted,
+            "vacuumed_pages": vacuumed,
+        }
+        logger.info(f"Checkpoint retention pass: {result}")
+        return result
+
+    def db_stats(self) -> dict[str, int]:
+        """Return the size of the database file and its row counts."""
+        with self.saver.cursor(transaction=False) as cur:
+            (page_count,) = cur.execute("PRAGMA page_count").fetchone()
+            (page_size,) = cur.execute("PRAGMA page_size").fetchone()
+            (freelist,) = cur.execute("PRAGMA freelist_count").fetchone()
+            (threads, checkpoints) = cur.execute(
+                "SELECT COUNT(DISTINCT thread_id), COUNT(*) FROM checkpoints"
+            ).fetchone()
+            (writes,) = cur.execute("SELECT COUNT(*) FROM writes").fetchone()
+        return {
+            "size_bytes": page_count * page_size,
+            "free_bytes": freelist * page_size,
+            "threads": threads,
+            "checkpoints": checkpoints,
+            "writes": writes,
+        }
+
+    def thread_footprints(self, limit: int = 20) -> list[dict]:
+        """Return the threads using the most space, largest first."""
+        with self.saver.cursor(transaction=False) as cur:
+            cur.execute(
+                """
+                SELECT thread_id, SUM(checkpoints), SUM(checkpoint_bytes), SUM(writes), SUM(write_bytes)
+                FROM (
+                    SELECT thread_id, COUNT(*) AS checkpoints,
+                           SUM(LENGTH(checkpoint) + LENGTH(metadata)) AS checkpoint_bytes,
+                           0 AS writes, 0 AS write_bytes
+                    FROM checkpoints GROUP BY thread_id
+                    UNION ALL
+                    SELECT thread_id, 0, 0, COUNT(*), SUM(LENGTH(value))
+                    FROM writes GROUP BY thread_id
+                )
+                GROUP BY thread_id
+                ORDER BY SUM(checkpoint_bytes) + SUM(write_bytes) DESC
+                LIMIT ?
+                """,
+                (limit,),
+            )
+            return [
+                {
+                    "thread_id": thread_id,
+                    "checkpoints": checkpoints,
+                    "checkpoint_bytes": checkpoint_bytes or 0,
+                    "writes": writes,
+                    "write_bytes": write_bytes or 0,
+                }
+                for thread_id, checkpoints, checkpoint_bytes, writes, write_bytes in cur.fetchall()
+            ]
+
+    def start(self) -> None:
+        """Run `run_once` every `interval_seconds` on a daemon thread."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="checkpoint-retention", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Stop the background thread started by `start`."""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.policy.interval_seconds):
+            try:
+                self.run_once()
+            except Exception as e:
+                logger.error(f"Checkpoint retention pass failed: {e}")
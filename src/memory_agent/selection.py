@@ -0,0 +1,227 @@
+"""Choose which wines to buy, and how many of each, within a budget.
+
+`select_within_budget` maximises the total score (e.g. user rating) of the
+bottles bought under a budget, a per-wine quantity limit and optional bounds
+on the total number of bottles. It solves a bounded knapsack by dynamic
+programming over price buckets with NumPy, and falls back to a greedy
+score-per-price heuristic when the table would be too large.
+"""
+
+import math
+from dataclasses import dataclass, field
+from typing import Optional, Sequence
+
+import numpy as np
+
+# Number of price buckets the budget is split into; prices are rounded up to a
+# bucket so that a selection never exceeds the budget
+DEFAULT_BUDGET_BUCKETS = 2000
+# Cells of the (chunks x bottles x buckets) decision table above which the
+# greedy approximation is used
+DEFAULT_MAX_CELLS = 50_000_000
+
+
+@dataclass
+class Selection:
+    quantities: list[int]
+    """Bottles of each candidate, in input order. 0 for candidates without a price."""
+    total_cost: float = 0.0
+    total_score: float = 0.0
+    bottles: int = 0
+    exact: bool = True
+    """False if the greedy approximation was used."""
+    feasible: bool = True
+    """False if no selection satisfies `min_bottles` within the budget."""
+    skipped: list[int] = field(default_factory=list)
+    """Indices of candidates without a price."""
+
+
+def _chunks(quantity: int) -> list[int]:
+    # Binary splitting: any count up to `quantity` is a sum of a subset of these
+    chunks, size = [], 1
+    while quantity > 0:
+        chunks.append(min(size, quantity))
+        quantity -= chunks[-1]
+        size *= 2
+    return chunks
+
+
+def select_within_budget(
+    prices: Sequence[Optional[float]],
+    scores: Sequence[Optional[float]],
+    budget: float,
+    max_per_wine: int | Sequence[int] = 1,
+    min_bottles: int = 0,
+    max_bottles: Optional[int] = None,
+    budget_buckets: int = DEFAULT_BUDGET_BUCKETS,
+    max_cells: int = DEFAULT_MAX_CELLS,
+) -> Selection:
+    """Maximise the total score of the bottles bought within `budget`.
+
+    Args:
+        prices: Price of one bottle of each candidate. Candidates priced None are skipped.
+        scores: Score of one bottle of each candidate, e.g. its rating. None counts as 0.
+        budget: Maximum total cost.
+        max_per_wine: Maximum bottles of each candidate, one value or one per candidate.
+        min_bottles: Minimum total number of bottles.
+        max_bottles: Maximum total number of bottles.
+        budget_buckets: Resolution of the dynamic programming over the budget.
+        max_cells: Size of the dynamic programming table above which the greedy
+            approximation is used.
+    """
+    n = len(prices)
+    limits = [max_per_wine] * n if isinstance(max_per_wine, int) else list(max_per_wine)
+    skipped = [i for i, p in enumerate(prices) if p is None or (isinstance(p, float) and math.isnan(p))]
+    unpriced = set(skipped)
+    items = [i for i in range(n) if i not in unpriced and limits[i] > 0 and prices[i] <= budget]
+    price = np.array([prices[i] for i in items], dtype=np.float64)
+    score = np.array([scores[i] or 0.0 for i in items], dtype=np.float64)
+    limit = np.array([limits[i] for i in items], dtype=np.int64)
+    if max_bottles is None and min_bottles:
+        max_bottles = int(limit.sum())
+    if max_bottles is not None and max_bottles < min_bottles:
+        # Also the case when nothing is affordable, which the table below would not track
+        return Selection(quantities=[0] * n, skipped=skipped, feasible=False)
+    if max_bottles is not None:
+        keep = _undominated(price, score, limit, max_bottles)
+        items, price, score, limit = [items[j] for j in keep], price[keep], score[keep], limit[keep]
+
+    bucket = max(budget / budget_buckets, 1e-9)
+    capacity = int(budget / bucket + 1e-9)
+    rows = 1 if max_bottles is None else max_bottles + 1
+    n_chunks = sum(len(_chunks(int(q))) for q in limit)
+    greedy = max(
+        (_greedy(price, score, limit, budget, max_bottles, by_density) for by_density in (True, False)),
+        key=lambda q: float(q @ score),
+    )
+    approximate = _selection(n, items, greedy, price, score, skipped, exact=False)
+    approximate.feasible = approximate.bottles >= min_bottles
+    if n_chunks * rows * (capacity + 1) > max_cells:
+        return approximate
+
+    # dp[b, c]: best score with exactly b bottles (b = 0 if not tracked) and cost <= c buckets
+    dp = np.full((rows, capacity + 1), -np.inf)
+    dp[0, :] = 0.0
+    cost = np.ceil(price / bucket - 1e-9).astype(np.int64)
+    taken: list[tuple[int, int, np.ndarray]] = []
+    for j in range(len(items)):
+        for size in _chunks(int(limit[j])):
+            w, k = int(cost[j]) * size, size if rows > 1 else 0
+            if w > capacity or k >= rows and rows > 1:
+                continue
+            candidate = np.full_like(dp, -np.inf)
+            candidate[k:, w:] = dp[: rows - k, : capacity + 1 - w] + score[j] * size
+            take = candidate > dp
+            np.maximum(dp, candidate, out=dp)
+            taken.append((j, size, take))
+
+    lowest = min_bottles if rows > 1 else 0
+    best = dp[lowest:, capacity]
+    if not len(best) or np.isneginf(best.max()):
+        return approximate if approximate.feasible else Selection(quantities=[0] * n, skipped=skipped, feasible=False)
+    b, c = lowest + int(best.argmax()), capacity
+    quantities = np.zeros(len(items), dtype=np.int64)
+    for j, size, take in reversed(taken):
+        if take[b, c]:
+            quantities[j] += size
+            b -= size if rows > 1 else 0
+            c -= int(cost[j]) * size
+    selection = _selection(n, items, quantities, price, score, skipped, exact=True)
+    # Rounding prices up to a bucket can exclude the true optimum; greedy works on exact prices
+    if approximate.feasible and approximate.total_score > selection.total_score:
+        return approximate
+    return selection
+
+
+def _undominated(price: np.ndarray, score: np.ndarray, limit: np.ndarray, max_bottles: int) -> np.ndarray:
+    """Return the indices of the candidates worth considering when at most `max_bottles` are bought.
+
+    A candidate is never needed if at least `max_bottles` bottles of other
+    candidates are both no more expensive and no worse.
+    """
+    order = np.lexsort((-score, price))
+    ranks = np.unique(score, return_inverse=True)[1].ravel()
+    # Fenwick tree over score ranks, counting bottles at least as good seen so far
+    tree = np.zeros(len(score) + 1, dtype=np.int64)
+    keep = []
+    for j in order:
+        r, better = len(score) - int(ranks[j]), 0
+        while r > 0:
+            better += tree[r]
+            r -= r & -r
+        if better < max_bottles:
+            keep.append(j)
+        r = len(score) - int(ranks[j])
+        while r <= len(score):
+            tree[r] += limit[j]
+            r += r & -r
+    return np.sort(np.array(keep, dtype=np.int64))
+
+
+def _greedy(
+    price: np.ndarray,
+    score: np.ndarray,
+    limit: np.ndarray,
+    budget: float,
+    max_bottles: Optional[int],
+    by_density: bool,
+) -> np.ndarray:
+    # Score per price suits a binding budget, plain score a binding bottle count
+    with np.errstate(divide="ignore", invalid="ignore"):
+        key = np.where(price > 0, score / price, np.inf) if by_density else score
+    quantities = np.zeros(len(price), dtype=np.int64)
+    remaining, bottles = budget, 0
+    for j in np.lexsort((price, -key)):
+        if score[j] <= 0 and price[j] > 0:
+            continue
+        count = int(limit[j]) if price[j] <= 0 else min(int(limit[j]), int(remaining // price[j]))
+        if max_bottles is not None:
+            count = min(count, max_bottles - bottles)
+        if count > 0:
+            quantities[j] = count
+            remaining -= count * price[j]
+            bottles += count
+    return quantities
+
+
+def _selection(
+    n: int,
+    items: list[int],
+    quantities: np.ndarray,
+    price: np.ndarray,
+    score: np.ndarray,
+    skipped: list[int],
+    exact: bool,
+) -> Selection:
+    result = [0] * n
+    for j, i in enumerate(items):
+        result[i] = int(quantities[j])
+    return Selection(
+        quantities=result,
+        total_cost=round(float(quantities @ price), 2) if len(items) else 0.0,
+        total_score=float(quantities @ score) if len(items) else 0.0,
+        bottles=int(quantities.sum()),
+        exact=exact,
+        skipped=skipped,
+    )
+
+
+if __name__ == "__main__":
+    import time
+
+    rng = np.random.default_rng(0)
+    for n in (50, 500, 5000):
+        prices = rng.lognormal(3.3, 0.6, n).round(2).tolist()
+        ratings = rng.uniform(3.0, 4.8, n).round(1).tolist()
+        for label, kwargs in (
+            ("one each", {}),
+            ("<=24 bottles, <=6 each", {"max_per_wine": 6, "max_bottles": 24}),
+        ):
+            start = time.perf_counter()
+            selection = select_within_budget(prices, ratings, 500.0, **kwargs)
+            elapsed = (time.perf_counter() - start) * 1000
+            greedy = select_within_budget(prices, ratings, 500.0, max_cells=0, **kwargs)
+            print(
+                f"n={n:<5} {label:<24} {elapsed:8.1f}ms  score {selection.total_score:7.1f} "
+                f"(greedy {greedy.total_score:7.1f})  cost {selection.total_cost:7.2f}  exact={selection.exact}"
+            )
@@ -0,0 +1,228 @@
+"""Compressed checkpoint serializer.
+
+Checkpoints are encoded with the msgpack encoding of `JsonPlusSerializer` and
+then compressed with zstd (or zlib when `zstandard` is not installed),
+optionally with a shared dictionary trained on wine records. The codec is
+appended to the type tag, e.g. `msgpack+zstd.v1.d3f2a...`, so checkpoints
+written before compression was enabled keep their plain tag and stay readable.
+"""
+
+import hashlib
+import json
+import logging
+import sqlite3
+import sys
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from langgraph.checkpoint.serde.base import SerializerProtocol
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - optional dependency
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+CODEC_VERSION = "v1"
+DEFAULT_MIN_BYTES = 256
+# zlib only looks back 32KB, so a longer preset dictionary is wasted
+ZLIB_MAX_DICT_BYTES = 32 * 1024
+
+
+def dictionary_id(dictionary: bytes) -> str:
+    return hashlib.sha256(dictionary).hexdigest()[:12]
+
+
+def train_dictionary(samples: Iterable[bytes], size: int = 64 * 1024) -> bytes:
+    """Build a shared compression dictionary from sample payloads.
+
+    Uses zstd dictionary training when available. Otherwise the most frequent
+    samples are concatenated, with the most common last since zlib favours the
+    end of its preset dictionary.
+    """
+    samples = [s for s in samples if s]
+    if zstandard is not None and len(samples) >= 8:
+        try:
+            return zstandard.train_dictionary(size, samples).as_bytes()
+        except zstandard.ZstdError as e:
+            logger.warning(f"zstd dictionary training failed, using raw samples: {e}")
+    counts: dict[bytes, int] = {}
+    for sample in samples:
+        counts[sample] = counts.get(sample, 0) + 1
+    ordered = sorted(counts, key=counts.get)
+    return b"".join(ordered)[-min(size, ZLIB_MAX_DICT_BYTES) :]
+
+
+class CompressedSerializer(SerializerProtocol):
+    """Serde that compresses the output of another serde.
+
+    Args:
+        serde: Serializer producing the binary encoding, `JsonPlusSerializer` by default.
+        codec: "zstd" or "zlib". Falls back to zlib if `zstandard` is missing.
+        dictionaries: Every dictionary that may have been used to write existing
+            checkpoints. The last one is used for new writes.
+        level: Compression level.
+        min_bytes: Payloads smaller than this are stored uncompressed.
+    """
+
+    def __init__(
+        self,
+        serde: Optional[SerializerProtocol] = None,
+        codec: str = "zstd",
+        dictionaries: Iterable[bytes] = (),
+        level: int = 3,
+        min_bytes: int = DEFAULT_MIN_BYTES,
+    ) -> None:
+        if codec == "zstd" and zstandard is None:
+            logger.warning("zstandard is not installed, compressing checkpoints with zlib")
+            codec = "zlib"
+        if codec not in ("zstd", "zlib"):
+            raise ValueError(f"Invalid codec {codec}")
+        self.serde = serde or JsonPlusSerializer()
+        self.codec = codec
+        self.level = level
+        self.min_bytes = min_bytes
+        dictionaries = list(dictionaries)
+        self.dictionaries = {dictionary_id(d): d for d in dictionaries}
+        self.dictionary_id = dictionary_id(dictionaries[-1]) if dictionaries else None
+        self._zstd_dicts: dict[str, Any] = {}
+
+    def dumps_typed(self, obj: Any) -> tuple[str, bytes]:
+        type_, data = self.serde.dumps_typed(obj)
+        if len(data) < self.min_bytes:
+            return type_, data
+        tag = f"{self.codec}.{CODEC_VERSION}"
+        if self.dictionary_id:
+            tag += f".d{self.dictionary_id}"
+        return f"{type_}+{tag}", self._compress(data, self.codec, self.dictionary_id)
+
+    def loads_typed(self, data: tuple[str, bytes]) -> Any:
+        type_, payload = data
+        if "+" not in type_:
+            return self.serde.loads_typed(data)
+        inner_type, tag = type_.rsplit("+", 1)
+        codec, version, *rest = tag.split(".")
+        if version != CODEC_VERSION:
+            raise ValueError(f"Unsupported checkpoint codec version {tag}")
+        dict_id = rest[0][1:] if rest else None
+        return self.serde.loads_typed((inner_type, self._decompress(payload, codec, dict_id)))
+
+    def _dictionary(self, dict_id: Optional[str]) -> Optional[bytes]:
+        if dict_id is None:
+            return None
+        if dict_id not in self.dictionaries:
+            raise ValueError(f"Checkpoint was compressed with unknown dictionary {dict_id}")
+        return self.dictionaries[dict_id]
+
+    def _zstd_dict(self, dict_id: Optional[str]):
+        if dict_id is None:
+            return None
+        if dict_id not in self._zstd_dicts:
+            self._zstd_dicts[dict_id] = zstandard.ZstdCompressionDict(self._dictionary(dict_id))
+        return self._zstd_dicts[dict_id]
+
+    def _compress(self, data: bytes, codec: str, dict_id: Optional[str]) -> bytes:
+        if codec == "zstd":
+            return zstandard.ZstdCompressor(level=self.level, dict_data=self._zstd_dict(dict_id)).compress(data)
+        dictionary = self._dictionary(dict_id)
+        compressor = zlib.compressobj(self.level, zdict=dictionary[-ZLIB_MAX_DICT_BYTES:]) if dictionary else zlib.compressobj(self.level)
+        return compressor.compress(data) + compressor.flush()
+
+    def _decompress(self, data: bytes, codec: str, dict_id: Optional[str]) -> bytes:
+        if codec == "zstd":
+            if zstandard is None:
+                raise ValueError("Checkpoint is zstd compressed but zstandard is not installed")
+            return zstandard.ZstdDecompressor(dict_data=self._zstd_dict(dict_id)).decompress(data)
+        if codec == "zlib":
+            dictionary = self._dictionary(dict_id)
+            decompressor = zlib.decompressobj(zdict=dictionary[-ZLIB_MAX_DICT_BYTES:]) if dictionary else zlib.decompressobj()
+            return decompressor.decompress(data) + decompressor.flush()
+        raise ValueError(f"Unknown checkpoint codec {codec}")
+
+
+def load_dictionaries(directory: str) -> list[bytes]:
+    """Load every `*.dict` file in `directory`, oldest first."""
+    paths = sorted(Path(directory).glob("*.dict"), key=lambda p: p.stat().st_mtime)
+    return [p.read_bytes() for p in paths]
+
+
+def save_dictionary(dictionary: bytes, directory: str) -> Path:
+    """Write a dictionary next to the older ones so existing checkpoints stay readable."""
+    path = Path(directory) / f"{dictionary_id(dictionary)}.dict"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(dictionary)
+    return path
+
+
+def wine_record_samples(path: str) -> list[bytes]:
+    """Load wine records from a search response dump, one sample per record."""
+    with open(path, encoding="utf8") as f:
+        items = json.load(f)
+    return [json.dumps(item.get("data", item), ensure_ascii=False).encode("utf-8") for item in items]
+
+
+def benchmark(checkpoints: list[Any], serializers: dict[str, SerializerProtocol], rounds: int = 5) -> None:
+    """Print size, encode and decode time of each serializer over `checkpoints`."""
+    for name, serde in serializers.items():
+        encoded = [serde.dumps_typed(c) for c in checkpoints]
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for c in checkpoints:
+                serde.dumps_typed(c)
+        encode_ms = (time.perf_counter() - start) * 1000 / rounds
+        start = time.perf_counter()
+        for _ in range(rounds):
+            for e in encoded:
+                serde.loads_typed(e)
+        decode_ms = (time.perf_counter() - start) * 1000 / rounds
+        size = sum(len(data) for _, data in encoded)
+        print(f"{name:<16} {size:>12,} bytes  encode {encode_ms:8.2f}ms  decode {decode_ms:8.2f}ms")
+
+
+def _recorded_checkpoints(db_path: str) -> list[Any]:
+    # Same layout as `persistence.Database`, the dictionaries sit next to the database
+    dictionaries = load_dictionaries(str(Path(db_path).parent / "dictionaries"))
+    reader = CompressedSerializer(dictionaries=dictionaries)
+    with sqlite3.connect(db_path) as conn:
+        rows = conn.execute("SELECT type, checkpoint FROM checkpoints").fetchall()
+    return [reader.loads_typed(row) for row in rows]
+
+
+if __name__ == "__main__":
+    # python -m memory_agent.serde train <wine_records.json> <dictionary_dir>
+    # python -m memory_agent.serde bench <wine_records.json> [checkpoints.db]
+    command, records = sys.argv[1], sys.argv[2]
+    samples = wine_record_samples(records)
+    dictionary = train_dictionary(samples)
+    if command == "train":
+        print(f"Saved dictionary to {save_dictionary(dictionary, sys.argv[3])}")
+        sys.exit()
+
+    if len(sys.argv) > 3:
+        checkpoints = _recorded_checkpoints(sys.argv[3])
+    else:
+        from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+
+        # Synthetic session: every turn re-serialises the growing message list
+        messages = []
+        checkpoints = []
+        for turn in range(20):
+            messages += [
+                HumanMessage(f"red wine under {20 + turn * 5} dollars"),
+                ToolMessage("[" + ",".join(s.decode() for s in samples) + "]", tool_call_id=str(turn), name="wine_search"),
+                AIMessage("Here are a few bottles you might enjoy."),
+            ]
+            checkpoints.append({"channel_values": {"messages": list(messages)}})
+    serializers = {
+        "jsonplus": JsonPlusSerializer(),
+        "zlib": CompressedSerializer(codec="zlib"),
+        "zlib+dict": CompressedSerializer(codec="zlib", dictionaries=[dictionary]),
+    }
+    if zstandard is not None:
+        serializers["zstd"] = CompressedSerializer(codec="zstd")
+        serializers["zstd+dict"] = CompressedSerializer(codec="zstd", dictionaries=[dictionary])
+    benchmark(checkpoints, serializers)
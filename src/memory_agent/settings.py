@@ -7,9 +7,12 @@ from pydantic import EmailStr, SecretStr
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from dotenv import load_dotenv
 
+from memory_agent.logs import configure_logging
+
 load_dotenv()
 
-logging.basicConfig(format="%(asctime)s %(levelname)s %(name)s  %(message)s", level=logging.DEBUG)
+# Level from LOG_LEVEL, INFO by default; records are written from a background thread
+configure_logging()
 logging.getLogger("passlib.handlers.bcrypt").setLevel(logging.ERROR)
 
 
@@ -0,0 +1,322 @@
+"""Nearest-neighbour index over vintage taste vectors for "wines like X" queries.
+
+Every vintage becomes a vector of its six taste profiles, one-hot wine colour
+and type, log price and user rating. Numeric features are standardised over
+the catalog and every block is weighted by `FeatureWeights`, so a Euclidean
+distance compares wines on taste first. Small catalogs are searched exactly
+with NumPy; large ones use a `scipy` KD-tree when it is installed.
+
+The search API results lack the taste, colour and type of a vintage, so the
+index is built offline from a catalog export that has them. The chatbot offers
+the `similar_wines` tool once the index file exists:
+
+    python -m memory_agent.similarity build <vintage_catalog.json>
+    python -m memory_agent.similarity [catalog sizes...]  # benchmark
+"""
+
+import json
+import logging
+import math
+import sys
+import time
+import warnings
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterable, Optional, Self
+
+import numpy as np
+
+from memory_agent.enums import WineColorEnum, WineTypeEnum
+from memory_agent.settings import get_settings
+from memory_agent.taste import ALCOHOL_CODE_STEPS, TasteProfileName
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:  # pragma: no cover - optional dependency
+    cKDTree = None
+
+logger = logging.getLogger(__name__)
+s = get_settings()
+
+TASTE_FEATURES = [name.value for name in TasteProfileName]
+COLORS = [color.value for color in WineColorEnum]
+TYPES = [wine_type.value for wine_type in WineTypeEnum]
+FEATURE_NAMES = (
+    TASTE_FEATURES + [f"color_{c}" for c in COLORS] + [f"type_{t}" for t in TYPES] + ["log_price", "user_rating"]
+)
+# Catalogs above this size use the KD-tree when `backend="auto"`
+TREE_MIN_SIZE = 50_000
+
+SIMILARITY_INDEX_FILE = "similarity_index.npz"
+
+
+@dataclass(kw_only=True)
+class FeatureWeights:
+    """Relative weight of each feature block in the distance."""
+
+    taste: float = 1.0
+    """Weight of each standardised taste profile."""
+    color: float = 3.0
+    """Weight of the colour one-hot. High so a red is never "like" a white."""
+    wine_type: float = 2.0
+    """Weight of the wine type one-hot."""
+    price: float = 0.5
+    """Weight of the standardised log price."""
+    rating: float = 0.5
+    """Weight of the standardised user rating."""
+
+    def vector(self) -> np.ndarray:
+        return np.array(
+            [self.taste] * len(TASTE_FEATURES)
+            + [self.color] * len(COLORS)
+            + [self.wine_type] * len(TYPES)
+            + [self.price, self.rating]
+        )
+
+
+def _taste_values(vintage: dict) -> dict[str, Any]:
+    taste = vintage.get("taste") or {}
+    if isinstance(taste.get("profiles"), list):
+        return {p["name"]: p.get("step", p.get("value")) for p in taste["profiles"]}
+    return {name: taste.get(name, vintage.get(name)) for name in TASTE_FEATURES}
+
+
+def _price(vintage: dict) -> Optional[float]:
+    if vintage.get("price") is not None:
+        return vintage["price"]
+    prices = vintage.get("shopping_prices") or []
+    return prices[0]["price_amount"] if prices else None
+
+
+def vintage_features(vintage: dict) -> list[float]:
+    """Return the raw feature vector of a vintage, NaN where a value is missing."""
+    taste = _taste_values(vintage)
+    features = []
+    for name in TASTE_FEATURES:
+        value = taste.get(name)
+        if isinstance(value, str):
+            value = ALCOHOL_CODE_STEPS.get(value.upper())
+        features.append(math.nan if value is None else float(value))
+    color = vintage.get("wine_color") or vintage.get("color")
+    wine_type = vintage.get("wine_type") or vintage.get("type")
+    features += [float(color == c) for c in COLORS]
+    features += [float(wine_type == t) for t in TYPES]
+    price = _price(vintage)
+    features.append(math.log1p(price) if price is not None else math.nan)
+    rating = vintage.get("user_rating")
+    features.append(float(rating) if rating else math.nan)
+    return features
+
+
+class SimilarityIndex:
+    """Find the vintages closest to a given one.
+
+    Args:
+        ids: Vintage id of every row.
+        raw: Raw feature matrix from `vintage_features`, one row per vintage.
+        titles: Vintage titles, returned with the results.
+        weights: Weight of each feature block.
+        backend: "brute", "kdtree" or "auto" (KD-tree for catalogs above `TREE_MIN_SIZE`).
+    """
+
+    def __init__(
+        self,
+        ids: Iterable[str],
+        raw: np.ndarray,
+        titles: Iterable[str],
+        weights: Optional[FeatureWeights] = None,
+        backend: str = "auto",
+    ) -> None:
+        self.ids = np.asarray(list(ids), dtype=object)
+        self.titles = np.asarray(list(titles), dtype=object)
+        self.raw = np.asarray(raw, dtype=np.float64)
+        self.weights = weights or FeatureWeights()
+        self._rows = {vintage_id: row for row, vintage_id in enumerate(self.ids)}
+        self.vectors = self._scale(self.raw)
+        self.backend = self._pick_backend(backend)
+        self._tree = cKDTree(self.vectors) if self.backend == "kdtree" else None
+
+    @classmethod
+    def from_vintages(cls, vintages: Iterable[dict], **kwargs: Any) -> Self:
+        """Build an index from vintage records as returned by the search API."""
+        vintages = list(vintages)
+        raw = np.array([vintage_features(v) for v in vintages], dtype=np.float64).reshape(-1, len(FEATURE_NAMES))
+        return cls([str(v["id"]) for v in vintages], raw, [v.get("title", "") for v in vintages], **kwargs)
+
+    @classmethod
+    def load(cls, path: Path, **kwargs: Any) -> Self:
+        """Load an index written by `save`."""
+        with np.load(path) as data:
+            weights = FeatureWeights(**json.loads(str(data["weights"])))
+            return cls(data["ids"].tolist(), data["raw"], data["titles"].tolist(), weights=weights, **kwargs)
+
+    def save(self, path: Path) -> None:
+        # Unicode arrays rather than object arrays, so loading needs no pickle
+        np.savez(
+            path,
+            ids=self.ids.astype(str),
+            raw=self.raw,
+            titles=self.titles.astype(str),
+            weights=np.array(json.dumps(asdict(self.weights))),
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _scale(self, raw: np.ndarray) -> np.ndarray:
+        # Missing values get the catalog mean, i.e. they do not move the distance
+        numeric = np.r_[0 : len(TASTE_FEATURES), len(FEATURE_NAMES) - 2 : len(FEATURE_NAMES)]
+        vectors = raw.copy()
+        if len(vectors):
+            with warnings.catch_warnings():
+                # All-NaN columns ("Mean of empty slice") fall back to 0
+                warnings.simplefilter("ignore", RuntimeWarning)
+                mean = np.nan_to_num(np.nanmean(raw[:, numeric], axis=0))
+                std = np.nan_to_num(np.nanstd(raw[:, numeric], axis=0))
+            std[std == 0] = 1.0
+            columns = vectors[:, numeric]
+            columns = np.where(np.isnan(columns), mean, columns)
+            vectors[:, numeric] = (columns - mean) / std
+        return np.ascontiguousarray(vectors * self.weights.vector())
+
+    def _pick_backend(self, backend: str) -> str:
+        if backend not in ("auto", "brute", "kdtree"):
+            raise ValueError(f"Invalid similarity backend {backend}")
+        if backend == "auto":
+            backend = "kdtree" if len(self) >= TREE_MIN_SIZE else "brute"
+        if backend == "kdtree" and cKDTree is None:
+            logger.warning("scipy is not installed, using brute force similarity search")
+            backend = "brute"
+        return backend
+
+    def mask(self, filters: Optional[dict] = None) -> np.ndarray:
+        """Return the rows matching `filters`.
+
+        Supported keys, all optional: `wine_colors`, `wine_types`, `price_min`,
+        `price_max` and `user_rating` (minimum rating).
+        """
+        mask = np.ones(len(self), dtype=bool)
+        filters = filters or {}
+        if colors := filters.get("wine_colors"):
+            cols = [len(TASTE_FEATURES) + COLORS.index(str(c)) for c in colors if str(c) in COLORS]
+            mask &= self.raw[:, cols].any(axis=1)
+        if types := filters.get("wine_types"):
+            offset = len(TASTE_FEATURES) + len(COLORS)
+            cols = [offset + TYPES.index(str(t)) for t in types if str(t) in TYPES]
+            mask &= self.raw[:, cols].any(axis=1)
+        log_price = self.raw[:, -2]
+        if (price_min := filters.get("price_min")) is not None:
+            mask &= log_price >= math.log1p(price_min)
+        if (price_max := filters.get("price_max")) is not None:
+            mask &= log_price <= math.log1p(price_max)
+        if (rating := filters.get("user_rating")) is not None:
+            mask &= self.raw[:, -1] >= rating
+        return mask
+
+    def query(self, vintage_id: str, k: int = 10, filters: Optional[dict] = None) -> list[tuple[str, str, float]]:
+        """Return `(id, title, distance)` of the `k` vintages closest to `vintage_id`."""
+        if (row := self._rows.get(str(vintage_id))) is None:
+            raise ValueError(f"Unknown vintage {vintage_id}")
+        mask = self.mask(filters)
+        mask[row] = False
+        matching = int(mask.sum())
+        vector = self.vectors[row]
+        # A tree query returning mostly filtered-out rows is slower than a scan of the matches
+        if self._tree is not None and matching >= len(self) // 50:
+            result = self._tree_query(vector, mask, k, len(self) / max(matching, 1))
+        else:
+            result = None
+        rows, distances = result if result is not None else self._brute(vector, mask, k)
+        return [(self.ids[r], self.titles[r], float(d)) for r, d in zip(rows, distances)]
+
+    def _brute(self, vector: np.ndarray, mask: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        candidates = np.flatnonzero(mask)
+        if not len(candidates):
+            return candidates, np.empty(0)
+        diff = self.vectors[candidates] - vector
+        distances = np.einsum("ij,ij->i", diff, diff)
+        k = min(k, len(candidates))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return candidates[top], np.sqrt(distances[top])
+
+    def _tree_query(
+        self, vector: np.ndarray, mask: np.ndarray, k: int, oversample: float
+    ) -> Optional[tuple[np.ndarray, np.ndarray]]:
+        # Ask for enough neighbours that about 2k of them pass the filters. If the
+        # matches are not near the query (e.g. another colour), the caller scans them.
+        n = min(int(2 * (k + 1) * oversample), len(self))
+        distances, rows = self._tree.query(vector, k=n)
+        rows, distances = np.atleast_1d(rows), np.atleast_1d(distances)
+        keep = mask[rows]
+        if keep.sum() < k and n < len(self):
+            return None
+        return rows[keep][:k], distances[keep][:k]
+
+
+def build_similarity_index(catalog: Path, index_path: Optional[Path] = None) -> Path:
+    """Index a catalog export of search API items whose vintages include their taste."""
+    with open(catalog, encoding="utf8") as f:
+        items = json.load(f)
+    index = SimilarityIndex.from_vintages(
+        item["data"] for item in items if item.get("data_type", "vintage") == "vintage"
+    )
+    index_path = index_path or similarity_index_path()
+    index.save(index_path)
+    return index_path
+
+
+def similarity_index_path() -> Path:
+    """Return where `build_similarity_index` writes the index by default."""
+    return s.data_dir / SIMILARITY_INDEX_FILE
+
+
+@lru_cache
+def get_similarity_index() -> SimilarityIndex:
+    """Load the index written by `build_similarity_index`.
+
+    Raises:
+        FileNotFoundError: If no index was built.
+    """
+    return SimilarityIndex.load(similarity_index_path())
+
+
+def _synthetic_catalog(n: int, rng: np.random.Generator) -> np.ndarray:
+    raw = np.zeros((n, len(FEATURE_NAMES)))
+    raw[:, : len(TASTE_FEATURES)] = rng.uniform(0, 5, (n, len(TASTE_FEATURES)))
+    raw[np.arange(n), len(TASTE_FEATURES) + rng.integers(0, len(COLORS), n)] = 1
+    raw[np.arange(n), len(TASTE_FEATURES) + len(COLORS) + rng.integers(0, len(TYPES), n)] = 1
+    raw[:, -2] = np.log1p(rng.lognormal(3.3, 0.8, n))
+    raw[:, -1] = rng.uniform(3.0, 4.8, n)
+    return raw
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ["build"]:
+        print(f"Wrote {build_similarity_index(Path(sys.argv[2]))}")
+        sys.exit()
+    sizes = [int(n) for n in sys.argv[1:]] or [100_000, 1_000_000]
+    rng = np.random.default_rng(0)
+    for n in sizes:
+        raw = _synthetic_catalog(n, rng)
+        ids = [str(i) for i in range(n)]
+        queries = [str(i) for i in rng.integers(0, n, 50)]
+        for backend in ("brute", "kdtree"):
+            start = time.perf_counter()
+            index = SimilarityIndex(ids, raw, ids, backend=backend)
+            build_s = time.perf_counter() - start
+            start = time.perf_counter()
+            results = [index.query(q, k=10) for q in queries]
+            query_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            start = time.perf_counter()
+            for q in queries:
+                # "Like X but under $40": same colour as X
+                color = COLORS[int(raw[int(q), len(TASTE_FEATURES) : len(TASTE_FEATURES) + len(COLORS)].argmax())]
+                index.query(q, k=10, filters={"wine_colors": [color], "price_max": 40})
+            filtered_ms = (time.perf_counter() - start) * 1000 / len(queries)
+            print(
+                f"{n:>9,} {index.backend:<6} build {build_s:6.2f}s  "
+                f"query {query_ms:8.2f}ms  filtered {filtered_ms:8.2f}ms  "
+                f"top distance {results[0][0][2]:.3f}"
+            )
@@ -1,10 +1,13 @@
 import json
 import logging
+from bisect import bisect_right
+from collections import Counter
 from enum import Enum
 from functools import lru_cache
+from pathlib import Path
 from typing import Annotated, Any, Self
 
-from pydantic import BaseModel, Field, HttpUrl, model_validator
+from pydantic import BaseModel, ConfigDict, Field, HttpUrl, model_validator
 from slugify import slugify
 
 from memory_agent.constants import (
@@ -31,6 +34,30 @@ class TasteProfileName(str, Enum):
     alcohol = "alcohol"
 
 
+ALCOHOL_CODE_STEPS = {code: step for step, (_, code) in enumerate(alcohol_adj)}
+ALCOHOL_CODE_NAMES = {
+    "VL": "Very Low",
+    "L": "Low",
+    "M": "Medium",
+    "MH": "Medium High",
+    "H": "High",
+    "VH": "Very High",
+}
+ALCOHOL_CODE_ADJ = {code: adj for adj, code in alcohol_adj}
+
+# Sorted upper bounds and their adjectives, one pair per numeric profile
+ADJ_LOOKUP: dict[TasteProfileName, tuple[list[float], list[str]]] = {
+    name: ([value for _, value in adj_list], [adj for adj, _ in adj_list])
+    for name, adj_list in (
+        (TasteProfileName.sweetness, sweetness_adj),
+        (TasteProfileName.intensity, intensity_adj),
+        (TasteProfileName.body, body_adj),
+        (TasteProfileName.acidity, acidity_adj),
+        (TasteProfileName.tannin, tannin_adj),
+    )
+}
+
+
 class TasteProfile(BaseModel):
     name: TasteProfileName
     step: Annotated[float, Field(ge=0, le=5)] | None = None
@@ -44,21 +71,41 @@ class TasteProfile(BaseModel):
             values["text"] = get_adj_text_for_taste_profile(values["name"], values["value"])
 
             if values["name"] == TasteProfileName.alcohol and isinstance(values["value"], str):
-                values["step"] = ["VL", "L", "M", "MH", "H", "VH"].index(values["value"].upper())
-                values["value"] = {
-                    "VL": "Very Low",
-                    "L": "Low",
-                    "M": "Medium",
-                    "MH": "Medium High",
-                    "H": "High",
-                    "VH": "Very High",
-                }.get(values["value"], "")
+                values["step"], values["value"] = _parse_alcohol_code(values["value"])
 
             if "step" not in values:
                 values["step"] = values.get("value", 0)
 
         return cls(**values)
 
+    @classmethod
+    def parse_column(cls, name: TasteProfileName, values: list[Any]) -> list[Self]:
+        """Parse the values of one profile across many vintages.
+
+        Equivalent to `parse(dict(name=name, value=value))` for each value, but each
+        distinct value is parsed and validated once and then copied.
+        """
+        parsed: dict[tuple[type, Any], Self] = {}
+        profiles = []
+        for value in values:
+            key = (type(value), value)
+            try:
+                profile = parsed.get(key)
+            except TypeError:  # unhashable value
+                profiles.append(cls.parse(dict(name=name, value=value)))
+                continue
+            if profile is None:
+                profile = parsed[key] = cls.parse(dict(name=name, value=value))
+            profiles.append(profile.model_copy())
+        return profiles
+
+
+def _parse_alcohol_code(code: str) -> tuple[int, str]:
+    step = ALCOHOL_CODE_STEPS.get(code.upper())
+    if step is None:
+        raise ValueError(f"{code.upper()!r} is not in list")
+    return step, ALCOHOL_CODE_NAMES.get(code, "")
+
 
 class TasteFlavor(BaseModel):
     group: str | None = None
@@ -73,16 +120,52 @@ class TasteFlavor(BaseModel):
 
 
 class Aroma(BaseModel):
+    # Frozen so one instance can be shared by every vintage listing the aroma
+    model_config = ConfigDict(frozen=True)
+
     slug: str = Field(default=..., description="Lowercase with hyphens")
     display_name: str = Field(default=..., description="initial caps with spaces")
     image_url: HttpUrl
 
     @classmethod
     def from_name(cls, name: str) -> Self:
-        """Input `Aroma` name, lowercase with spaces"""
-        slug = slugify(name)
-        # TODO: a few aromas share the same image data and we may not benefit from caching with this implementation
-        return cls(slug=slugify(name), display_name=name.title(), image_url=f"{AROMAS_IMAGE_ROOT}/{slug}.webp")  # type: ignore
+        """Input `Aroma` name, lowercase with spaces. Returns the interned instance."""
+        return _intern_aroma(normalise_aroma_name(name))
+
+
+AROMA_CATALOG_SIZE = 4096
+
+
+def normalise_aroma_name(name: str) -> str:
+    return " ".join(name.split()).lower()
+
+
+@lru_cache(maxsize=AROMA_CATALOG_SIZE)
+def _intern_aroma(name: str) -> Aroma:
+    slug = slugify(name)
+    return Aroma(slug=slug, display_name=name.title(), image_url=_aroma_image_url(slug))
+
+
+@lru_cache(maxsize=AROMA_CATALOG_SIZE)
+def _aroma_image_url(slug: str) -> HttpUrl:
+    # Aromas that slugify to the same name share one image URL
+    return HttpUrl(f"{AROMAS_IMAGE_ROOT}/{slug}.webp")
+
+
+@lru_cache(maxsize=1)
+def preload_aroma_catalog() -> int:
+    """Intern an `Aroma` for every sub group of the flavor group mapping.
+
+    Called at startup, runs once per process; returns the number of aromas interned.
+    """
+    try:
+        names = get_flavor_group_mapping().keys()
+    except FileNotFoundError as e:
+        logger.warning(f"Cannot preload aroma catalog: {e}")
+        return 0
+    for name in names:
+        Aroma.from_name(name)
+    return _intern_aroma.cache_info().currsize
 
 
 class Taste(BaseModel):
@@ -109,32 +192,123 @@ class Taste(BaseModel):
         profiles = [TasteProfile.parse(dict(name=key, value=values.get(key, 0))) for key in TasteProfileName]
 
         aromas = values.get("flavors") or values.get("aromas") or []
-        flavors = [TasteFlavor.parse(flavor) for flavor in aromas] if aromas else []
-        merged_flavors = []
-        for flavor in flavors:
-            for f in merged_flavors:
-                if f.group == flavor.group:
-                    f.sub_groups.extend(flavor.sub_groups)
-                    break
-            else:
-                merged_flavors.append(flavor)
+        return cls(profiles=profiles, flavors=_merge_flavors(aromas), aromas=aromas)
+
+    @classmethod
+    def parse_many(cls, values_list: list[dict]) -> list[Self]:
+        """Parse a whole result page, one profile column at a time.
+
+        Gives the same result as `[Taste.parse(values) for values in values_list]`.
+        """
+        columns = [
+            TasteProfile.parse_column(key, [values.get(key, 0) for values in values_list])
+            for key in TasteProfileName
+        ]
+        tastes = []
+        for values, profiles in zip(values_list, zip(*columns)):
+            aromas = values.get("flavors") or values.get("aromas") or []
+            tastes.append(cls(profiles=list(profiles), flavors=_merge_flavors(aromas), aromas=aromas))
+        return tastes
+
+
+def _merge_flavors(aromas: list[str]) -> list[TasteFlavor]:
+    # Groups keep the order in which they are first seen
+    merged: dict[str | None, TasteFlavor] = {}
+    for aroma in aromas or []:
+        flavor = TasteFlavor.parse(aroma)
+        if (existing := merged.get(flavor.group)) is not None:
+            existing.sub_groups.extend(flavor.sub_groups)
+        else:
+            merged[flavor.group] = flavor
+    return list(merged.values())
+
+
+FLAVOR_MAPPING_FILE = "flavor_group_mapping.json"
+FLAVOR_INDEX_FILE = "flavor_groups.json"
+"""Compact index file in `weight_dir`, built offline with `python -m memory_agent.taste build-index`."""
+MAX_UNKNOWN_SUB_GROUPS = 1024
+
+
+class FlavorIndex:
+    """Two-way lookup between flavor sub groups and their group.
+
+    Args:
+        groups: Sub groups of every group, e.g. `{"citrus": ["lemon", "lime"]}`.
+    """
+
+    def __init__(self, groups: dict[str, list[str]]) -> None:
+        self.group_to_sub_groups: dict[str, tuple[str, ...]] = {g: tuple(subs) for g, subs in groups.items()}
+        self.sub_group_to_group: dict[str, str] = {
+            sub: group for group, subs in self.group_to_sub_groups.items() for sub in subs
+        }
+        self.unknown_sub_groups: Counter[str] = Counter()
+        """Number of lookups of each sub group missing from the index, for the first `MAX_UNKNOWN_SUB_GROUPS`."""
+        self.unknown_overflow = 0
+        """Lookups of missing sub groups beyond `MAX_UNKNOWN_SUB_GROUPS` distinct ones."""
+
+    @classmethod
+    def from_mapping(cls, mapping: dict[str, str]) -> Self:
+        """Build the index from a flat `{sub_group: group}` mapping."""
+        groups: dict[str, list[str]] = {}
+        for sub_group, group in mapping.items():
+            groups.setdefault(group, []).append(sub_group)
+        return cls(groups)
 
-        return cls(profiles=profiles, flavors=merged_flavors, aromas=aromas)
+    @classmethod
+    def load(cls, path: Path) -> Self:
+        """Load an index written by `save`."""
+        with open(path, encoding="utf8") as f:
+            return cls(json.load(f))
+
+    def save(self, path: Path) -> None:
+        """Write the index grouped by flavor group, so each group name is stored once."""
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(self.group_to_sub_groups, f, ensure_ascii=False, separators=(",", ":"))
+
+    def group(self, sub_group: str) -> str:
+        """Return the group of `sub_group`, or "" if it is unknown."""
+        if group := self.sub_group_to_group.get(sub_group):
+            return group
+        if sub_group not in self.unknown_sub_groups and len(self.unknown_sub_groups) >= MAX_UNKNOWN_SUB_GROUPS:
+            self.unknown_overflow += 1
+            return ""
+        self.unknown_sub_groups[sub_group] += 1
+        if self.unknown_sub_groups[sub_group] == 1:
+            logger.warning(f"⚠ Invalid sub group {sub_group}")
+        return ""
+
+    def sub_groups(self, group: str) -> tuple[str, ...]:
+        """Return every sub group of `group`."""
+        return self.group_to_sub_groups.get(group, ())
+
+
+def build_flavor_index(weight_dir: Path = s.weight_dir) -> Path:
+    """Write the compact index of the flavor group mapping, offline after the mapping changes."""
+    with open(weight_dir / FLAVOR_MAPPING_FILE, encoding="utf8") as f:
+        index = FlavorIndex.from_mapping(json.load(f))
+    path = weight_dir / FLAVOR_INDEX_FILE
+    index.save(path)
+    return path
 
 
 @lru_cache
+def get_flavor_index() -> FlavorIndex:
+    """Load the compact flavor index, or the mapping itself if the index is missing or stale."""
+    compact = s.weight_dir / FLAVOR_INDEX_FILE
+    source = s.weight_dir / FLAVOR_MAPPING_FILE
+    if compact.exists() and (not source.exists() or compact.stat().st_mtime >= source.stat().st_mtime):
+        return FlavorIndex.load(compact)
+    logger.warning(f"{compact} is missing or stale, run `python -m memory_agent.taste build-index`")
+    with open(source, encoding="utf8") as f:
+        return FlavorIndex.from_mapping(json.load(f))
+
+
 def get_flavor_group_mapping() -> dict[str, str]:
-    file = s.weight_dir / "flavor_group_mapping.json"
-    with open(file, encoding="utf8") as f:
-        return json.load(f)
+    return get_flavor_index().sub_group_to_group
 
 
 def get_group_from_sub_groups(sub_group: str) -> str:
-    if group := get_flavor_group_mapping().get(sub_group):
-        return group
-
-    logger.warning(f"⚠ Invalid sub group {sub_group}")
-    return ""
+    return get_flavor_index().group(sub_group)
 
 
 def get_adj_text_for_taste_profile(profile_name: TasteProfileName, value: float) -> str:
@@ -142,27 +316,14 @@ def get_adj_text_for_taste_profile(profile_name: TasteProfileName, value: float)
         return f"No {profile_name.value.title()}"
 
     if profile_name == TasteProfileName.alcohol:
-        for adj, adj_value in alcohol_adj:
-            if adj_value == value:
-                return adj
+        if adj := ALCOHOL_CODE_ADJ.get(value):
+            return adj
     else:
-        if profile_name == TasteProfileName.sweetness:
-            adj_list = sweetness_adj
-        elif profile_name == TasteProfileName.intensity:
-            adj_list = intensity_adj
-        elif profile_name == TasteProfileName.body:
-            adj_list = body_adj
-        elif profile_name == TasteProfileName.acidity:
-            adj_list = acidity_adj
-        elif profile_name == TasteProfileName.tannin:
-            adj_list = tannin_adj
-        else:
+        if profile_name not in ADJ_LOOKUP:
             raise ValueError(f"Invalid profile name {profile_name}")
-
-        for adj, adj_value in adj_list:
-            if value < adj_value:
-                return adj
-        return adj_list[-1][0]
+        thresholds, adjs = ADJ_LOOKUP[profile_name]
+        # First adjective whose upper bound is strictly greater than the value
+        return adjs[min(bisect_right(thresholds, value), len(adjs) - 1)]
 
     raise ValueError(f"Invalid value {value} for profile {profile_name}")
 
@@ -181,3 +342,32 @@ class TasteFlavorOut(BaseModel):
 class TasteOut(BaseModel):
     profiles: list[TasteProfileOut] = Field(default_factory=list)
     flavors: list[TasteFlavorOut] = Field(default_factory=list)
+
+
+if __name__ == "__main__":
+    # python -m memory_agent.taste build-index  # after updating flavor_group_mapping.json
+    # python -m memory_agent.taste              # parsing benchmark
+    import random
+    import sys
+    import timeit
+
+    if sys.argv[1:] == ["build-index"]:
+        print(f"Wrote {build_flavor_index()}")
+        sys.exit()
+
+    # Benchmark a result page of vintages with the value distribution of the search API
+    rng = random.Random(0)
+    page = [
+        {
+            **{name.value: rng.choice([0, 1.0, 2.5, 3.2, 3.6, 4.1, 4.8]) for name in TasteProfileName if name != TasteProfileName.alcohol},
+            TasteProfileName.alcohol.value: rng.choice(["L", "M", "MH", "H"]),
+        }
+        for _ in range(50)
+    ]
+    assert Taste.parse_many(page) == [Taste.parse(dict(values)) for values in page]
+    for label, fn in (
+        ("Taste.parse per item", lambda: [Taste.parse(dict(values)) for values in page]),
+        ("Taste.parse_many", lambda: Taste.parse_many(page)),
+    ):
+        seconds = min(timeit.repeat(fn, number=20, repeat=5)) / 20
+        print(f"{label:<22} {seconds * 1000:.3f}ms per page of {len(page)}")
@@ -1,10 +1,18 @@
-from langchain_core.tools import tool
+from langchain_core.tools import ToolException, tool
 from pydantic import BaseModel, Field
 import httpx
 import logging
+import os
+import time
 from pprint import pprint
 import json
 from memory_agent.utils import format_data_to_string
+from memory_agent.blobs import BlobRef, MissingBlobError, hydrate
+from memory_agent.keywords import keyword_reference
+from memory_agent.logs import Sampler, Truncated
+from memory_agent.similarity import get_similarity_index
+from memory_agent.metrics import SEARCH_SECONDS
+from memory_agent.tracing import get_tracer
 from typing import Self
 from enum import Enum
 from memory_agent.settings import get_settings
@@ -21,6 +29,8 @@ from pydantic import AfterValidator, Field
 
 
 logger = logging.getLogger(__name__)
+# Share of successful searches logged at DEBUG
+_search_log_sampler = Sampler(float(os.getenv("LOG_SAMPLE_SEARCH", "0.1")))
 
 s = get_settings()
 
@@ -224,22 +234,36 @@ def query_ai_service(
         url = "https://api.dev.vinovoss.com/api/v2/vintages/search"
         #https://api.dev.vinovoss.com/_/ai/80/search
     
-        response = httpx.request(method=method, url=url, json=data.model_dump(), timeout=timeout)
+        with get_tracer().span(f"{method} /api/v2/vintages/search", kind="http", url=url) as span:
+            start = time.perf_counter()
+            try:
+                response = httpx.request(method=method, url=url, json=data.model_dump(), timeout=timeout)
+            except httpx.RequestError:
+                SEARCH_SECONDS.labels("error").observe(time.perf_counter() - start)
+                raise
+            SEARCH_SECONDS.labels(str(response.status_code)).observe(time.perf_counter() - start)
+            if span is not None:
+                span.set(
+                    status_code=response.status_code,
+                    request_bytes=len(response.request.content),
+                    response_bytes=len(response.content),
+                )
 
         if response.is_success:
-            logger.debug(   
-                f"query_ai_service(url={url}, payload={data})\n"
-                f" -> Took {response.elapsed.total_seconds()}s\n"
-                f" -> {response.status_code} {response.json()}"
-            )
-            return response.json()["items"]
+            items = response.json()["items"]
+            if logger.isEnabledFor(logging.DEBUG) and _search_log_sampler():
+                logger.debug(
+                    "query_ai_service(url=%s, payload=%s) -> %s in %.3fs, %d items: %s",
+                    url, Truncated(data), response.status_code, response.elapsed.total_seconds(), len(items), Truncated(items),
+                )
+            return items
 
         logger.error(
-            f"query_ai_service(url={url}, data={data})\n" f" -> [{response.status_code}] {response.text}"
+            "query_ai_service(url=%s, data=%s) -> [%s] %s", url, Truncated(data), response.status_code, Truncated(response.text)
         )
         response.raise_for_status()
     except httpx.RequestError as e:
-        logger.warning(f"Failed to query AI service: {e}")
+        logger.warning("Failed to query AI service: %s", e)
         raise
 from typing import List, TypedDict
 from typing_extensions import Annotated
@@ -250,7 +274,7 @@ from langgraph.prebuilt import InjectedState
 
 class AgentStateWithWines(TypedDict):
     messages: List[BaseMessage]
-    wines: list[dict] | None
+    wines: list[dict] | BlobRef | None
     is_last_step: IsLastStep
     remaining_steps: RemainingSteps
 
@@ -270,9 +294,12 @@ def process_wine_data(wine_data):
         if item["data_type"] == "vintage":
             wine = item["data"]
             processed_wine = {
+                "id": wine["id"],
                 "title": wine["title"],
+                "vintage_year": wine.get("vintage_year"),
                 "user_rating": wine["user_rating"],
                 "region": wine["region"],
+                "country": wine.get("country"),
                 "price": wine["shopping_prices"][0]["price_amount"] if wine["shopping_prices"] else None
             }
             processed_data.append(processed_wine)
@@ -280,7 +307,6 @@ def process_wine_data(wine_data):
     return processed_data
 
 
-@tool("wine_search")
 def wine_search(
     query: str,
     filters: Filters | dict | None = None,
@@ -294,61 +320,8 @@ def wine_search(
     This tool queries the Vinovoss wine database to find wines matching specific criteria
     such as type, price range, taste profile, region, or occasion.
 
-    region_varietals:
-    - region: Bordeaux
-        red_varietals: [ Cabernet Sauvignon, Merlot, Cabernet Franc, Petit Verdot, Malbec ]
-        white_varietals: [ Sauvignon Blanc, Semillon ]
-        common_styles: [ Dry, Full-bodied, Medium-bodied, Tannic, Oaked ]
-
-    - region: Burgundy
-        red_varietals: [ Pinot Noir ]
-        white_varietals: [ Chardonnay ]
-        common_styles: [ Light-bodied, Medium-bodied, Earthy, Mineral ]
-
-    - region: Champagne
-        red_varietals: [ Pinot Noir, Pinot Meunier ]
-        white_varietals: [ Chardonnay ]
-        common_styles: [ Sparkling, Traditional Method, Dry, Off-dry ]
-
-    - region: Rhone Valley
-        red_varietals: [ Syrah, Grenache, Mourvedre ]
-        white_varietals: [ Viognier, Marsanne, Roussanne ]
-        common_styles: [ Full-bodied, Spicy, Herbal ]
-
-    varietal_styles:
-    - varietal: Cabernet Sauvignon
-        common_styles: [ Full-bodied, Tannic, Oaked, Red ]
-        typical_regions: [ Bordeaux, Napa Valley, Margaret River ]
-
-    - varietal: Merlot
-        common_styles: [ Medium-bodied, Red, Fruity ]
-        typical_regions: [ Bordeaux, Napa Valley ]
-
-    - varietal: Pinot Noir
-        common_styles: [ Light-bodied, Medium-bodied, Red, Earthy ]
-        typical_regions: [ Burgundy, Willamette Valley, Marlborough ]
-
-    - varietal: Chardonnay
-        common_styles: [ Medium-bodied, Full-bodied, White, Oaked, Unoaked ]
-        typical_regions: [ Burgundy, Napa Valley, Margaret River ]
-
-    food_pairings:  
-    - food_category: Meat
-        foods: [ beef, steak, lamb, pork, chicken, duck, game ]
-        wine_styles: [ Red, Full-bodied, Medium-bodied, Tannic ]
-
-    - food_category: Seafood
-        foods: [ fish, salmon, tuna, halibut, shellfish, shrimp, lobster, crab, oysters ]
-        wine_styles: [ White, Light-bodied, Crisp, Dry ]
-
-    - food_category: Cheese
-        foods: [ soft cheese, hard cheese, blue cheese, goat cheese, cheddar, brie, gouda ]
-        wine_styles: [ Varied, depending on cheese type ]
-
-    - food_category: Dessert
-        foods: [ chocolate, fruit tart, crème brûlée, cake, ice cream ]
-        wine_styles: [ Sweet, Fortified, Late Harvest ]
-    
+    {keyword_reference}
+
     Search query pattern format:
         - pattern: "{Region} {Varietal}"
             examples: [ "Bordeaux Cabernet Sauvignon", "Napa Valley Chardonnay" ]
@@ -422,21 +395,28 @@ def wine_search(
         data.removed_filters = removed_filters
     elif removed_filters is None:
         data.removed_filters = Filters()
-    print("Get wine data from Vinovoss search API.")
+    logger.debug("Get wine data from Vinovoss search API.")
     response = query_ai_service(data=data)
     return process_wine_data(response)
 
 
+# The foods, grapes and regions the model can search for come from the keyword data file
+wine_search.__doc__ = wine_search.__doc__.replace(
+    "{keyword_reference}", keyword_reference().replace("\n", "\n    ")
+)
+wine_search = tool("wine_search")(wine_search)
+
+
 @tool("sort_wines")
 def sort_wines(
-    wines: list[dict],
+    wines: list[dict] | BlobRef,
     sort_by: SortBy,
     descending: bool = False
 ) -> list[dict]:
     """Sort wines by price, rating, vintage, etc.
     
     Args:
-        wines (list[dict]): List of wines to sort.
+        wines (list[dict] | BlobRef): List of wines to sort, or a reference to it in the blob store.
         sort_by (SortBy): Sort by recommended, price, price-desc, rating, rating-desc, rating_count, rating_count-desc, title, or title-desc.
         descending (bool, optional): Sort in descending order. Defaults to False.
     Returns:
@@ -453,10 +433,55 @@ def sort_wines(
         SortBy.title: lambda w: w["title"].lower(),  # pyright: ignore [reportAssignmentType]. Overlap with the title() method but we need to keep it
         SortBy.title_desc: lambda w: -w["title"].lower(),
     }[sort_by]
-    print("Sorting wines by", sort_by)
+    logger.debug("Sorting wines by %s", sort_by)
+    try:
+        wines = hydrate(wines)
+    except MissingBlobError as e:
+        raise ToolException("These search results are no longer stored, run wine_search again to sort them.") from e
     return sorted(wines, key=key_fn, reverse=descending)
 
 
+# Return ToolException messages to the model instead of failing the turn
+sort_wines.handle_tool_error = True
+
+
+@tool("similar_wines")
+def similar_wines(
+    vintage_id: str,
+    k: int = 5,
+    filters: Filters | dict | None = None,
+) -> list[dict]:
+    """Find wines with a taste, style and price close to a given wine.
+
+    Args:
+        vintage_id (str): `id` of the wine, as returned by `wine_search`.
+        k (int, optional): Number of wines to return. Defaults to 5.
+        filters (Filters | dict, optional): Only wine_colors, wine_types, price_min,
+            price_max and user_rating (minimum) are applied.
+    Returns:
+        list[dict]: The closest wines first, with their id, title and distance.
+    """
+    if isinstance(filters, Filters):
+        filters = filters.model_dump(mode="json", exclude_none=True)
+    elif isinstance(filters, str):
+        filters = json.loads(filters)
+    try:
+        index = get_similarity_index()
+    except FileNotFoundError as e:
+        raise ToolException(
+            "No similarity index built, run `python -m memory_agent.similarity build <catalog.json>`. "
+            "Use wine_search with the user's request instead."
+        ) from e
+    try:
+        results = index.query(vintage_id, k=k, filters=filters)
+    except ValueError as e:
+        raise ToolException(f"{e}, use wine_search with the user's request instead.") from e
+    return [{"id": id_, "title": title, "distance": round(distance, 3)} for id_, title, distance in results]
+
+
+similar_wines.handle_tool_error = True
+
+
 if __name__ == "__main__":
     # Create search parameters
     params = SearchParams(query="red wine under 200")
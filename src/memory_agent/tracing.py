@@ -0,0 +1,416 @@
+"""Hierarchical timing spans of a conversation turn.
+
+A turn is one trace. Its spans cover the graph run, every graph node, tool call,
+model call and HTTP request below it, with their duration and attributes such
+as payload sizes, token counts and cache hits. Spans of graph runs come from
+`TracingCallbackHandler`, other code opens them with `Tracer.span`, which nests
+under the span that is current in the calling context.
+
+Tracing is off unless `TRACE_EXPORT` is `jsonl` or `otlp`; finished traces are
+then appended to a file in `TRACE_DIR`. Print where the time of a turn went with
+
+    python -m memory_agent.tracing critical-path traces/spans.jsonl [trace_id]
+"""
+
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import asdict, dataclass, field
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Iterator, Optional, Protocol
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+logger = logging.getLogger(__name__)
+
+_current_span: ContextVar[Optional["Span"]] = ContextVar("current_span", default=None)
+
+
+@dataclass
+class Span:
+    name: str
+    kind: str
+    """One of graph, node, tool, llm, http or internal."""
+    trace_id: str
+    span_id: str = field(default_factory=lambda: secrets.token_hex(8))
+    parent_id: Optional[str] = None
+    start: float = field(default_factory=time.time)
+    end: Optional[float] = None
+    attributes: dict[str, Any] = field(default_factory=dict)
+    error: Optional[str] = None
+
+    @property
+    def duration(self) -> float:
+        return (self.end or time.time()) - self.start
+
+    def set(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+
+class SpanExporter(Protocol):
+    def export(self, spans: list[Span]) -> None: ...
+
+
+class JsonlExporter:
+    """Append spans to a file, one JSON object per line."""
+
+    def __init__(self, path: Path) -> None:
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+    def export(self, spans: list[Span]) -> None:
+        lines = "".join(json.dumps(asdict(s), ensure_ascii=False, default=str) + "\n" for s in spans)
+        with self._lock, open(self.path, "a", encoding="utf8") as f:
+            f.write(lines)
+
+
+def _otlp_value(value: Any) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _from_otlp_value(value: dict) -> Any:
+    (kind, v), = value.items()
+    return int(v) if kind == "intValue" else v
+
+
+_OTLP_KINDS = {"http": 3, "llm": 3}  # SPAN_KIND_CLIENT, everything else SPAN_KIND_INTERNAL
+
+
+class OtlpJsonExporter(JsonlExporter):
+    """Append each trace as an OTLP/JSON `ExportTraceServiceRequest` line.
+
+    The format of the OpenTelemetry collector's file exporter, which its file
+    receiver and most tracing backends can import.
+    """
+
+    def __init__(self, path: Path, service_name: str = "wine-chatbot") -> None:
+        super().__init__(path)
+        self.service_name = service_name
+
+    def export(self, spans: list[Span]) -> None:
+        request = {
+            "resourceSpans": [
+                {
+                    "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+                    "scopeSpans": [{"scope": {"name": __name__}, "spans": [self._span(s) for s in spans]}],
+                }
+            ]
+        }
+        with self._lock, open(self.path, "a", encoding="utf8") as f:
+            f.write(json.dumps(request, ensure_ascii=False) + "\n")
+
+    @staticmethod
+    def _span(span: Span) -> dict:
+        attributes = {"span.kind": span.kind, **span.attributes}
+        result = {
+            "traceId": span.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": _OTLP_KINDS.get(span.kind, 1),
+            "startTimeUnixNano": str(int(span.start * 1e9)),
+            "endTimeUnixNano": str(int((span.end or span.start) * 1e9)),
+            "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None],
+            "status": {"code": 2, "message": span.error} if span.error else {"code": 1},
+        }
+        if span.parent_id:
+            result["parentSpanId"] = span.parent_id
+        return result
+
+
+class Tracer:
+    """Collect the spans of each trace and export them when its root span ends.
+
+    Args:
+        exporter: Destination of finished traces. Without one, spans are not recorded.
+    """
+
+    def __init__(self, exporter: Optional[SpanExporter] = None) -> None:
+        self.exporter = exporter
+        self._traces: dict[str, list[Span]] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.exporter is not None
+
+    def start_span(self, name: str, kind: str = "internal", parent: Optional[Span] = None, **attributes: Any) -> Span:
+        parent = parent or _current_span.get()
+        span = Span(
+            name=name,
+            kind=kind,
+            trace_id=parent.trace_id if parent else secrets.token_hex(16),
+            parent_id=parent.span_id if parent else None,
+            attributes=attributes,
+        )
+        with self._lock:
+            self._traces.setdefault(span.trace_id, []).append(span)
+        return span
+
+    def end_span(self, span: Span, error: Optional[BaseException] = None) -> None:
+        span.end = time.time()
+        if error is not None:
+            span.error = repr(error)
+        if span.parent_id is None:
+            with self._lock:
+                spans = self._traces.pop(span.trace_id, [])
+            try:
+                self.exporter.export(spans)
+            except OSError as e:
+                logger.warning(f"Cannot export trace {span.trace_id}: {e}")
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes: Any) -> Iterator[Optional[Span]]:
+        """Time the enclosed block as a child of the current span, or yield None if tracing is off."""
+        if not self.enabled:
+            yield None
+            return
+        span = self.start_span(name, kind, **attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, e)
+            raise
+        else:
+            self.end_span(span)
+        finally:
+            _current_span.reset(token)
+
+
+def current_span() -> Optional[Span]:
+    """Return the innermost open span of the calling context, e.g. to record a cache hit on it."""
+    return _current_span.get()
+
+
+def _content_size(value: Any) -> int:
+    content = getattr(value, "content", value)
+    return len(content) if isinstance(content, (str, list)) else len(str(content))
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Record graph runs, graph nodes, tools and model calls as spans.
+
+    Chains that are not a graph or one of its nodes are not recorded; their
+    children are attached to the closest recorded ancestor.
+    """
+
+    def __init__(self, tracer: Tracer) -> None:
+        self.tracer = tracer
+        # run id -> (span, span current before it, whether the run opened the span);
+        # chains that are not recorded map to the span of their closest recorded ancestor
+        self._runs: dict[UUID, tuple[Optional[Span], Optional[Span], bool]] = {}
+        self._lock = threading.Lock()
+
+    def _parent(self, parent_run_id: Optional[UUID]) -> Optional[Span]:
+        if parent_run_id is not None and parent_run_id in self._runs:
+            return self._runs[parent_run_id][0]
+        return _current_span.get()
+
+    def _start(self, run_id: UUID, parent_run_id: Optional[UUID], name: str, kind: str, **attributes: Any) -> None:
+        with self._lock:
+            parent = self._parent(parent_run_id)
+            span = self.tracer.start_span(name, kind, parent=parent, **attributes)
+            self._runs[run_id] = (span, parent, True)
+        # Callbacks run in the context of the traced code, so spans opened there nest under this one
+        _current_span.set(span)
+
+    def _end(self, run_id: UUID, error: Optional[BaseException] = None, **attributes: Any) -> None:
+        with self._lock:
+            span, parent, owned = self._runs.pop(run_id, (None, None, False))
+        if not owned:
+            return
+        span.set(**attributes)
+        self.tracer.end_span(span, error)
+        _current_span.set(parent)
+
+    def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, tags=None, metadata=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "chain")
+        if parent_run_id is None:
+            thread_id = (metadata or {}).get("thread_id")
+            self._start(run_id, parent_run_id, name, "graph", **({"thread_id": thread_id} if thread_id else {}))
+        elif (metadata or {}).get("langgraph_node") == name and any(t.startswith("graph:step:") for t in tags or []):
+            self._start(run_id, parent_run_id, name, "node")
+        else:
+            with self._lock:
+                self._runs[run_id] = (self._parent(parent_run_id), None, False)
+
+    def on_chain_end(self, outputs, *, run_id, **kwargs):
+        self._end(run_id)
+
+    def on_chain_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+        name = kwargs.get("name") or (serialized or {}).get("name", "tool")
+        self._start(run_id, parent_run_id, name, "tool", input_chars=len(input_str or ""))
+
+    def on_tool_end(self, output, *, run_id, **kwargs):
+        self._end(run_id, output_chars=_content_size(output))
+
+    def on_tool_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = (metadata or {}).get("ls_model_name") or kwargs.get("name") or (serialized or {}).get("name", "llm")
+        prompt_chars = sum(_content_size(m) for batch in messages for m in batch)
+        self._start(run_id, parent_run_id, name, "llm", prompt_chars=prompt_chars)
+
+    def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+        name = (metadata or {}).get("ls_model_name") or kwargs.get("name") or (serialized or {}).get("name", "llm")
+        self._start(run_id, parent_run_id, name, "llm", prompt_chars=sum(map(len, prompts)))
+
+    def on_llm_end(self, response: LLMResult, *, run_id, **kwargs):
+        attributes: dict[str, Any] = {}
+        generations = [g for batch in response.generations for g in batch]
+        usage = [getattr(getattr(g, "message", None), "usage_metadata", None) for g in generations]
+        if any(usage):
+            attributes["input_tokens"] = sum(u.get("input_tokens", 0) for u in usage if u)
+            attributes["output_tokens"] = sum(u.get("output_tokens", 0) for u in usage if u)
+            cached = sum((u.get("input_token_details") or {}).get("cache_read", 0) for u in usage if u)
+            if cached:
+                attributes["cached_tokens"] = cached
+        attributes["completion_chars"] = sum(len(g.text or "") for g in generations)
+        self._end(run_id, **attributes)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._end(run_id, error)
+
+
+def _exporter_from_env() -> Optional[SpanExporter]:
+    export = os.getenv("TRACE_EXPORT", "").lower()
+    directory = Path(os.getenv("TRACE_DIR", "traces"))
+    if export == "jsonl":
+        return JsonlExporter(directory / "spans.jsonl")
+    if export == "otlp":
+        return OtlpJsonExporter(directory / "traces.otlp.jsonl")
+    if export:
+        logger.warning(f"Unknown TRACE_EXPORT {export!r}, tracing is off")
+    return None
+
+
+@lru_cache
+def get_tracer() -> Tracer:
+    return Tracer(_exporter_from_env())
+
+
+def tracing_callbacks() -> list[BaseCallbackHandler]:
+    """Callbacks to add to a graph's config, none when tracing is off."""
+    tracer = get_tracer()
+    return [TracingCallbackHandler(tracer)] if tracer.enabled else []
+
+
+def load_spans(path: Path) -> list[dict]:
+    """Read spans written by either exporter, as dicts in the `Span` layout."""
+    spans = []
+    with open(path, encoding="utf8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if "resourceSpans" not in record:
+                spans.append(record)
+                continue
+            for resource in record["resourceSpans"]:
+                for scope in resource["scopeSpans"]:
+                    for s in scope["spans"]:
+                        attributes = {a["key"]: _from_otlp_value(a["value"]) for a in s.get("attributes", [])}
+                        spans.append(
+                            {
+                                "name": s["name"],
+                                "kind": attributes.pop("span.kind", "internal"),
+                                "trace_id": s["traceId"],
+                                "span_id": s["spanId"],
+                                "parent_id": s.get("parentSpanId"),
+                                "start": int(s["startTimeUnixNano"]) / 1e9,
+                                "end": int(s["endTimeUnixNano"]) / 1e9,
+                                "attributes": attributes,
+                                "error": s.get("status", {}).get("message"),
+                            }
+                        )
+    return spans
+
+
+def critical_path(spans: list[dict]) -> list[tuple[int, dict, float]]:
+    """Return `(depth, span, self_seconds)` along the critical path of one trace, in time order.
+
+    Walking back from the end of a span, the path takes the child that
+    finished last, then the child that finished last before that one started,
+    and so on, and repeats this within each of those children. Children that
+    ran in parallel with a longer one are left out. Self time is the part of a
+    span not covered by its children on the path.
+    """
+    children: dict[Optional[str], list[dict]] = {}
+    for span in spans:
+        children.setdefault(span["parent_id"], []).append(span)
+    roots = children.get(None, [])
+    if not roots:
+        return []
+
+    path: list[tuple[int, dict, float]] = []
+
+    def visit(span: dict, depth: int) -> None:
+        chain, cursor = [], span["end"]
+        kids = sorted(children.get(span["span_id"], []), key=lambda s: s["end"], reverse=True)
+        for kid in kids:
+            # Clock resolution can put a child's end a little after its parent's
+            if kid["end"] <= cursor + 1e-3:
+                chain.append(kid)
+                cursor = kid["start"]
+        chain.reverse()
+        covered = sum(min(k["end"], span["end"]) - max(k["start"], span["start"]) for k in chain)
+        path.append((depth, span, max(span["end"] - span["start"] - covered, 0.0)))
+        for kid in chain:
+            visit(kid, depth + 1)
+
+    visit(max(roots, key=lambda s: s["end"] - s["start"]), 0)
+    return path
+
+
+def _print_critical_path(path: Path, trace_id: Optional[str] = None) -> None:
+    spans = load_spans(path)
+    if not spans:
+        print(f"No spans in {path}")
+        return
+    if trace_id is None:
+        # The most recent turn
+        trace_id = max((s for s in spans if s["parent_id"] is None), key=lambda s: s["end"])["trace_id"]
+    trace = [s for s in spans if s["trace_id"] == trace_id]
+    steps = critical_path(trace)
+    if not steps:
+        print(f"Trace {trace_id} has no root span")
+        return
+    total = steps[0][1]["end"] - steps[0][1]["start"]
+    print(f"Trace {trace_id}: {len(trace)} spans, {total * 1000:.0f}ms")
+    print(f"{'span':<48} {'kind':<8} {'total':>9} {'self':>9} {'share':>6}  attributes")
+    for depth, span, self_time in steps:
+        duration = span["end"] - span["start"]
+        attributes = span["attributes"]
+        label = ("  " * depth + span["name"])[:48]
+        print(
+            f"{label:<48} {span['kind']:<8} {duration * 1000:>7.0f}ms {self_time * 1000:>7.0f}ms "
+            f"{duration / total if total else 0:>6.0%}  {attributes or ''}{' ERROR ' + span['error'] if span.get('error') else ''}"
+        )
+
+
+if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) < 3 or sys.argv[1] != "critical-path":
+        print("usage: python -m memory_agent.tracing critical-path <spans file> [trace_id]")
+        sys.exit(1)
+    _print_critical_path(Path(sys.argv[2]), sys.argv[3] if len(sys.argv) > 3 else None)
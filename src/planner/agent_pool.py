@@ -0,0 +1,75 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable
+
+logger = logging.getLogger(__name__)
+
+AgentKey = tuple[str, tuple[str, ...], str]
+
+
+@dataclass
+class AgentPoolMetrics:
+    hits: int = 0
+    misses: int = 0
+    compile_seconds: dict[AgentKey, float] = field(default_factory=dict)
+    """Time spent building and compiling each pooled agent."""
+
+    @property
+    def total_compile_seconds(self) -> float:
+        return sum(self.compile_seconds.values())
+
+
+class AgentPool:
+    """Build each agent once and reuse it for every plan step.
+
+    Agents are keyed on (agent type, tool names, prompt template). A compiled
+    agent graph keeps no per-run state, so one instance can be invoked from
+    several threads at once.
+
+    Args:
+        factory: Called as `factory(agent_type, tools, prompt_template)` on a miss.
+    """
+
+    def __init__(self, factory: Callable[[str, list, str], Any]) -> None:
+        self.factory = factory
+        self.metrics = AgentPoolMetrics()
+        self._agents: dict[AgentKey, Any] = {}
+        self._lock = threading.Lock()
+        self._key_locks: dict[AgentKey, threading.Lock] = {}
+
+    @staticmethod
+    def key(agent_type: str, tools: list, prompt_template: str) -> AgentKey:
+        return agent_type, tuple(getattr(t, "name", repr(t)) for t in tools), prompt_template
+
+    def get(self, agent_type: str, tools: list, prompt_template: str) -> Any:
+        """Return the pooled agent, building it on first use."""
+        key = self.key(agent_type, tools, prompt_template)
+        if (agent := self._agents.get(key)) is not None:
+            self.metrics.hits += 1
+            return agent
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        # One build per key; other keys can compile concurrently
+        with key_lock:
+            if (agent := self._agents.get(key)) is not None:
+                self.metrics.hits += 1
+                return agent
+            start = time.perf_counter()
+            agent = self.factory(agent_type, tools, prompt_template)
+            elapsed = time.perf_counter() - start
+            self.metrics.misses += 1
+            self.metrics.compile_seconds[key] = elapsed
+            self._agents[key] = agent
+        logger.info(f"Compiled {agent_type} agent with tools {list(key[1])} in {elapsed:.3f}s")
+        return agent
+
+    def clear(self) -> None:
+        """Drop every pooled agent, e.g. after the model configuration changed."""
+        with self._lock:
+            self._agents.clear()
+            self._key_locks.clear()
+
+    def __len__(self) -> int:
+        return len(self._agents)
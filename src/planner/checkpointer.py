@@ -0,0 +1,312 @@
+"""Checkpointer of the planner graph with a bounded memory tier and a SQLite tier.
+
+Running threads are checkpointed in memory. The memory tier holds at most
+`max_threads` threads and `max_memory_mb` of serialized state; the least
+recently used thread is dropped first, and threads idle for `ttl_seconds` are
+dropped as well. A thread waiting for human feedback is written to SQLite as
+soon as it is interrupted, so it survives eviction and restarts and is loaded
+back into memory when it is resumed. The copy is deleted by the first
+checkpoint after the interrupt, so a later eviction never brings back the
+interrupted state of a thread that has moved on.
+"""
+
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from memory_agent.metrics import MeasuredCheckpointer
+from memory_agent.retention import CheckpointRetention, RetentionPolicy
+
+logger = logging.getLogger(__name__)
+
+# Resume latencies kept per tier for the percentiles
+LATENCY_SAMPLES = 1000
+# Channel of the pending writes `interrupt()` leaves on a checkpoint
+INTERRUPT_CHANNEL = "__interrupt__"
+
+
+@dataclass(kw_only=True)
+class CheckpointerLimits:
+    """Bounds of the memory tier."""
+
+    max_threads: int = 256
+    """Threads kept in memory."""
+    ttl_seconds: float = 3600
+    """Threads not read or written for this long are dropped from memory."""
+    max_memory_mb: float = 256
+    """Serialized checkpoints, channel values and writes kept in memory."""
+
+
+@dataclass
+class CheckpointerMetrics:
+    memory_hits: int = 0
+    disk_hits: int = 0
+    misses: int = 0
+    spilled: int = 0
+    """Interrupted checkpoints written to SQLite."""
+    evicted: int = 0
+    expired: int = 0
+    resume_seconds: dict[str, deque] = field(
+        default_factory=lambda: {"memory": deque(maxlen=LATENCY_SAMPLES), "disk": deque(maxlen=LATENCY_SAMPLES)}
+    )
+    """Time to load an interrupted thread, per tier."""
+
+    def resume_percentile(self, tier: str, q: float) -> Optional[float]:
+        samples = sorted(self.resume_seconds[tier])
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+
+@dataclass
+class _ThreadUsage:
+    last_access: float
+    bytes: int = 0
+
+
+def _copy(checkpoint: CheckpointTuple, put: Callable, put_writes: Callable) -> None:
+    """Write a checkpoint and its pending writes with the `put` and `put_writes` of another saver."""
+    configurable = checkpoint.config["configurable"]
+    parent = checkpoint.parent_config or {
+        "configurable": {"thread_id": configurable["thread_id"], "checkpoint_ns": configurable.get("checkpoint_ns", "")}
+    }
+    # Every channel is new to the other saver
+    saved = put(parent, checkpoint.checkpoint, checkpoint.metadata, checkpoint.checkpoint["channel_versions"])
+    by_task: dict[str, list[tuple[str, Any]]] = {}
+    for task_id, channel, value in checkpoint.pending_writes or []:
+        by_task.setdefault(task_id, []).append((channel, value))
+    for task_id, writes in by_task.items():
+        put_writes(saved, writes, task_id)
+
+
+def _interrupted(checkpoint: Optional[CheckpointTuple]) -> bool:
+    return bool(checkpoint and any(channel == INTERRUPT_CHANNEL for _, channel, _ in checkpoint.pending_writes or []))
+
+
+class TieredCheckpointer(InMemorySaver):
+    """In-memory checkpointer that spills interrupted threads to a durable saver.
+
+    Args:
+        durable: Saver of interrupted threads, e.g. a `SqliteSaver`.
+        limits: Bounds of the memory tier.
+    """
+
+    def __init__(self, durable: BaseCheckpointSaver, limits: Optional[CheckpointerLimits] = None) -> None:
+        super().__init__()
+        self.durable = durable
+        self.limits = limits or CheckpointerLimits()
+        self.metrics = CheckpointerMetrics()
+        self._usage: OrderedDict[str, _ThreadUsage] = OrderedDict()
+        self._bytes = 0
+        # Threads in memory whose interrupted checkpoint is also in the durable saver
+        self._durable_threads: set[str] = set()
+        # Graph runs write from several threads, InMemorySaver itself is not locked
+        self._lock = threading.RLock()
+
+    @property
+    def memory_bytes(self) -> int:
+        return self._bytes
+
+    def _touch(self, thread_id: str, added: int = 0) -> None:
+        usage = self._usage.get(thread_id)
+        if usage is None:
+            usage = self._usage[thread_id] = _ThreadUsage(last_access=0.0)
+        usage.last_access = time.monotonic()
+        usage.bytes += added
+        self._bytes += added
+        self._usage.move_to_end(thread_id)
+
+    def _drop(self, thread_id: str) -> None:
+        usage = self._usage.pop(thread_id, None)
+        if usage is not None:
+            self._bytes -= usage.bytes
+        self._durable_threads.discard(thread_id)
+        super().delete_thread(thread_id)
+
+    def _enforce_limits(self, keep: str) -> None:
+        """Drop expired threads, then the least recently used ones, never `keep`."""
+        now = time.monotonic()
+        for thread_id, usage in list(self._usage.items()):
+            if now - usage.last_access <= self.limits.ttl_seconds:
+                break
+            if thread_id != keep:
+                self._drop(thread_id)
+                self.metrics.expired += 1
+        max_bytes = self.limits.max_memory_mb * 2**20
+        while len(self._usage) > self.limits.max_threads or self._bytes > max_bytes:
+            thread_id = next(iter(self._usage))
+            if thread_id == keep:
+                if len(self._usage) == 1:
+                    break
+                self._usage.move_to_end(keep)
+                continue
+            logger.info(f"Evicting planner thread {thread_id} from memory ({self._bytes / 2**20:.1f}MB in memory)")
+            self._drop(thread_id)
+            self.metrics.evicted += 1
+
+    # The byte counts below read the serialized values InMemorySaver keeps in
+    # `storage`, `blobs` and `writes`. These are not a public API; the tests
+    # check the accounting so that a change of their layout is caught.
+    def _put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = config["configurable"]["thread_id"]
+        checkpoint_ns = config["configurable"]["checkpoint_ns"]
+        stored, stored_metadata, _ = self.storage[thread_id][checkpoint_ns][checkpoint["id"]]
+        added = len(stored[1]) + len(stored_metadata[1])
+        added += sum(len(self.blobs[(thread_id, checkpoint_ns, k, v)][1]) for k, v in new_versions.items())
+        self._touch(thread_id, added)
+        return saved
+
+    def _put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        configurable = config["configurable"]
+        key = (configurable["thread_id"], configurable.get("checkpoint_ns", ""), configurable["checkpoint_id"])
+
+        def size() -> int:
+            return sum(len(value[1]) for _, _, value, _ in self.writes.get(key, {}).values())
+
+        before = size()
+        super().put_writes(config, writes, task_id, task_path)
+        self._touch(configurable["thread_id"], size() - before)
+
+    def put(self, config: RunnableConfig, checkpoint: Checkpoint, metadata: CheckpointMetadata, new_versions: ChannelVersions) -> RunnableConfig:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            saved = self._put(config, checkpoint, metadata, new_versions)
+            if thread_id in self._durable_threads:
+                # The thread was resumed, its durable copy is stale
+                self.durable.delete_thread(thread_id)
+                self._durable_threads.discard(thread_id)
+            self._enforce_limits(keep=thread_id)
+            return saved
+
+    def put_writes(self, config: RunnableConfig, writes: Sequence[tuple[str, Any]], task_id: str, task_path: str = "") -> None:
+        thread_id = config["configurable"]["thread_id"]
+        with self._lock:
+            self._put_writes(config, writes, task_id, task_path)
+            if any(channel == INTERRUPT_CHANNEL for channel, _ in writes):
+                self._spill(thread_id)
+            self._enforce_limits(keep=thread_id)
+
+    def _spill(self, thread_id: str) -> None:
+        """Write the latest checkpoint of every namespace of a thread to the durable saver."""
+        spilled = set()
+        # Newest first within each namespace
+        for checkpoint in super().list({"configurable": {"thread_id": thread_id}}):
+            checkpoint_ns = checkpoint.config["configurable"].get("checkpoint_ns", "")
+            if checkpoint_ns in spilled:
+                continue
+            spilled.add(checkpoint_ns)
+            _copy(checkpoint, self.durable.put, self.durable.put_writes)
+            self._durable_threads.add(thread_id)
+            self.metrics.spilled += 1
+
+    def _load(self, thread_id: str) -> bool:
+        """Copy the latest checkpoint of every namespace of a thread from the durable saver."""
+        loaded = set()
+        for checkpoint in self.durable.list({"configurable": {"thread_id": thread_id}}):
+            checkpoint_ns = checkpoint.config["configurable"].get("checkpoint_ns", "")
+            if checkpoint_ns in loaded:
+                continue
+            loaded.add(checkpoint_ns)
+            _copy(checkpoint, self._put, self._put_writes)
+        if loaded:
+            self._durable_threads.add(thread_id)
+        return bool(loaded)
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = config["configurable"]["thread_id"]
+        start = time.perf_counter()
+        with self._lock:
+            tier = "memory"
+            if thread_id in self._usage:
+                self.metrics.memory_hits += 1
+                self._touch(thread_id)
+            elif self._load(thread_id):
+                tier = "disk"
+                self.metrics.disk_hits += 1
+                self._enforce_limits(keep=thread_id)
+            else:
+                self.metrics.misses += 1
+                return None
+            checkpoint = super().get_tuple(config)
+            if checkpoint is None and tier == "disk":
+                # An older checkpoint than the latest one, only kept on disk
+                checkpoint = self.durable.get_tuple(config)
+        if _interrupted(checkpoint):
+            elapsed = time.perf_counter() - start
+            self.metrics.resume_seconds[tier].append(elapsed)
+            logger.debug(f"Loaded interrupted planner thread {thread_id} from {tier} in {elapsed * 1000:.1f}ms")
+        return checkpoint
+
+    def list(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> Iterator[CheckpointTuple]:
+        with self._lock:
+            if config is not None and config["configurable"]["thread_id"] not in self._usage:
+                checkpoints = list(self.durable.list(config, filter=filter, before=before, limit=limit))
+            else:
+                checkpoints = list(super().list(config, filter=filter, before=before, limit=limit))
+                if config is None:
+                    in_memory = set(self._usage)
+                    checkpoints += [
+                        c
+                        for c in self.durable.list(None, filter=filter, before=before)
+                        if c.config["configurable"]["thread_id"] not in in_memory
+                    ]
+                    checkpoints = checkpoints[:limit] if limit is not None else checkpoints
+        yield from checkpoints
+
+    def delete_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._drop(thread_id)
+            self.durable.delete_thread(thread_id)
+
+
+class MeasuredTieredCheckpointer(MeasuredCheckpointer, TieredCheckpointer):
+    metrics_name = "planner"
+
+
+def create_planner_checkpointer(
+    db_path: str = "state_db/planner.db", limits: Optional[CheckpointerLimits] = None
+) -> TieredCheckpointer:
+    """Checkpointer backed by a SQLite database that keeps the latest checkpoint of each thread."""
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    durable = SqliteSaver(conn)
+    durable.setup()
+    # Interrupted plans only resume from their latest checkpoint
+    retention = CheckpointRetention(durable, RetentionPolicy(keep_last=1, thread_ttl_seconds=7 * 24 * 3600))
+    retention.start()
+    return MeasuredTieredCheckpointer(durable, limits)
+
+
+def checkpointer_from_env() -> TieredCheckpointer:
+    return create_planner_checkpointer(
+        db_path=os.getenv("PLANNER_CHECKPOINT_DB", "state_db/planner.db"),
+        limits=CheckpointerLimits(
+            max_threads=int(os.getenv("PLANNER_MAX_THREADS", "256")),
+            ttl_seconds=float(os.getenv("PLANNER_THREAD_TTL_SECONDS", "3600")),
+            max_memory_mb=float(os.getenv("PLANNER_MAX_MEMORY_MB", "256")),
+        ),
+    )
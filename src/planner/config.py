@@ -14,6 +14,7 @@ class Configuration:
 
     max_plan_iterations: int = 1  # Maximum number of plan iterations
     max_step_num: int = 3  # Maximum number of steps in a plan
+    report_narrative: bool = False  # Ask the LLM for a short introduction above the report table
 
     @classmethod
     def from_runnable_config(
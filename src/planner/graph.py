@@ -1,17 +1,20 @@
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.memory import MemorySaver
 from nodes import (coordinator_node, planner_node, reporter_node, research_team_node, 
-                        researcher_node, coder_node, human_feedback_node)
+                        researcher_node, coder_node, calculator_node, human_feedback_node)
 from nodes import State
+from checkpointer import checkpointer_from_env
+from memory_agent.ledger import ledger_callbacks
+from memory_agent.metrics import metrics_callbacks
+from memory_agent.profiling import profiling_callbacks
+from memory_agent.tracing import tracing_callbacks
 
 
 
 
 def build_graph_with_memory():
     """Build and return the agent workflow graph with memory."""
-    # use persistent memory to save conversation history
-
-    memory = MemorySaver()
+    # Running plans stay in a bounded memory tier, interrupted plans are also saved to SQLite
+    memory = checkpointer_from_env()
 
     builder = StateGraph(State)
     builder.add_edge(START, "coordinator")
@@ -21,7 +24,10 @@ def build_graph_with_memory():
     builder.add_node("research_team", research_team_node)
     builder.add_node("researcher", researcher_node)
     builder.add_node("coder", coder_node)
+    builder.add_node("calculator", calculator_node)
     builder.add_node("human_feedback", human_feedback_node)
     builder.add_edge("reporter", END)
 
-    return builder.compile(checkpointer=memory)
\ No newline at end of file
+    return builder.compile(checkpointer=memory).with_config(
+        callbacks=[*tracing_callbacks(), *ledger_callbacks(), *metrics_callbacks(), *profiling_callbacks()]
+    )
\ No newline at end of file
@@ -8,6 +8,8 @@ from pydantic import BaseModel, Field
 class StepType(str, Enum):
     RESEARCH = "research"
     PROCESSING = "processing"
+    QUANTITY = "quantity"
+    """Bottles for a known guest count, answered by the event calculator without an LLM."""
 
 
 class Step(BaseModel):
@@ -19,6 +21,32 @@ class Step(BaseModel):
         default=None, description="The Step execution result"
     )
 
+class WineRecord(BaseModel):
+    """A wine found by a research step, as returned by `wine_search`."""
+
+    id: Optional[str] = None
+    title: str
+    description: Optional[str] = None
+    vintage_year: Optional[int] = None
+    region: Optional[str] = None
+    country: Optional[str] = None
+    user_rating: Optional[float] = None
+    price: Optional[float] = None
+    wine_color: Optional[str] = None
+    """Colour the search was filtered on, when it was a single one."""
+    wine_type: Optional[str] = None
+    """Type the search was filtered on, when it was a single one."""
+
+
+class QuantityRecord(BaseModel):
+    """Bottles of one wine decided by a processing step."""
+
+    title: str
+    quantity: int
+    price: Optional[float] = None
+    subtotal: Optional[float] = None
+
+
 class Plan(BaseModel):
     has_enough_context: bool
     thought: str
@@ -2,21 +2,28 @@ from typing import Any, Dict, Optional, Annotated, Literal
 from langchain.schema import AIMessage, HumanMessage
 from langchain_core.runnables import RunnableConfig
 from langgraph.graph import MessagesState
-from models import Plan
+from models import Plan, QuantityRecord, WineRecord
 import logging
 from template import apply_prompt_template
 from langchain.chat_models import init_chat_model
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langgraph.types import Command, interrupt
+from langgraph.config import get_stream_writer
+from pydantic import ValidationError
 import os
 from memory_agent.tools import wine_search
 from langchain_core.tools import tool
 from langchain_core.messages import HumanMessage, AIMessage, ToolMessage
 from config import Configuration
 import json
-from utils import repair_json_output
+from utils import parse_json_output
 from models import StepType
-from tools import python_repl_tool
+from tools import estimate_event_wine, python_repl_tool, select_wines_within_budget
+from memory_agent.event_calculator import estimate_event, format_event_estimate, parse_event_request
+from agent_pool import AgentPool
+from step_cache import step_cache
+from memory_agent.tracing import current_span
+from report import records_from_allocations, records_from_messages, render_report_rows, title_key
 
 logger = logging.getLogger(__name__)
 
@@ -50,6 +57,9 @@ def create_agent(agent_name: str, tools: list, prompt_template: str):
     )
 
 
+agent_pool = AgentPool(create_agent)
+
+
 class State(MessagesState):
     """State for the agent system, extends MessagesState with next field."""
 
@@ -57,6 +67,8 @@ class State(MessagesState):
     plan_iterations: int = 0
     current_plan: Plan | str = None
     final_report: str = ""
+    wine_records: list[WineRecord] = []
+    quantity_records: list[QuantityRecord] = []
 
 
 @tool
@@ -174,35 +186,71 @@ def human_feedback_node(
     plan_iterations = state["plan_iterations"] if state.get("plan_iterations", 0) else 0
     goto = "research_team"
     try:
-        current_plan = repair_json_output(current_plan)
-        # increment the plan iterations
-        plan_iterations += 1
-        # parse the plan
-        new_plan = json.loads(current_plan)
-        if new_plan["has_enough_context"]:
-            goto = "reporter"
-    except json.JSONDecodeError:
-        logger.warning("Planner response is not a valid JSON")
+        # The planner stores a Plan, older checkpoints may hold its JSON
+        new_plan = current_plan if isinstance(current_plan, Plan) else Plan.model_validate(parse_json_output(current_plan))
+    except (json.JSONDecodeError, ValidationError) as e:
+        # Not JSON, or JSON that is not a plan, e.g. an array or missing fields
+        logger.warning(f"Planner response is not a valid plan: {e}")
         if plan_iterations > 0:
             return Command(goto="reporter")
         else:
             return Command(goto="__end__")
+    # increment the plan iterations
+    plan_iterations += 1
+    if new_plan.has_enough_context:
+        goto = "reporter"
 
     return Command(
         update={
-            "current_plan": Plan.model_validate(new_plan),
+            "current_plan": new_plan,
             "plan_iterations": plan_iterations
         },
         goto=goto,
     )
 
-def reporter_node(state: State):
+def reporter_node(state: State, config: RunnableConfig):
     """Wine Report Generator node that creates a formatted markdown table.
     
     Generates a markdown table with the following columns:
     Wine Name, Description, Vintage Year, Region, Country, User Rating,
     Price per Bottle, Estimated Quantity, Total Price"""
     logger.info("Reporter write final report")
+    wine_records = state.get("wine_records", [])
+    quantity_records = state.get("quantity_records", [])
+    if not quantity_records:
+        # No typed quantities to render, e.g. the coder decided them in prose or
+        # the agents answered from memory; the observations hold the selection
+        return _llm_report(state)
+
+    # Rows are streamed to `stream_mode="custom"` consumers as they are rendered
+    try:
+        writer = get_stream_writer()
+    except RuntimeError:  # called outside of a graph run
+        writer = None
+    lines = []
+    for line in render_report_rows(wine_records, quantity_records):
+        if writer:
+            writer({"report_row": line})
+        lines.append(line)
+    final_report = "\n".join(lines)
+
+    if Configuration.from_runnable_config(config).report_narrative:
+        current_plan = state.get("current_plan")
+        response = llm_model.invoke(
+            [
+                HumanMessage(
+                    f"Write a short introduction of at most three sentences for this wine plan.\n\n"
+                    f"# {current_plan.title}\n\n{final_report}"
+                )
+            ]
+        )
+        final_report = f"{response.content}\n\n{final_report}"
+    logger.info(f"reporter rendered {len(lines) - 2} rows")
+
+    return {"final_report": final_report}
+
+
+def _llm_report(state: State):
     current_plan = state.get("current_plan")
     input_ = {
         "messages": [
@@ -243,10 +291,11 @@ def reporter_node(state: State):
 
 def research_team_node(
     state: State,
-) -> Command[Literal["planner", "researcher", "coder"]]:
+) -> Command[Literal["planner", "researcher", "coder", "calculator"]]:
     """Wine Research Team node that coordinates between:
     - Wine Data Retriever (researcher) for finding wines using wine_search
-    - Python Calculator (coder) for quantity and cost calculations
+    - Event Calculator (calculator) for bottle quantities of a known guest count
+    - Python Calculator (coder) for other quantity and cost calculations
     - Wine Event Planner (planner) for plan refinement"""
     logger.info("Research team is collaborating on tasks.")
     current_plan = state.get("current_plan")
@@ -260,12 +309,49 @@ def research_team_node(
             # Execute this step
             if step.step_type == StepType.RESEARCH:
                 return Command(goto="researcher")
+            # Quantity steps without a guest count are left to the coder
+            elif step.step_type == StepType.QUANTITY and parse_event_request(f"{step.title}\n{step.description}"):
+                return Command(goto="calculator")
             else:
                 return Command(goto="coder")
 
     return Command(goto="planner")
 
 
+def calculator_node(state: State) -> Command[Literal["research_team"]]:
+    """Event calculator node that answers bottle quantity steps without an LLM call."""
+    current_plan = state.get("current_plan")
+    current_step = next((step for step in current_plan.steps if not step.execution_res), None)
+    request = current_step and parse_event_request(f"{current_step.title}\n{current_step.description}")
+    if not request:
+        logger.warning("Calculator found no quantity step to execute")
+        return Command(goto="research_team")
+
+    wines = [wine.model_dump(exclude_none=True) for wine in _wines_to_allocate(state)]
+    logger.info(f"Calculating step: {current_step.title}, request: {request}, {len(wines)} wines")
+    estimate = estimate_event(**request, wines=wines)
+    response_content = format_event_estimate(estimate)
+    current_step.execution_res = response_content
+    return Command(
+        update={
+            "messages": [HumanMessage(content=response_content, name="calculator")],
+            "observations": state.get("observations", []) + [response_content],
+            "quantity_records": state.get("quantity_records", []) + records_from_allocations(estimate.allocations),
+        },
+        goto="research_team",
+    )
+
+
+def _wines_to_allocate(state: State) -> list[WineRecord]:
+    """Wines found so far, only those already given a quantity if there are any."""
+    wines: dict[str, WineRecord] = {}
+    for wine in state.get("wine_records", []):
+        wines.setdefault(title_key(wine.title), wine)
+    if chosen := {title_key(q.title) for q in state.get("quantity_records", [])}:
+        return [wine for key, wine in wines.items() if key in chosen]
+    return list(wines.values())
+
+
 def _execute_agent_step(
     state: State, agent, agent_name: str
 ) -> Command[Literal["research_team"]]:
@@ -309,37 +395,50 @@ def _execute_agent_step(
         ]
     }
 
-    # Invoke the agent
-    default_recursion_limit = 25
-    try:
-        env_value_str = os.getenv("AGENT_RECURSION_LIMIT", str(default_recursion_limit))
-        parsed_limit = int(env_value_str)
-
-        if parsed_limit > 0:
-            recursion_limit = parsed_limit
-            logger.info(f"Recursion limit set to: {recursion_limit}")
-        else:
+    # Identical steps of other plans and threads reuse the earlier result
+    cache_key = step_cache.key(agent_name, current_step, completed_steps) if step_cache.cacheable(agent_name) else None
+    cached = step_cache.get(cache_key) if cache_key else None
+    if (span := current_span()) is not None:
+        span.set(step_cache_hit=cached is not None)
+    if cached is not None:
+        logger.info(f"Step '{current_step.title}' served from the step cache")
+        response_content, wine_records, quantity_records = cached
+    else:
+        # Invoke the agent
+        default_recursion_limit = 25
+        try:
+            env_value_str = os.getenv("AGENT_RECURSION_LIMIT", str(default_recursion_limit))
+            parsed_limit = int(env_value_str)
+
+            if parsed_limit > 0:
+                recursion_limit = parsed_limit
+                logger.info(f"Recursion limit set to: {recursion_limit}")
+            else:
+                logger.warning(
+                    f"AGENT_RECURSION_LIMIT value '{env_value_str}' (parsed as {parsed_limit}) is not positive. "
+                    f"Using default value {default_recursion_limit}."
+                )
+                recursion_limit = default_recursion_limit
+        except ValueError:
+            raw_env_value = os.getenv("AGENT_RECURSION_LIMIT")
             logger.warning(
-                f"AGENT_RECURSION_LIMIT value '{env_value_str}' (parsed as {parsed_limit}) is not positive. "
+                f"Invalid AGENT_RECURSION_LIMIT value: '{raw_env_value}'. "
                 f"Using default value {default_recursion_limit}."
             )
             recursion_limit = default_recursion_limit
-    except ValueError:
-        raw_env_value = os.getenv("AGENT_RECURSION_LIMIT")
-        logger.warning(
-            f"Invalid AGENT_RECURSION_LIMIT value: '{raw_env_value}'. "
-            f"Using default value {default_recursion_limit}."
-        )
-        recursion_limit = default_recursion_limit
 
-    logger.info(f"Agent input: {agent_input}")
-    result = agent.invoke(
-        input=agent_input, config={"recursion_limit": recursion_limit}
-    )
+        logger.info(f"Agent input: {agent_input}")
+        result = agent.invoke(
+            input=agent_input, config={"recursion_limit": recursion_limit}
+        )
 
-    # Process the result
-    response_content = result["messages"][-1].content
-    logger.debug(f"{agent_name.capitalize()} full response: {response_content}")
+        # Process the result
+        response_content = result["messages"][-1].content
+        logger.debug(f"{agent_name.capitalize()} full response: {response_content}")
+        # Typed records of the tool results, rendered by the reporter without an LLM
+        wine_records, quantity_records = records_from_messages(result["messages"])
+        if cache_key and response_content and response_content.strip():
+            step_cache.put(cache_key, (response_content, wine_records, quantity_records))
 
     # Only consider non-empty responses as valid execution results
     if response_content and response_content.strip():
@@ -357,6 +456,8 @@ def _execute_agent_step(
                 )
             ],
             "observations": observations + [response_content],
+            "wine_records": state.get("wine_records", []) + wine_records,
+            "quantity_records": state.get("quantity_records", []) + quantity_records,
         },
         goto="research_team",
     )
@@ -372,7 +473,7 @@ def _setup_and_execute_agent_step(
     """Helper function to set up an agent with appropriate tools and execute a step.
 
     This function handles the common logic for both researcher_node and coder_node:
-    1. Creates an agent with the appropriate tools or uses the default agent
+    1. Gets the agent for these tools from `agent_pool`, compiling it on first use
     2. Executes the agent on the current step
 
     Args:
@@ -384,7 +485,7 @@ def _setup_and_execute_agent_step(
         Command to update state and go to research_team
     """
     # Use default tools if no MCP servers are configured
-    agent = create_agent(agent_type, default_tools, agent_type)
+    agent = agent_pool.get(agent_type, default_tools, agent_type)
     return _execute_agent_step(state, agent, agent_type)
 
 
@@ -413,5 +514,5 @@ def coder_node(
         state,
         config,
         "coder",
-        [python_repl_tool],
+        [python_repl_tool, select_wines_within_budget, estimate_event_wine],
     )
\ No newline at end of file
@@ -0,0 +1,135 @@
+import json
+import logging
+from typing import Any, Iterable, Iterator
+
+from langchain_core.messages import AIMessage, BaseMessage, ToolMessage
+from models import QuantityRecord, WineRecord
+
+logger = logging.getLogger(__name__)
+
+REPORT_COLUMNS = [
+    "Wine Name",
+    "Description",
+    "Vintage Year",
+    "Region",
+    "Country",
+    "User Rating",
+    "Price per Bottle",
+    "Estimated Quantity",
+    "Total Price",
+]
+
+
+def title_key(title: str) -> str:
+    """Normalise a wine title to match records of the same wine."""
+    return " ".join(title.lower().split())
+
+
+def _parse_content(message: ToolMessage) -> Any:
+    if not isinstance(message.content, str):
+        return message.content
+    try:
+        return json.loads(message.content)
+    except json.JSONDecodeError:
+        return None
+
+
+def _search_style(args: dict) -> dict[str, str]:
+    """Colour and type of every result of a `wine_search` call filtered on a single one."""
+    filters = args.get("filters")
+    if isinstance(filters, str):
+        try:
+            filters = json.loads(filters)
+        except json.JSONDecodeError:
+            filters = None
+    style = {}
+    for field, key in (("wine_color", "wine_colors"), ("wine_type", "wine_types")):
+        values = (filters or {}).get(key) or []
+        if len(values) == 1:
+            style[field] = str(values[0])
+    return style
+
+
+def records_from_messages(messages: Iterable[BaseMessage]) -> tuple[list[WineRecord], list[QuantityRecord]]:
+    """Collect typed records from the tool results of an agent run."""
+    wines, quantities = [], []
+    # Search results carry no colour or type, the filters of their call do
+    calls: dict[str, dict] = {}
+    for message in messages:
+        if isinstance(message, AIMessage):
+            calls.update((call["id"], call["args"]) for call in message.tool_calls)
+        if not isinstance(message, ToolMessage) or message.status == "error":
+            continue
+        content = _parse_content(message)
+        if message.name == "wine_search" and isinstance(content, list):
+            style = _search_style(calls.get(message.tool_call_id, {}))
+            wines += [
+                WineRecord.model_validate({**style, **w}) for w in content if isinstance(w, dict) and w.get("title")
+            ]
+        elif message.name == "select_wines_within_budget" and isinstance(content, dict):
+            quantities += [
+                QuantityRecord(title=w["title"], quantity=w["quantity"], price=w.get("price"), subtotal=w.get("subtotal"))
+                for w in content.get("wines", [])
+            ]
+        elif message.name == "estimate_event_wine" and isinstance(content, dict):
+            quantities += records_from_allocations(content.get("allocations", []))
+    return wines, quantities
+
+
+def records_from_allocations(allocations: Iterable[Any]) -> list[QuantityRecord]:
+    """Convert `WineAllocation`s of the event calculator, as objects or dicts."""
+    records = []
+    for allocation in allocations:
+        values = allocation if isinstance(allocation, dict) else vars(allocation)
+        records.append(
+            QuantityRecord(
+                title=values["title"], quantity=values["bottles"], price=values.get("price"), subtotal=values.get("subtotal")
+            )
+        )
+    return records
+
+
+def _cell(value: Any, fmt: str = "{}") -> str:
+    if value is None or value == "":
+        return "-"
+    return fmt.format(value).replace("|", "\\|").replace("\n", " ")
+
+
+def render_report_rows(wines: list[WineRecord], quantities: list[QuantityRecord]) -> Iterator[str]:
+    """Yield the Markdown report table line by line, header first.
+
+    Only the wines with a quantity are listed, the later decision for a wine
+    winning; `wines` provides their details.
+    """
+    yield "| " + " | ".join(REPORT_COLUMNS) + " |"
+    yield "|" + "|".join("-" * (len(c) + 2) for c in REPORT_COLUMNS) + "|"
+    by_title: dict[str, WineRecord] = {}
+    for wine in wines:
+        by_title.setdefault(title_key(wine.title), wine)
+    chosen = {title_key(q.title): q for q in quantities}
+    total = 0.0
+    for title in chosen:
+        wine = by_title.get(title)
+        quantity = chosen[title]
+        price = quantity.price if quantity.price is not None else wine and wine.price
+        subtotal = quantity.subtotal
+        if subtotal is None and price is not None:
+            subtotal = round(price * quantity.quantity, 2)
+        total += subtotal or 0.0
+        yield "| " + " | ".join(
+            [
+                _cell(wine.title if wine else quantity.title),
+                _cell(wine and wine.description),
+                str(wine.vintage_year or 0) if wine else "0",
+                _cell(wine and wine.region),
+                _cell(wine and wine.country),
+                _cell(wine and wine.user_rating),
+                _cell(price, "${:.2f}"),
+                _cell(quantity.quantity),
+                _cell(subtotal, "${:.2f}"),
+            ]
+        ) + " |"
+    if chosen:
+        bottles = sum(q.quantity for q in chosen.values())
+        yield ""
+        yield f"**Total: {bottles} bottles, ${total:.2f}**"
@@ -0,0 +1,263 @@
+"""Pool of warm subprocess workers that run untrusted Python code.
+
+Each worker is a separate interpreter started with `math`, `statistics` and
+NumPy already imported. A call gets CPU time and address space limits inside
+the worker and a wall clock limit enforced by the parent, which kills the
+worker when it is exceeded. Code of one conversation thread always runs in the
+same worker and namespace, so variables survive between calls. Workers are
+replaced after `max_executions` calls or when their memory keeps growing.
+
+Workers only get the environment variables of `ENV_ALLOWLIST` and run in an
+empty temporary directory of their own, so the code cannot read the API keys
+of the parent from its environment or from the `.env` and config files of the
+working directory.
+"""
+
+import atexit
+import io
+import json
+import logging
+import os
+import select
+import shutil
+import signal
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import redirect_stderr, redirect_stdout
+from dataclasses import asdict, dataclass
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+# Namespaces kept per worker; the least recently used thread loses its variables
+MAX_NAMESPACES = 64
+PRELOADED_MODULES = ("math", "statistics", "numpy")
+# Only these variables of the parent reach the workers, so the code never sees API keys
+ENV_ALLOWLIST = ("PATH", "LANG", "LC_ALL", "LC_CTYPE", "TZ", "TMPDIR", "SYSTEMROOT")
+
+
+@dataclass(kw_only=True)
+class SandboxLimits:
+    """Per-call resource limits."""
+
+    cpu_seconds: int = 5
+    """CPU time of one call."""
+    wall_seconds: float = 10.0
+    """Wall clock time of one call, including time spent sleeping or waiting."""
+    memory_mb: int = 512
+    """Address space a call may allocate on top of the warm interpreter."""
+    max_output_chars: int = 10_000
+    """Longer output is truncated."""
+
+
+@dataclass
+class SandboxResult:
+    output: str
+    error: Optional[str] = None
+    """`repr` of the exception raised by the code, if any."""
+    timed_out: bool = False
+    duration: float = 0.0
+
+
+def _memory_mb(field: int) -> float:
+    # /proc/self/statm: size resident shared ... in pages
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[field]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+
+def _set_soft_limit(kind: int, value: int) -> None:
+    _, hard = resource.getrlimit(kind)
+    resource.setrlimit(kind, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+
+def _execute(code: str, namespace: dict, limits: SandboxLimits) -> dict:
+    output = io.StringIO()
+    error = None
+    if resource is not None:
+        used = resource.getrusage(resource.RUSAGE_SELF)
+        _set_soft_limit(resource.RLIMIT_CPU, int(used.ru_utime + used.ru_stime) + limits.cpu_seconds + 1)
+        _set_soft_limit(resource.RLIMIT_AS, int((_memory_mb(0) + limits.memory_mb) * 2**20))
+    try:
+        with redirect_stdout(output), redirect_stderr(output):
+            exec(code, namespace)
+    except BaseException as e:  # SystemExit and KeyboardInterrupt included
+        error = repr(e)
+    finally:
+        if resource is not None:
+            _set_soft_limit(resource.RLIMIT_CPU, resource.RLIM_INFINITY)
+            _set_soft_limit(resource.RLIMIT_AS, resource.RLIM_INFINITY)
+    text = output.getvalue()
+    if len(text) > limits.max_output_chars:
+        text = text[: limits.max_output_chars] + f"\n... output truncated at {limits.max_output_chars} characters"
+    return {"output": text, "error": error, "rss_mb": _memory_mb(1) if resource is not None else 0.0}
+
+
+def _worker_main() -> None:
+    # Keep the real stdout for replies; anything the code writes to fd 1 goes to stderr
+    channel = os.fdopen(os.dup(1), "w")
+    os.dup2(2, 1)
+    for module in PRELOADED_MODULES:
+        try:
+            __import__(module)
+        except ImportError:
+            pass
+
+    def on_cpu_limit(signum, frame):
+        raise TimeoutError("CPU time limit exceeded")
+
+    signal.signal(signal.SIGXCPU, on_cpu_limit)
+    namespaces: OrderedDict[str, dict] = OrderedDict()
+    channel.write("ready\n")
+    channel.flush()
+    for line in sys.stdin:
+        request = json.loads(line)
+        namespace = namespaces.pop(request["thread_id"], None) or {"__name__": "__main__"}
+        namespaces[request["thread_id"]] = namespace
+        while len(namespaces) > MAX_NAMESPACES:
+            namespaces.popitem(last=False)
+        reply = _execute(request["code"], namespace, SandboxLimits(**request["limits"]))
+        channel.write(json.dumps(reply) + "\n")
+        channel.flush()
+
+
+class _Worker:
+    def __init__(self) -> None:
+        env = {name: os.environ[name] for name in ENV_ALLOWLIST if name in os.environ}
+        env.update(OPENBLAS_NUM_THREADS="1", OMP_NUM_THREADS="1", MKL_NUM_THREADS="1")
+        # Relative paths resolve here rather than in the project root; removed with the worker
+        self.cwd = tempfile.mkdtemp(prefix="sandbox-")
+        self.process = subprocess.Popen(
+            [sys.executable, "-u", os.path.abspath(__file__), "--worker"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            env=env,
+            cwd=self.cwd,
+        )
+        self.lock = threading.Lock()
+        self.executions = 0
+        self.rss_mb = 0.0
+        self._ready = False
+
+    def _readline(self, timeout: float) -> Optional[str]:
+        ready, _, _ = select.select([self.process.stdout], [], [], timeout)
+        return self.process.stdout.readline() if ready else None
+
+    def run(self, thread_id: str, code: str, limits: SandboxLimits) -> SandboxResult:
+        start = time.perf_counter()
+        if not self._ready:
+            # The first call also waits for the interpreter to finish its imports
+            if self._readline(30) != "ready\n":
+                self.kill()
+                return SandboxResult(output="", error="RuntimeError('Sandbox worker failed to start')")
+            self._ready = True
+        self.process.stdin.write(json.dumps({"thread_id": thread_id, "code": code, "limits": asdict(limits)}) + "\n")
+        self.process.stdin.flush()
+        self.executions += 1
+        line = self._readline(limits.wall_seconds)
+        duration = time.perf_counter() - start
+        if line is None:
+            self.kill()
+            error = f"TimeoutError('Wall time limit of {limits.wall_seconds}s exceeded')"
+            return SandboxResult(output="", error=error, timed_out=True, duration=duration)
+        if not line:
+            # The worker died, e.g. killed by the kernel for its CPU limit
+            self.kill()
+            return SandboxResult(output="", error="RuntimeError('Sandbox worker exited')", duration=duration)
+        reply = json.loads(line)
+        self.rss_mb = reply["rss_mb"]
+        return SandboxResult(output=reply["output"], error=reply["error"], duration=duration)
+
+    @property
+    def alive(self) -> bool:
+        return self.process.poll() is None
+
+    def kill(self) -> None:
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        shutil.rmtree(self.cwd, ignore_errors=True)
+
+
+class SandboxPool:
+    """Run code in a fixed number of warm subprocess workers.
+
+    Args:
+        size: Number of workers, i.e. how many calls run at the same time.
+        limits: Default limits of a call.
+        max_executions: Calls after which a worker is replaced by a fresh one.
+        recycle_rss_mb: Resident memory above which a worker is replaced after its call.
+    """
+
+    def __init__(
+        self,
+        size: int = 2,
+        limits: Optional[SandboxLimits] = None,
+        max_executions: int = 100,
+        recycle_rss_mb: float = 256,
+    ) -> None:
+        self.limits = limits or SandboxLimits()
+        self.max_executions = max_executions
+        self.recycle_rss_mb = recycle_rss_mb
+        self.recycled = 0
+        self._workers = [_Worker() for _ in range(size)]
+        self._affinity: OrderedDict[str, int] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _slot(self, thread_id: str) -> int:
+        with self._lock:
+            if thread_id in self._affinity:
+                self._affinity.move_to_end(thread_id)
+                return self._affinity[thread_id]
+            counts = [0] * len(self._workers)
+            for slot in self._affinity.values():
+                counts[slot] += 1
+            slot = self._affinity[thread_id] = counts.index(min(counts))
+            while len(self._affinity) > MAX_NAMESPACES * len(self._workers):
+                self._affinity.popitem(last=False)
+            return slot
+
+    def run(self, code: str, thread_id: str = "default", limits: Optional[SandboxLimits] = None) -> SandboxResult:
+        """Run `code` in the namespace of `thread_id` and return what it printed."""
+        slot = self._slot(thread_id)
+        while True:
+            worker = self._workers[slot]
+            with worker.lock:
+                # The worker may have been recycled while this call was waiting
+                if self._workers[slot] is worker:
+                    return self._run(slot, worker, code, thread_id, limits or self.limits)
+
+    def _run(self, slot: int, worker: _Worker, code: str, thread_id: str, limits: SandboxLimits) -> SandboxResult:
+        result = worker.run(thread_id, code, limits)
+        if not worker.alive or worker.executions >= self.max_executions or worker.rss_mb > self.recycle_rss_mb:
+            logger.info(f"Recycling sandbox worker {slot} after {worker.executions} executions ({worker.rss_mb:.0f}MB)")
+            worker.kill()
+            self._workers[slot] = _Worker()
+            self.recycled += 1
+        return result
+
+    def close(self) -> None:
+        for worker in self._workers:
+            worker.kill()
+
+
+@lru_cache
+def get_sandbox_pool() -> SandboxPool:
+    pool = SandboxPool(size=int(os.getenv("SANDBOX_WORKERS", "2")))
+    atexit.register(pool.close)
+    return pool
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["--worker"]:
+    _worker_main()
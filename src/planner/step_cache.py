@@ -0,0 +1,113 @@
+import hashlib
+import logging
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Optional
+
+from models import Step, StepType
+
+from memory_agent.metrics import cache_lookup
+
+logger = logging.getLogger(__name__)
+
+# Agents whose steps leave state behind besides their result: variables the
+# coder defines live in the REPL namespace of the thread, and a later step may
+# read them, so replaying only its text would break that step
+UNCACHED_AGENTS = frozenset({"coder"})
+
+
+@dataclass
+class StepCacheMetrics:
+    hits: int = 0
+    misses: int = 0
+    expired: int = 0
+    evicted: int = 0
+    stores: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def normalise_text(text: str) -> str:
+    """Lowercase and drop punctuation and repeated whitespace, keeping prices and percentages."""
+    text = re.sub(r"[^\w$.%]+", " ", text.lower())
+    # Keep decimal points only
+    return " ".join(re.sub(r"(?<!\d)\.|\.(?!\d)", " ", text).split())
+
+
+class StepCache:
+    """Results of plan steps shared across threads, with a TTL and an LRU bound.
+
+    Research steps are keyed on the step alone, so the same search in two event
+    plans is run once. Processing steps depend on earlier findings, which are
+    part of their key. Steps of `UNCACHED_AGENTS` are never cached.
+
+    Args:
+        ttl_seconds: Age after which a result is run again.
+        max_entries: Results kept; the least recently used is dropped first.
+    """
+
+    def __init__(self, ttl_seconds: float = 3600, max_entries: int = 1024) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.metrics = StepCacheMetrics()
+        self._entries: OrderedDict[str, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def cacheable(agent_name: str) -> bool:
+        return agent_name not in UNCACHED_AGENTS
+
+    @staticmethod
+    def key(agent_name: str, step: Step, completed_steps: list[Step]) -> str:
+        parts = [agent_name, step.step_type.value, normalise_text(step.title), normalise_text(step.description)]
+        if step.step_type != StepType.RESEARCH:
+            parts += [normalise_text(s.execution_res or "") for s in completed_steps]
+        return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.metrics.misses += 1
+                cache_lookup("plan_steps", False)
+                return None
+            stored_at, result = entry
+            if time.monotonic() - stored_at > self.ttl_seconds:
+                del self._entries[key]
+                self.metrics.expired += 1
+                self.metrics.misses += 1
+                cache_lookup("plan_steps", False)
+                return None
+            self._entries.move_to_end(key)
+            self.metrics.hits += 1
+            cache_lookup("plan_steps", True)
+            return result
+
+    def put(self, key: str, result: Any) -> None:
+        with self._lock:
+            self._entries[key] = (time.monotonic(), result)
+            self._entries.move_to_end(key)
+            self.metrics.stores += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.metrics.evicted += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+step_cache = StepCache(
+    ttl_seconds=float(os.getenv("STEP_CACHE_TTL_SECONDS", "3600")),
+    max_entries=int(os.getenv("STEP_CACHE_MAX_ENTRIES", "1024")),
+)
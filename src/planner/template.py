@@ -4,7 +4,9 @@
 import os
 import dataclasses
 from datetime import datetime
-from jinja2 import Environment, FileSystemLoader, select_autoescape
+import re
+from typing import Optional
+from jinja2 import Environment, FileSystemLoader, Template, meta, nodes, select_autoescape
 from langgraph.prebuilt.chat_agent_executor import AgentState
 from langchain_core.messages import HumanMessage, SystemMessage
 from config import Configuration
@@ -17,6 +19,73 @@ env = Environment(
     lstrip_blocks=True,
 )
 
+PROMPT_DIR = os.path.join(os.path.dirname(__file__), "prompts")
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledPrompt:
+    """A prompt template compiled once, with the variables it declares."""
+
+    name: str
+    template: Template
+    variables: frozenset[str]
+    static_parts: Optional[tuple[str, ...]] = None
+    """Pre-rendered text around the variables, alternating text and variable
+    names. Only set when every variable is a plain `{{ name }}` substitution."""
+
+    def render(self, context: dict) -> str:
+        """Render with the declared variables of `context`; the rest is ignored."""
+        if self.static_parts is None:
+            return self.template.render(**{k: v for k, v in context.items() if k in self.variables})
+        parts = list(self.static_parts)
+        for i in range(1, len(parts), 2):
+            parts[i] = str(context[parts[i]]) if parts[i] in context else ""
+        return "".join(parts)
+
+
+_VARIABLE_MARKER = re.compile(r"\x00(\w+)\x00")
+
+
+def _static_parts(template: Template, source: str, variables: frozenset[str]) -> Optional[tuple[str, ...]]:
+    used = sorted(node.name for node in env.parse(source).find_all(nodes.Name) if node.name in variables)
+    substituted = sorted(re.findall(r"{{-?\s*(\w+)\s*-?}}", source))
+    if used != substituted:
+        # A variable is used in a condition, loop or filter
+        return None
+    rendered = template.render(**{name: f"\x00{name}\x00" for name in variables})
+    return tuple(_VARIABLE_MARKER.split(rendered))
+
+
+def compile_prompt(prompt_name: str) -> CompiledPrompt:
+    """Compile `prompts/<prompt_name>.md` and check that it renders."""
+    try:
+        source, _, _ = env.loader.get_source(env, f"prompts/{prompt_name}.md")
+        variables = frozenset(meta.find_undeclared_variables(env.parse(source)))
+        template = env.get_template(f"prompts/{prompt_name}.md")
+        template.render()
+        static_parts = _static_parts(template, source, variables)
+    except Exception as e:
+        raise ValueError(f"Error loading template {prompt_name}: {e}")
+    return CompiledPrompt(name=prompt_name, template=template, variables=variables, static_parts=static_parts)
+
+
+def compile_all_prompts(prompt_dir: str = PROMPT_DIR) -> dict[str, CompiledPrompt]:
+    """Compile every prompt of `prompt_dir`, failing on the first invalid one."""
+    return {
+        name: compile_prompt(name)
+        for name in sorted(os.path.splitext(f)[0] for f in os.listdir(prompt_dir) if f.endswith(".md"))
+    }
+
+
+PROMPTS = compile_all_prompts()
+
+
+def get_compiled_prompt(prompt_name: str) -> CompiledPrompt:
+    if prompt_name not in PROMPTS:
+        # Added after startup
+        PROMPTS[prompt_name] = compile_prompt(prompt_name)
+    return PROMPTS[prompt_name]
+
 
 def get_prompt_template(prompt_name: str) -> str:
     """
@@ -28,11 +97,7 @@ def get_prompt_template(prompt_name: str) -> str:
     Returns:
         The template string with proper variable substitution syntax
     """
-    try:
-        template = env.get_template(f"prompts/{prompt_name}.md")
-        return template.render()
-    except Exception as e:
-        raise ValueError(f"Error loading template {prompt_name}: {e}")
+    return get_compiled_prompt(prompt_name).render({})
 
 
 def apply_prompt_template(
@@ -48,19 +113,20 @@ def apply_prompt_template(
     Returns:
         List of messages with the system prompt as the first message
     """
-    # Convert state to dict for template rendering
-    state_vars = {
-        "CURRENT_TIME": datetime.now().strftime("%a %b %d %Y %H:%M:%S %z"),
-        **state,
-    }
+    prompt = get_compiled_prompt(prompt_name)
+    # Only look up the variables the template declares instead of copying the state
+    state_vars = {name: state[name] for name in prompt.variables if name in state}
+    if "CURRENT_TIME" in prompt.variables:
+        state_vars["CURRENT_TIME"] = datetime.now().strftime("%a %b %d %Y %H:%M:%S %z")
 
     # Add configurable variables
     if configurable:
-        state_vars.update(dataclasses.asdict(configurable))
+        state_vars.update(
+            {f.name: getattr(configurable, f.name) for f in dataclasses.fields(configurable) if f.name in prompt.variables}
+        )
 
     try:
-        template = env.get_template(f"prompts/{prompt_name}.md")
-        system_prompt = template.render(**state_vars)
+        system_prompt = prompt.render(state_vars)
         return [SystemMessage(content=system_prompt)] + state["messages"]
     except Exception as e:
         raise ValueError(f"Error applying template {prompt_name}: {e}")
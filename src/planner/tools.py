@@ -2,11 +2,16 @@
 # SPDX-License-Identifier: MIT
 
 import logging
-from typing import Annotated
+from typing import Annotated, Optional
 from langchain_core.tools import tool
-from langchain_experimental.utilities import PythonREPL
+from langgraph.config import get_config
 import functools
 from typing import Any, Callable
+from sandbox import get_sandbox_pool
+import dataclasses
+from memory_agent.event_calculator import estimate_event
+from memory_agent.logs import Truncated
+from memory_agent.selection import select_within_budget
 
 logger = logging.getLogger(__name__)
 
@@ -24,24 +29,20 @@ def log_io(func: Callable) -> Callable:
 
     @functools.wraps(func)
     def wrapper(*args: Any, **kwargs: Any) -> Any:
-        # Log input parameters
+        # Arguments and results are only rendered, and truncated, if the record is emitted
         func_name = func.__name__
-        params = ", ".join(
-            [*(str(arg) for arg in args), *(f"{k}={v}" for k, v in kwargs.items())]
-        )
-        logger.info(f"Tool {func_name} called with parameters: {params}")
+        logger.debug("Tool %s called with args=%s kwargs=%s", func_name, Truncated(args), Truncated(kwargs))
 
         # Execute the function
         result = func(*args, **kwargs)
 
         # Log the output
-        logger.info(f"Tool {func_name} returned: {result}")
+        logger.debug("Tool %s returned: %s", func_name, Truncated(result))
 
         return result
 
     return wrapper
 
-repl = PythonREPL()
 
 
 @tool
@@ -60,16 +61,68 @@ def python_repl_tool(
 
     logger.info("Executing Python code")
     try:
-        result = repl.run(code)
-        # Check if the result is an error message by looking for typical error patterns
-        if isinstance(result, str) and ("Error" in result or "Exception" in result):
-            logger.error(result)
-            return f"Error executing code:\n```python\n{code}\n```\nError: {result}"
-        logger.info("Code execution successful")
+        # Variables persist between calls of the same conversation thread
+        thread_id = str(get_config().get("configurable", {}).get("thread_id", "default"))
+    except RuntimeError:  # called outside of a graph run
+        thread_id = "default"
+    try:
+        result = get_sandbox_pool().run(code, thread_id=thread_id)
     except BaseException as e:
         error_msg = repr(e)
         logger.error(error_msg)
         return f"Error executing code:\n```python\n{code}\n```\nError: {error_msg}"
+    if result.error:
+        logger.error(result.error)
+        return f"Error executing code:\n```python\n{code}\n```\nStdout: {result.output}\nError: {result.error}"
+    logger.info(f"Code execution successful in {result.duration:.3f}s")
 
-    result_str = f"Successfully executed:\n```python\n{code}\n```\nStdout: {result}"
+    result_str = f"Successfully executed:\n```python\n{code}\n```\nStdout: {result.output}"
     return result_str
+
+
+@tool
+@log_io
+def select_wines_within_budget(
+    wines: Annotated[list[dict], "Wines from previous findings, each with `title`, `price` and `user_rating`."],
+    budget: Annotated[float, "Total budget for all bottles."],
+    min_bottles: Annotated[int, "Minimum total number of bottles, e.g. the bottles needed for the guests."] = 0,
+    max_bottles: Annotated[Optional[int], "Maximum total number of bottles."] = None,
+    max_per_wine: Annotated[int, "Maximum bottles of any single wine."] = 1,
+) -> dict:
+    """Choose the best rated wines and how many bottles of each to buy within a budget.
+    Use this instead of computing the selection yourself. Wines without a price are skipped."""
+    selection = select_within_budget(
+        [wine.get("price") for wine in wines],
+        [wine.get("user_rating") for wine in wines],
+        budget,
+        max_per_wine=max_per_wine,
+        min_bottles=min_bottles,
+        max_bottles=max_bottles,
+    )
+    return {
+        "wines": [
+            {**wine, "quantity": quantity, "subtotal": round(quantity * wine["price"], 2)}
+            for wine, quantity in zip(wines, selection.quantities)
+            if quantity
+        ],
+        "total_cost": selection.total_cost,
+        "total_bottles": selection.bottles,
+        "within_constraints": selection.feasible,
+        "skipped_without_price": [wines[i].get("title") for i in selection.skipped],
+    }
+
+
+@tool
+@log_io
+def estimate_event_wine(
+    guests: Annotated[int, "Number of guests drinking wine."],
+    duration_hours: Annotated[float, "Length of the event in hours."] = 3.0,
+    mix: Annotated[
+        Optional[dict[str, float]], "Relative share of each wine colour or type, e.g. {'Red': 2, 'Sparkling': 1}."
+    ] = None,
+    wines: Annotated[Optional[list[dict]], "Selected wines with `title`, `price` and `wine_color` or `wine_type`."] = None,
+    bottle_ml: Annotated[float, "Bottle size in ml."] = 750,
+) -> dict:
+    """Estimate how many bottles an event needs, split by colour/type and across the selected wines, with
+    the total cost. Use this instead of computing quantities yourself."""
+    return dataclasses.asdict(estimate_event(guests, duration_hours, mix, wines, bottle_ml))
@@ -3,37 +3,134 @@
 
 import logging
 import json
+from dataclasses import dataclass
+from typing import Any
+
 import json_repair
 
 logger = logging.getLogger(__name__)
 
+FENCE = "```"
+
+
+@dataclass
+class JsonParseMetrics:
+    strict: int = 0
+    """Parsed as is."""
+    fenced: int = 0
+    """Parsed after removing a code fence."""
+    repaired: int = 0
+    """Needed json_repair."""
+    failed: int = 0
+
+    @property
+    def repair_rate(self) -> float:
+        total = self.strict + self.fenced + self.repaired + self.failed
+        return (self.repaired + self.failed) / total if total else 0.0
+
 
-def repair_json_output(content: str) -> str:
+json_parse_metrics = JsonParseMetrics()
+
+
+def strip_code_fence(content: str) -> str:
+    """Return the body of the first ``` block of `content`, or `content` if there is none."""
+    start = content.find(FENCE)
+    if start == -1:
+        return content
+    body = start + len(FENCE)
+    # Skip a language tag such as json or ts
+    while body < len(content) and content[body].isalnum():
+        body += 1
+    end = content.rfind(FENCE, body)
+    return content[body:end if end != -1 else len(content)].strip()
+
+
+def parse_json_output(content: str) -> Any:
     """
-    Repair and normalize JSON output.
+    Parse JSON written by an LLM, possibly in a code fence or slightly malformed.
+
+    Strict parsing is tried first, json_repair only when it fails.
 
     Args:
         content (str): String content that may contain JSON
 
     Returns:
-        str: Repaired JSON string, or original content if not JSON
+        Any: The parsed object or array
+
+    Raises:
+        json.JSONDecodeError: If the content is not a JSON object or array, even after repair
     """
     content = content.strip()
-    if content.startswith(("{", "[")) or "```json" in content or "```ts" in content:
+    if content.startswith(("{", "[")):
+        try:
+            parsed = json.loads(content)
+            json_parse_metrics.strict += 1
+            return parsed
+        except json.JSONDecodeError:
+            pass
+    elif FENCE in content:
+        content = strip_code_fence(content)
+        try:
+            parsed = json.loads(content)
+            json_parse_metrics.fenced += 1
+            return parsed
+        except json.JSONDecodeError:
+            pass
+    if content.startswith(("{", "[")):
         try:
-            # If content is wrapped in ```json code block, extract the JSON part
-            if content.startswith("```json"):
-                content = content.removeprefix("```json")
+            parsed = json_repair.loads(content)
+        except Exception as e:
+            logger.warning(f"JSON repair failed: {e}")
+        else:
+            if isinstance(parsed, (dict, list)):
+                json_parse_metrics.repaired += 1
+                logger.debug(f"Repaired JSON output ({json_parse_metrics.repaired} repairs so far)")
+                return parsed
+    json_parse_metrics.failed += 1
+    raise json.JSONDecodeError("Content is not a JSON object or array", content, 0)
 
-            if content.startswith("```ts"):
-                content = content.removeprefix("```ts")
 
-            if content.endswith("```"):
-                content = content.removesuffix("```")
+if __name__ == "__main__":
+    # python utils.py [recorded_outputs.jsonl]: one planner output per line, as a JSON string
+    import sys
+    import time
 
-            # Try to repair and parse JSON
-            repaired_content = json_repair.loads(content)
-            return json.dumps(repaired_content, ensure_ascii=False)
-        except Exception as e:
-            logger.warning(f"JSON repair failed: {e}")
-    return content
+    if len(sys.argv) > 1:
+        with open(sys.argv[1], encoding="utf8") as f:
+            outputs = [json.loads(line) for line in f if line.strip()]
+    else:
+        plan = {
+            "locale": "en-US",
+            "has_enough_context": False,
+            "thought": "The user wants red and white wines for a dinner of 12.",
+            "title": "Wine plan for a dinner party",
+            "steps": [
+                {"need_web_search": True, "title": f"Step {i}", "description": "Find red wines under $30 " * 4,
+                 "step_type": "research", "execution_res": None}
+                for i in range(5)
+            ],
+        }
+        text = json.dumps(plan, indent=4)
+        outputs = [text, f"```json\n{text}\n```", "Here is the plan:\n```\n" + text + "\n```", text.replace('"title"', "'title'")]
+
+    def previous(content: str) -> Any:
+        # Repair, serialise, then parse again in human_feedback_node
+        return json.loads(json.dumps(json_repair.loads(strip_code_fence(content)), ensure_ascii=False))
+
+    rounds = max(1, 2000 // len(outputs))
+    timings = {"previous": 0.0, "parse_json_output": 0.0}
+    for name, parse in (("previous", previous), ("parse_json_output", parse_json_output)):
+        for output in outputs:
+            start = time.perf_counter()
+            for _ in range(rounds):
+                try:
+                    parse(output)
+                except json.JSONDecodeError:
+                    pass
+            elapsed = (time.perf_counter() - start) / rounds * 1e6
+            timings[name] += elapsed / len(outputs)
+            if len(sys.argv) == 1:
+                print(f"{name:<18} {output[:20]!r:<26} {elapsed:8.1f}us")
+    for name, elapsed in timings.items():
+        print(f"{name:<18} {elapsed:8.1f}us per output on average")
+    print(json_parse_metrics)
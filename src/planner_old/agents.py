@@ -1,6 +1,6 @@
 from typing import Dict, List, Tuple, Any, Optional, Union
 from src.planner.conversation import format_response
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from enum import Enum
 import json
 import logging
@@ -13,9 +13,14 @@ from langchain.schema import HumanMessage, AIMessage
 from ..config import config
 from .tools import (
     wine_search, WineColor, WineType, TasteProfile,
-    WineFilters, WineSearchResult
+    WineFilters, WineSearchResult, estimate_shopping
 )
 from langgraph.graph import MessagesState
+from memory_agent.ledger import ledger_callbacks
+from memory_agent.selection import select_within_budget
+from .intent import (
+    UserContext, UserPreferences, build_intent_prompt, merge_user_context, parse_intent_response
+)
 
 # Configure detailed logging
 logger = logging.getLogger('wine_chatbot')
@@ -38,23 +43,6 @@ class AgentState(Enum):
     SHOPPING = "shopping"
     PRESENTING = "presenting"
 
-@dataclass
-class UserPreferences:
-    preferred_colors: Optional[List[WineColor]] = field(default_factory=list)
-    preferred_types: Optional[List[WineType]] = field(default_factory=list)
-    taste_preferences: Optional[TasteProfile] = None
-    preferred_regions: Optional[List[str]] = field(default_factory=list)
-    preferred_grapes: Optional[List[str]] = field(default_factory=list)
-
-@dataclass
-class UserContext:
-    occasion: Optional[str] = None
-    guests: Optional[int] = None
-    budget: Optional[float] = None
-    food_pairing: Optional[str] = None
-    preferences: UserPreferences = field(default_factory=UserPreferences)
-    clarification_prompt: Optional[str] = None # LLM-generated prompt if clarification is needed
-
 @dataclass
 class WineResearch:
     occasion: str
@@ -93,10 +81,10 @@ class WorkflowState:
     recommendations: Optional[WineRecommendation] = None
     shopping_list: Optional[ShoppingList] = None
     messages: List[Dict] = None
+    intent_messages: int = 0 # Messages already folded into user_context
 
 # Initialize model
 api_key = config.get('ai', 'gemini_api_key')
-print(api_key)
 if not api_key:
     raise ValueError("Gemini API key not found in configuration")
 
@@ -107,117 +95,31 @@ model = init_chat_model(
     credentials=None
 )
 
-def extract_user_intent(messages: List[Any]) -> UserContext:
-    """Extract user intent and dynamically generate wine preferences using LLM.
+def extract_user_intent(new_messages: List[Any], context: Optional[UserContext] = None) -> Tuple[UserContext, bool]:
+    """Update the user's context with what the new messages of the conversation add.
     
     Args:
-        messages: List of conversation messages (can be HumanMessage, AIMessage, or dict objects)
+        new_messages: Messages since the last extraction (can be HumanMessage, AIMessage, or dict objects)
+        context: Context extracted from the earlier messages, None to start from scratch
         
     Returns:
-        UserContext with extracted information
+        UserContext with extracted information, and whether the new messages were
+        merged into it. On failure the context is unchanged apart from a clarification prompt.
     """
-    context = UserContext()
-    
-    # Format the conversation history for the prompt
-    conversation_text = ""
-    for msg in messages:
-        if isinstance(msg, HumanMessage) or (isinstance(msg, dict) and msg.get('role') == 'user'):
-            content = msg.content if hasattr(msg, 'content') else msg.get('content')
-            conversation_text += f"User: {content}\n"
-        elif isinstance(msg, AIMessage) or (isinstance(msg, dict) and msg.get('role') == 'assistant'):
-            content = msg.content if hasattr(msg, 'content') else msg.get('content')
-            conversation_text += f"Assistant: {content}\n"
-    
-    # Get the last user message for logging
-    last_user_message = None
-    for msg in reversed(messages):
-        if isinstance(msg, HumanMessage) or (isinstance(msg, dict) and msg.get('role') == 'user'):
-            content = msg.content if hasattr(msg, 'content') else msg.get('content')
-            last_user_message = content
-            break
-
-    prompt_template = f"""
-You are an expert wine assistant. Here is the conversation history with a user:
-
-{conversation_text}
-
-Analyze this conversation and extract the following information, focusing on the latest user request. 
-Respond with a single, valid JSON object containing these fields. 
-If a field cannot be determined, use null or an empty list as appropriate.
-
-Fields to extract:
-- occasion: string (e.g., "wedding", "casual dinner", "celebration")
-- guests: integer (number of guests)
-- budget: float (total budget for wines, if mentioned)
-- food_pairing: string (e.g., "steak", "seafood", "spicy thai")
-- preferred_colors: list of strings (e.g., ["RED", "WHITE", "ROSE"], must be one of WineColor enum: RED, WHITE, ROSE). Infer this based on food or occasion if not explicit.
-- preferred_types: list of strings (e.g., ["STILL", "SPARKLING", "DESSERT", "FORTIFIED"], must be one of WineType enum: STILL, SPARKLING, DESSERT, FORTIFIED). Infer this if possible.
-- taste_preferences: object with keys "body", "acidity", "sweetness", "tannin" (each an integer from 1-5, where 1 is low/light and 5 is high/full). If not specified, use null for the object or individual keys. Infer this if possible.
-- preferred_regions: list of strings (e.g., ["Napa Valley", "Bordeaux"])
-- preferred_grapes: list of strings (e.g., ["Cabernet Sauvignon", "Chardonnay"]). Infer these based on food, occasion, or stated preferences.
-- clarification_prompt_to_user: string (A polite question to the user if essential information like occasion, guest count, or budget is missing or ambiguous, e.g., "To help you better, could you please tell me about the occasion and number of guests?"). If no clarification is needed, set to null.
-
-Example JSON output:
-{{ "occasion": "dinner party", "guests": 6, "budget": 100.0, "food_pairing": "pasta with red sauce", "preferred_colors": ["RED"], "preferred_types": ["STILL"], "taste_preferences": {{ "body": 4, "acidity": 3, "sweetness": 1, "tannin": 4 }}, "preferred_regions": ["Tuscany"], "preferred_grapes": ["Sangiovese"], "clarification_prompt_to_user": null }}
-"""
+    context = context or UserContext()
+    prompt = build_intent_prompt(new_messages, context)
+    logger.debug(f"Extracting user intent from {len(new_messages)} new messages ({len(prompt)} prompt chars)")
 
     try:
-        response = model.invoke(prompt_template)
-        # Assuming response.content is the string containing JSON
-        # Sometimes, LLMs wrap JSON in ```json ... ```, so we try to strip that.
-        raw_json = response.content
-        if raw_json.startswith("```json\n"):
-            raw_json = raw_json[len("```json\n"):-len("\n```")]
-        elif raw_json.startswith("```"):
-             raw_json = raw_json[len("```"):-len("```")]
-        
-        parsed_data = json.loads(raw_json)
-
-        context.occasion = parsed_data.get('occasion')
-        context.guests = parsed_data.get('guests')
-        context.budget = parsed_data.get('budget')
-        context.food_pairing = parsed_data.get('food_pairing')
-        context.clarification_prompt = parsed_data.get('clarification_prompt_to_user')
-
-        # Populate UserPreferences
-        if parsed_data.get('preferred_colors'):
-            for color_str in parsed_data['preferred_colors']:
-                try:
-                    context.preferences.preferred_colors.append(WineColor[color_str.upper()])
-                except KeyError:
-                    print(f"Warning: LLM returned invalid wine color: {color_str}") # Or log
-        
-        if parsed_data.get('preferred_types'):
-            for type_str in parsed_data['preferred_types']:
-                try:
-                    context.preferences.preferred_types.append(WineType[type_str.upper()])
-                except KeyError:
-                    print(f"Warning: LLM returned invalid wine type: {type_str}") # Or log
-
-        if parsed_data.get('preferred_regions'):
-            context.preferences.preferred_regions = parsed_data['preferred_regions']
-        
-        if parsed_data.get('preferred_grapes'):
-            context.preferences.preferred_grapes = parsed_data['preferred_grapes']
-
-        taste_data = parsed_data.get('taste_preferences')
-        if taste_data:
-            context.preferences.taste_preferences = TasteProfile(
-                body=taste_data.get('body'),
-                acidity=taste_data.get('acidity'),
-                sweetness=taste_data.get('sweetness'),
-                tannin=taste_data.get('tannin')
-            )
-
+        response = model.invoke(prompt)
+        return merge_user_context(context, parse_intent_response(response.content)), True
     except json.JSONDecodeError as e:
-        print(f"Error decoding LLM JSON response: {e}")
-        print(f"Raw response: {response.content if 'response' in locals() else 'Response not available'}")
-        context.clarification_prompt = "I had a little trouble understanding your request. Could you please rephrase or provide more details?"
+        logger.error(f"Error decoding LLM JSON response: {e}, raw response: {response.content}")
+        clarification = "I had a little trouble understanding your request. Could you please rephrase or provide more details?"
     except Exception as e:
-        print(f"An unexpected error occurred in extract_user_intent: {e}")
-        context.clarification_prompt = "I encountered an issue processing your request. Could you try again?"
-
-    return context
+        logger.exception(f"An unexpected error occurred in extract_user_intent: {e}")
+        clarification = "I encountered an issue processing your request. Could you try again?"
+    return replace(context, clarification_prompt=clarification), False
 
 def clarify_requirements(context: UserContext) -> str:
     """Return the clarification prompt generated by the LLM, or a fallback."""
@@ -260,6 +162,12 @@ def research_wine(
         filters_used=filters
     )
 
+def _wine_price(wine: WineSearchResult) -> Optional[float]:
+    if wine.price is not None:
+        return wine.price
+    return wine.shopping_prices[0].price_amount if wine.shopping_prices else None
+
+
 def recommend_wine(research: WineResearch, budget: float) -> WineRecommendation:
     """Analyzes research results and provides wine recommendations within budget."""
     recommendations = []
@@ -268,16 +176,20 @@ def recommend_wine(research: WineResearch, budget: float) -> WineRecommendation:
     
     # Filter and rank wines based on research results
     if research.search_results:
-        # Sort by rating first
-        sorted_wines = sorted(research.search_results, key=lambda x: x.rating, reverse=True)
-        
-        for wine in sorted_wines:
-            if total_cost + wine.price <= budget:
-                recommendations.append(wine)
-                total_cost += wine.price
-                
-                # Analyze taste profile
-                taste_analysis[wine.name] = wine.taste_profile
+        # Best total rating within budget; wines without a price are skipped
+        selection = select_within_budget(
+            [_wine_price(wine) for wine in research.search_results],
+            [wine.user_rating for wine in research.search_results],
+            budget,
+        )
+        selected = [wine for wine, quantity in zip(research.search_results, selection.quantities) if quantity]
+        total_cost = selection.total_cost
+
+        for wine in sorted(selected, key=lambda x: x.user_rating or 0, reverse=True):
+            recommendations.append(wine)
+
+            # Analyze taste profile
+            taste_analysis[wine.title] = wine.taste_profile
         
         # Build detailed reasoning
         reasoning_parts = [f"Selected {len(recommendations)} wines optimized for {research.occasion}"]
@@ -307,43 +219,36 @@ def recommend_wine(research: WineResearch, budget: float) -> WineRecommendation:
 
 def create_shopping_list(recommendation: WineRecommendation, guests: int, user_preferences: UserPreferences) -> ShoppingList:
     """Creates a detailed shopping list with quantities based on guest count."""
-    # Calculate bottles needed (0.5 bottles per guest is standard)
-    bottles_per_person = 0.5
-    total_bottles = int(guests * bottles_per_person)
-    
-    # Distribute bottles across recommended wines
-    items = []
-    bottles_per_wine = total_bottles // len(recommendation.wines)
-    remaining_bottles = total_bottles % len(recommendation.wines)
-    
+    # Same consumption model and rounding as the planner's bottle quantity steps
+    estimate = estimate_shopping(recommendation.wines, guests or 0)
+    bottles = {int(allocation.title): allocation for allocation in estimate.allocations}
+
     # Track bottles by color and type based on user preferences
     by_color = {color: 0 for color in user_preferences.preferred_colors} if user_preferences.preferred_colors else {}
     by_type = {ptype: 0 for ptype in user_preferences.preferred_types} if user_preferences.preferred_types else {}
-    
-    for wine in recommendation.wines:
-        quantity = bottles_per_wine + (1 if remaining_bottles > 0 else 0)
-        remaining_bottles -= 1
-        
-        # Create shopping item
-        item = ShoppingItem(
+
+    items = []
+    for index, wine in enumerate(recommendation.wines):
+        allocation = bottles.get(index)
+        quantity = allocation.bottles if allocation else 0
+        items.append(ShoppingItem(
             wine=wine,
             quantity=quantity,
-            subtotal=(wine.price * quantity) if wine.price is not None else 0.0,
+            subtotal=allocation.subtotal if allocation and allocation.subtotal is not None else 0.0,
             availability=True  # Mock availability for now
-        )
-        items.append(item)
-        
+        ))
+
         # Update color and type counts if the wine's color/type matches user preference
         if wine.color and wine.color in by_color:
             by_color[wine.color] += quantity
         if wine.type and wine.type in by_type:
             by_type[wine.type] += quantity
-    
+
     # Categories with 0 count are intentionally kept to reflect user preferences
 
     return ShoppingList(
         items=items,
-        total_bottles=total_bottles,
+        total_bottles=estimate.total_bottles,
         total_cost=sum(item.subtotal for item in items),
         by_color=by_color,
         by_type=by_type
@@ -545,9 +450,15 @@ def handle_user_interaction(state: Dict[str, Any]) -> Dict[str, Any]:
                 break
         
         if has_user_message:
-            # Pass the entire conversation history to extract user intent
-            logger.info(f"Extracting user intent from conversation history with {len(state['messages'])} messages")
-            workflow.user_context = extract_user_intent(state['messages'])
+            # Only the messages since the last extraction are sent, with the context extracted so far
+            seen = workflow.intent_messages if workflow.intent_messages <= len(state['messages']) else 0
+            logger.info(f"Extracting user intent from {len(state['messages']) - seen} of {len(state['messages'])} messages")
+            workflow.user_context, merged = extract_user_intent(
+                state['messages'][seen:], workflow.user_context if seen else None
+            )
+            if merged:
+                # After a failure the same messages are extracted again on the next turn
+                workflow.intent_messages = len(state['messages'])
         else:
             logger.warning("No user message found in messages list")
             # Initialize with default greeting
@@ -609,7 +520,7 @@ def handle_research(state: Dict[str, Any]) -> Dict[str, Any]:
     # Ensure we have a user context
     if not workflow.user_context:
         # This is an error state - we shouldn't reach research without user context
-        print("Error: Reached research phase without user context")
+        logger.error("Reached research phase without user context")
         workflow.current_state = AgentState.CLARIFYING
         workflow.user_context = UserContext()
         workflow.user_context.clarification_prompt = "I need to know what occasion you're planning for."
@@ -639,7 +550,7 @@ def handle_research(state: Dict[str, Any]) -> Dict[str, Any]:
         research_message = f"I've researched wines for {research.occasion}. Found {len(research_results)} options."
         
     except Exception as e:
-        print(f"Error during research: {e}")
+        logger.exception(f"Error during research: {e}")
         research_message = "I'm having trouble researching wines right now. Let's try a different approach."
     
     # Update workflow state
@@ -690,7 +601,7 @@ def handle_recommendations(state: Dict[str, Any]) -> Dict[str, Any]:
         else:
             recommendation_message = "I couldn't find suitable wine recommendations based on your criteria. Let's try a different approach."
     except Exception as e:
-        print(f"Error during recommendations: {e}")
+        logger.exception(f"Error during recommendations: {e}")
         recommendation_message = "I'm having trouble generating wine recommendations right now. Let's try a different approach."
     
     # Update workflow state
@@ -739,7 +650,7 @@ def handle_shopping(state: Dict[str, Any]) -> Dict[str, Any]:
         else:
             shopping_message = "I couldn't create a shopping list based on your preferences. Please provide more details about your event."
     except Exception as e:
-        print(f"Error during shopping list creation: {e}")
+        logger.exception(f"Error during shopping list creation: {e}")
         shopping_message = "I'm having trouble creating a shopping list right now. Let's try a different approach."
     
     # Update workflow state
@@ -879,7 +790,7 @@ def create_wine_planner() -> StateGraph:
     
     # Compile and return the workflow
     logger.info("Compiling workflow")
-    return workflow.compile(checkpointer=memory)
+    return workflow.compile(checkpointer=memory).with_config(callbacks=ledger_callbacks())
 
 # Create the planner
 _wine_planner = create_wine_planner()
@@ -0,0 +1,197 @@
+"""Incremental extraction of the user's event and wine preferences.
+
+The structured `UserContext` of a conversation is kept in the workflow state.
+Each turn the LLM gets the current context and only the messages since the
+last extraction, and answers with the fields that changed, which are merged
+into the context. The prompt therefore stays the same size however long the
+conversation gets.
+"""
+
+import copy
+import json
+import logging
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from .tools import TasteProfile, WineColor, WineType
+
+logger = logging.getLogger('wine_chatbot')
+
+TASTE_KEYS = ("body", "acidity", "sweetness", "tannin")
+
+
+@dataclass
+class UserPreferences:
+    preferred_colors: Optional[List[WineColor]] = field(default_factory=list)
+    preferred_types: Optional[List[WineType]] = field(default_factory=list)
+    taste_preferences: Optional[TasteProfile] = None
+    preferred_regions: Optional[List[str]] = field(default_factory=list)
+    preferred_grapes: Optional[List[str]] = field(default_factory=list)
+
+
+@dataclass
+class UserContext:
+    occasion: Optional[str] = None
+    guests: Optional[int] = None
+    budget: Optional[float] = None
+    food_pairing: Optional[str] = None
+    preferences: UserPreferences = field(default_factory=UserPreferences)
+    clarification_prompt: Optional[str] = None # LLM-generated prompt if clarification is needed
+
+
+def format_messages(messages: List[Any]) -> str:
+    """Format user and assistant messages, as message objects or dicts, one per line."""
+    lines = []
+    for msg in messages:
+        content = msg.content if hasattr(msg, 'content') else msg.get('content')
+        if isinstance(msg, HumanMessage) or (isinstance(msg, dict) and msg.get('role') == 'user'):
+            lines.append(f"User: {content}")
+        elif isinstance(msg, AIMessage) or (isinstance(msg, dict) and msg.get('role') == 'assistant'):
+            lines.append(f"Assistant: {content}")
+    return "\n".join(lines)
+
+
+def context_to_dict(context: UserContext) -> Dict[str, Any]:
+    """Return the context in the field names of the extraction prompt, without clarification."""
+    preferences = context.preferences
+    taste = preferences.taste_preferences
+    return {
+        "occasion": context.occasion,
+        "guests": context.guests,
+        "budget": context.budget,
+        "food_pairing": context.food_pairing,
+        "preferred_colors": [c.name for c in preferences.preferred_colors or []],
+        "preferred_types": [t.name for t in preferences.preferred_types or []],
+        "taste_preferences": asdict(taste) if taste else None,
+        "preferred_regions": list(preferences.preferred_regions or []),
+        "preferred_grapes": list(preferences.preferred_grapes or []),
+    }
+
+
+def build_intent_prompt(new_messages: List[Any], context: Optional[UserContext] = None) -> str:
+    """Prompt asking for the changes `new_messages` make to `context`."""
+    known = json.dumps(context_to_dict(context or UserContext()), ensure_ascii=False)
+    return f"""
+You are an expert wine assistant helping a user plan the wine for an event.
+
+What is known so far about the user's request, as JSON:
+{known}
+
+New messages of the conversation:
+{format_messages(new_messages)}
+
+Update what is known with the new messages, giving priority to the latest user request.
+Respond with a single, valid JSON object containing ONLY the fields below that the new messages add or change.
+Omit fields that stay the same. Always include clarification_prompt_to_user.
+A list field you include replaces the known list, so give the complete new list. Set a field to null, or a list to [], when the user withdraws it.
+
+Fields:
+- occasion: string (e.g., "wedding", "casual dinner", "celebration")
+- guests: integer (number of guests)
+- budget: float (total budget for wines, if mentioned)
+- food_pairing: string (e.g., "steak", "seafood", "spicy thai")
+- preferred_colors: complete list of strings (must be one of WineColor enum: RED, WHITE, ROSE). Infer this based on food or occasion if not explicit.
+- preferred_types: complete list of strings (must be one of WineType enum: STILL, SPARKLING, DESSERT, FORTIFIED). Infer this if possible.
+- taste_preferences: object with any of the keys "body", "acidity", "sweetness", "tannin" that changed (each an integer from 1-5, where 1 is low/light and 5 is high/full, or null to drop it).
+- preferred_regions: complete list of strings (e.g., ["Napa Valley", "Bordeaux"])
+- preferred_grapes: complete list of strings (e.g., ["Cabernet Sauvignon", "Chardonnay"]). Infer these based on food, occasion, or stated preferences.
+- clarification_prompt_to_user: string (A polite question to the user if essential information like occasion, guest count, or budget is still missing or ambiguous). If no clarification is needed, set to null.
+
+Example JSON output after the user said "make it 8 people and we're having lamb":
+{{ "guests": 8, "food_pairing": "lamb", "preferred_colors": ["RED"], "preferred_grapes": ["Syrah"], "clarification_prompt_to_user": null }}
+
+Example JSON output after the user said "actually, switch from red to white, and forget the budget":
+{{ "preferred_colors": ["WHITE"], "budget": null, "clarification_prompt_to_user": null }}
+"""
+
+
+def parse_intent_response(raw_json: str) -> Dict[str, Any]:
+    """Parse the JSON answer of the LLM, which is sometimes wrapped in a ``` block."""
+    raw_json = raw_json.strip()
+    if raw_json.startswith("```json"):
+        raw_json = raw_json[len("```json"):]
+    elif raw_json.startswith("```"):
+        raw_json = raw_json[len("```"):]
+    if raw_json.endswith("```"):
+        raw_json = raw_json[:-len("```")]
+    return json.loads(raw_json)
+
+
+def _unique(values: List[Any]) -> List[Any]:
+    seen, result = set(), []
+    for value in values:
+        if str(value).lower() not in seen:
+            seen.add(str(value).lower())
+            result.append(value)
+    return result
+
+
+def _enum_values(enum: Any, names: List[str]) -> List[Any]:
+    values = []
+    for name in names:
+        try:
+            values.append(enum[name.upper()])
+        except KeyError:
+            logger.warning(f"LLM returned invalid {enum.__name__}: {name}")
+    return values
+
+
+def merge_user_context(context: UserContext, delta: Dict[str, Any]) -> UserContext:
+    """Return a copy of `context` with the changes extracted from the latest messages.
+
+    Fields missing from `delta` keep their value, fields present replace it:
+    a list replaces the whole list and null or [] clears the field. Taste
+    preferences are updated key by key. The clarification prompt is replaced,
+    since it is about the latest turn only.
+    """
+    merged = copy.deepcopy(context)
+    for key in ("occasion", "guests", "budget", "food_pairing"):
+        if key in delta:
+            setattr(merged, key, delta[key])
+    merged.clarification_prompt = delta.get('clarification_prompt_to_user')
+
+    preferences = merged.preferences
+    if 'preferred_colors' in delta:
+        preferences.preferred_colors = _unique(_enum_values(WineColor, delta['preferred_colors'] or []))
+    if 'preferred_types' in delta:
+        preferences.preferred_types = _unique(_enum_values(WineType, delta['preferred_types'] or []))
+    if 'preferred_regions' in delta:
+        preferences.preferred_regions = _unique(delta['preferred_regions'] or [])
+    if 'preferred_grapes' in delta:
+        preferences.preferred_grapes = _unique(delta['preferred_grapes'] or [])
+
+    if 'taste_preferences' in delta:
+        taste_data = delta['taste_preferences']
+        if taste_data:
+            current = asdict(preferences.taste_preferences) if preferences.taste_preferences else dict.fromkeys(TASTE_KEYS)
+            current.update({k: taste_data[k] for k in TASTE_KEYS if k in taste_data})
+            preferences.taste_preferences = TasteProfile(**current) if any(v is not None for v in current.values()) else None
+        else:
+            preferences.taste_preferences = None
+    return merged
+
+
+if __name__ == "__main__":
+    # python -m src.planner_old.intent: prompt size per turn, from scratch vs incremental
+    turns = [
+        ("I'm hosting a dinner party and need some wine.", "Lovely! How many guests, and what is your budget?"),
+        ("About 12 people, and we have around $250 to spend.", "Great. What will you be serving?"),
+        ("Grilled lamb with rosemary, then a chocolate tart.", "A Syrah or Malbec would suit the lamb. Any regions you like?"),
+        ("We loved a Rioja last summer, maybe something Spanish?", "Tempranillo from Rioja or Ribera del Duero then."),
+    ]
+    context = UserContext(
+        occasion="dinner party", guests=12, budget=250.0, food_pairing="grilled lamb",
+        preferences=UserPreferences(preferred_colors=[WineColor.RED], preferred_regions=["Rioja"],
+                                    preferred_grapes=["Tempranillo", "Syrah"]),
+    )
+    history: List[Any] = []
+    print(f"{'turn':>5} {'from scratch':>14} {'incremental':>12}")
+    for turn in range(1, 101):
+        user, assistant = turns[(turn - 1) % len(turns)]
+        history += [HumanMessage(content=user), AIMessage(content=assistant)]
+        full = build_intent_prompt(history[:-1])
+        incremental = build_intent_prompt(history[-3:-1], context)
+        if turn in (1, 2, 5, 10, 20, 50, 100):
+            print(f"{turn:>5} {len(full):>13}c {len(incremental):>11}c")
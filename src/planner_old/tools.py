@@ -6,6 +6,8 @@ import json # Ensure json is imported if used by Filters or SearchParams interna
 # Import necessary components from memory_agent.tools
 from memory_agent.tools import query_ai_service, SearchParams
 from memory_agent.tools import Filters as VinovossFilters # Alias to avoid name collision
+from memory_agent.keywords import get_keyword_matcher
+from memory_agent.event_calculator import EventEstimate, estimate_event, wine_category
 
 class WineColor(Enum):
     RED = 'Red'
@@ -102,37 +104,28 @@ class WineSearchResult:
     is_blended: Optional[bool] = None
 
 
+def _filters_from_fragment(fragment: Dict) -> WineFilters:
+    """Convert a keyword matcher filter fragment to `WineFilters`."""
+    fragment = dict(fragment)
+    if 'wine_colors' in fragment:
+        fragment['wine_colors'] = [WineColor(c) for c in fragment['wine_colors']]
+    if 'wine_types' in fragment:
+        fragment['wine_types'] = [WineType(t) for t in fragment['wine_types']]
+    return WineFilters(**fragment)
+
 def create_occasion_filters(occasion: str) -> WineFilters:
     """Create wine filters based on the occasion using Vinovoss patterns."""
-    filters = WineFilters()
-    
-    if occasion.lower() == 'wedding':
-        filters.wine_types = [WineType.SPARKLING, WineType.STILL]
-        filters.price_min = 30  # Higher quality for weddings
-        filters.expert_rating = 4  # Higher rated wines for special occasions
-    elif occasion.lower() == 'dinner':
-        filters.wine_types = [WineType.STILL]
-        filters.expert_rating = 3
-    elif occasion.lower() == 'celebration':
-        filters.wine_types = [WineType.SPARKLING]
-        filters.expert_rating = 4
-    
-    return filters
+    # Occasion keywords and their filters live in memory_agent/wine_keywords.json
+    return _filters_from_fragment(get_keyword_matcher().match(occasion).filters(kinds=["occasions"]))
 
 def create_food_filters(food: str) -> WineFilters:
     """Create basic wine filters based on food pairing.
     The LLM agent calling this tool is expected to provide more nuanced
     wine style, color, or grape preferences based on its knowledge.
     """
-    filters = WineFilters()
-    filters.foods = [food.lower()]
-
     # Basic heuristic for wine color - LLM should refine this.
-    if any(meat in food.lower() for meat in ['beef', 'steak', 'lamb', 'pork', 'game']):
-        filters.wine_colors = [WineColor.RED]
-    elif any(item in food.lower() for item in ['fish', 'seafood', 'shellfish', 'chicken', 'turkey']):
-        filters.wine_colors = [WineColor.WHITE]
-    
+    filters = _filters_from_fragment(get_keyword_matcher().match(food).filters(kinds=["foods"]))
+    filters.foods = [food.lower()]
     return filters
 
 def construct_search_query(occasion: str, food_pairing: Optional[str] = None, style: Optional[WineStyle] = None) -> str:
@@ -144,12 +137,9 @@ def construct_search_query(occasion: str, food_pairing: Optional[str] = None, st
         query_parts.append(style.value)
     
     # Add occasion-specific terms
-    if occasion.lower() == 'wedding':
-        if not style:
-            query_parts.append('Sparkling')
-    elif occasion.lower() == 'dinner':
-        if not style:
-            query_parts.append('Full-bodied')
+    entry = get_keyword_matcher().match(occasion).first("occasions")
+    if not style and entry and entry.query:
+        query_parts.append(entry.query)
     
     # Add basic term
     query_parts.append('wine')
@@ -408,3 +398,25 @@ def wine_search(
             continue
             
     return structured_results
+
+
+def estimate_shopping(wines: List[WineSearchResult], guests: int, duration_hours: float = 3.0) -> EventEstimate:
+    """Estimate the bottles of each recommended wine for an event with `estimate_event`.
+
+    The volume is split equally across the colours and types of the wines. The
+    search API returns neither for most wines; those share an "Any" category.
+    Allocations are titled with the index of their wine in `wines`, so that
+    wines with the same title are told apart.
+    """
+    records = []
+    for index, wine in enumerate(wines):
+        known = {"wine_color": wine.color.value if wine.color else None, "wine_type": wine.type.value if wine.type else None}
+        records.append({
+            "title": str(index),
+            "price": wine.price,
+            "shopping_prices": [asdict(p) for p in wine.shopping_prices],
+            "bottle_volume": wine.bottle_volume,
+            "wine_type": wine_category(known) or "Any",
+        })
+    mix = {record["wine_type"]: 1.0 for record in records} or None
+    return estimate_event(guests, duration_hours, mix, records)
@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The planner imports its modules by file name, as when it runs from src/planner
+sys.path.insert(0, str(Path(__file__).parents[2] / "src" / "planner"))
@@ -0,0 +1,52 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from langchain_core.tools import tool
+
+from agent_pool import AgentPool
+
+
+@tool
+def search(query: str) -> str:
+    """Search wines."""
+    return query
+
+
+def test_agents_are_built_once_per_key() -> None:
+    built = []
+    pool = AgentPool(lambda agent_type, tools, prompt: built.append(agent_type) or object())
+
+    agent = pool.get("researcher", [search], "researcher")
+    assert pool.get("researcher", [search], "researcher") is agent
+    assert pool.get("coder", [search], "coder") is not agent
+    assert built == ["researcher", "coder"]
+    assert (pool.metrics.hits, pool.metrics.misses) == (1, 2)
+    assert set(pool.metrics.compile_seconds) == {("researcher", ("search",), "researcher"), ("coder", ("search",), "coder")}
+    assert pool.metrics.total_compile_seconds >= 0
+
+    pool.clear()
+    pool.get("researcher", [search], "researcher")
+    assert built == ["researcher", "coder", "researcher"] and len(pool) == 1
+
+
+def test_concurrent_gets_compile_once() -> None:
+    calls = []
+
+    def factory(agent_type, tools, prompt):
+        calls.append(threading.get_ident())
+        time.sleep(0.2)
+        return object()
+
+    pool = AgentPool(factory)
+    start = threading.Barrier(8)
+
+    def get():
+        start.wait()
+        return pool.get("researcher", [search], "researcher")
+
+    with ThreadPoolExecutor(8) as executor:
+        agents = list(executor.map(lambda _: get(), range(8)))
+    assert len(calls) == 1 and pool.metrics.misses == 1
+    assert all(agent is agents[0] for agent in agents)
+    assert pool.metrics.compile_seconds[("researcher", ("search",), "researcher")] >= 0.2
@@ -0,0 +1,55 @@
+import sqlite3
+
+from memory_agent.archive import ChatArchiver, ChatTurn, DbApiChatHistorySink
+
+
+class ListSink:
+    def __init__(self, fail: bool = False) -> None:
+        self.batches: list[list[ChatTurn]] = []
+        self.fail = fail
+
+    def write_batch(self, turns: list[ChatTurn]) -> None:
+        if self.fail:
+            raise ConnectionError("archive database is down")
+        self.batches.append(turns)
+
+
+def test_drops_turns_when_the_spool_is_full(tmp_path) -> None:
+    archiver = ChatArchiver(ListSink(), spool_path=str(tmp_path / "spool.db"), max_spool=2)
+
+    assert [archiver.archive_turn("t", f"q{i}", f"a{i}") for i in range(3)] == [True, True, False]
+    assert archiver.metrics.enqueued == 2
+    assert archiver.metrics.dropped == 1
+    assert archiver.metrics.spool_depth == 2
+
+
+def test_flushes_in_batches_and_keeps_failed_batches(tmp_path) -> None:
+    sink = ListSink(fail=True)
+    archiver = ChatArchiver(sink, spool_path=str(tmp_path / "spool.db"), batch_size=2)
+    for i in range(5):
+        archiver.archive_turn("t", f"q{i}", f"a{i}")
+
+    assert archiver.flush() == 0
+    assert archiver.metrics.failed_flushes == 1
+    assert archiver.metrics.spool_depth == 5
+
+    sink.fail = False
+    assert archiver.flush() == 5
+    assert [len(batch) for batch in sink.batches] == [2, 2, 1]
+    assert [turn.user_message for batch in sink.batches for turn in batch] == [f"q{i}" for i in range(5)]
+    assert archiver.metrics.spool_depth == 0
+    assert archiver.metrics.flush_lag_seconds == 0
+
+
+def test_spooled_turns_survive_a_restart(tmp_path) -> None:
+    spool_path = str(tmp_path / "spool.db")
+    ChatArchiver(ListSink(), spool_path=spool_path).archive_turn("t", "q", "a", user_id="u")
+
+    sink = DbApiChatHistorySink(lambda: sqlite3.connect(tmp_path / "history.db"), table="chat_history")
+    archiver = ChatArchiver(sink, spool_path=spool_path)
+    assert archiver.metrics.spool_depth == 1
+    archiver.start()
+    archiver.stop()
+
+    rows = sqlite3.connect(tmp_path / "history.db").execute("SELECT thread_id, user_id, user_message FROM chat_history")
+    assert rows.fetchall() == [("t", "u", "q")]
@@ -0,0 +1,73 @@
+import sqlite3
+
+import pytest
+from langchain_core.messages import AIMessage, ToolMessage
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from memory_agent import retention as retention_module
+from memory_agent.blobs import (
+    MISSING_BLOB_CONTENT,
+    BlobOffloadingSerializer,
+    BlobStore,
+    MissingBlobError,
+    hydrate,
+    offload,
+)
+from memory_agent.retention import CheckpointRetention, RetentionPolicy
+
+
+def _put_thread(saver: SqliteSaver, store: BlobStore, thread_id: str, result: str) -> None:
+    wines = offload([{"title": result, "price": i} for i in range(100)], store=store)
+    checkpoint = empty_checkpoint()
+    checkpoint["channel_values"] = {
+        "messages": [
+            AIMessage("", tool_calls=[{"name": "sort_wines", "args": {"wines": wines}, "id": "1"}]),
+            ToolMessage(result * 3000, tool_call_id="1"),
+        ],
+        "wines": wines,
+    }
+    config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+    saver.put(config, checkpoint, {"step": 0}, {})
+
+
+def test_sweep_keeps_blobs_of_live_threads(tmp_path, monkeypatch) -> None:
+    store = BlobStore(str(tmp_path / "blobs.db"))
+    saver = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False), serde=BlobOffloadingSerializer(store))
+    _put_thread(saver, store, "live", "a")
+    _put_thread(saver, store, "gone", "b")
+    saver.delete_thread("gone")
+    # Sweep as if every blob was stored before the references were read
+    monkeypatch.setattr(retention_module, "_SWEEP_GRACE_SECONDS", -60)
+
+    retention = CheckpointRetention(saver, RetentionPolicy(thread_ttl_seconds=None), blob_store=store)
+    assert retention.run_once()["evicted_blobs"] == 2
+
+    (count,) = store.conn.execute("SELECT COUNT(*) FROM blobs").fetchone()
+    assert count == 2
+    state = saver.get_tuple({"configurable": {"thread_id": "live"}}).checkpoint["channel_values"]
+    assert state["messages"][1].content == "a" * 3000
+    assert hydrate(state["wines"], store=store)[0]["title"] == "a"
+
+
+def test_recent_blobs_are_not_swept(tmp_path) -> None:
+    store = BlobStore(str(tmp_path / "blobs.db"))
+    saver = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False), serde=BlobOffloadingSerializer(store))
+    # Stored by a checkpoint that is not written yet
+    offload(["x" * 3000], store=store)
+
+    retention = CheckpointRetention(saver, blob_store=store)
+    assert retention.run_once()["evicted_blobs"] == 0
+
+
+def test_missing_blobs(tmp_path) -> None:
+    store = BlobStore(str(tmp_path / "blobs.db"))
+    saver = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False), serde=BlobOffloadingSerializer(store))
+    _put_thread(saver, store, "a", "a")
+    state = saver.get_tuple({"configurable": {"thread_id": "a"}}).checkpoint["channel_values"]
+    store.sweep(set(), marked_at=float("inf"))
+
+    with pytest.raises(MissingBlobError):
+        hydrate(state["wines"], store=store)
+    state = saver.get_tuple({"configurable": {"thread_id": "a"}}).checkpoint["channel_values"]
+    assert state["messages"][1].content == MISSING_BLOB_CONTENT
@@ -0,0 +1,72 @@
+import importlib
+import sqlite3
+import warnings
+from typing import TypedDict
+
+from langgraph.checkpoint.sqlite import SqliteSaver
+from langgraph.graph import END, START, StateGraph
+from langgraph.types import Command, interrupt
+from langgraph.warnings import LangGraphDeprecationWarning
+
+import checkpointer as checkpointer_module
+from checkpointer import CheckpointerLimits, TieredCheckpointer
+
+
+class State(TypedDict, total=False):
+    feedback: str
+
+
+def _graph(checkpointer: TieredCheckpointer):
+    def ask(state: State) -> State:
+        return {"feedback": interrupt("Accept the plan?")}
+
+    builder = StateGraph(State)
+    builder.add_node("ask", ask)
+    builder.add_edge(START, "ask")
+    builder.add_edge("ask", END)
+    return builder.compile(checkpointer=checkpointer)
+
+
+def _checkpointer(max_threads: int = 1) -> TieredCheckpointer:
+    durable = SqliteSaver(sqlite3.connect(":memory:", check_same_thread=False))
+    return TieredCheckpointer(durable, CheckpointerLimits(max_threads=max_threads))
+
+
+def test_interrupted_thread_survives_eviction() -> None:
+    checkpointer = _checkpointer()
+    graph = _graph(checkpointer)
+    a, b = ({"configurable": {"thread_id": t}} for t in "ab")
+    graph.invoke({}, a)
+    graph.invoke({}, b)
+    assert checkpointer.metrics.evicted == 1
+
+    assert graph.invoke(Command(resume="[ACCEPTED]"), a)["feedback"] == "[ACCEPTED]"
+    assert checkpointer.metrics.disk_hits == 1
+
+
+def test_resumed_thread_does_not_reload_its_interrupt() -> None:
+    checkpointer = _checkpointer()
+    graph = _graph(checkpointer)
+    a, b = ({"configurable": {"thread_id": t}} for t in "ab")
+    graph.invoke({}, a)
+    graph.invoke(Command(resume="[ACCEPTED]"), a)
+    assert checkpointer.durable.get_tuple(a) is None
+
+    # Completed threads only live in memory, the interrupted checkpoint must not come back
+    graph.invoke({}, b)
+    assert checkpointer.get_tuple(a) is None
+
+
+def test_memory_is_accounted_and_released() -> None:
+    checkpointer = _checkpointer(max_threads=2)
+    graph = _graph(checkpointer)
+    graph.invoke({}, {"configurable": {"thread_id": "a"}})
+    assert checkpointer.memory_bytes > 0
+    checkpointer.delete_thread("a")
+    assert checkpointer.memory_bytes == 0
+
+
+def test_no_deprecated_langgraph_imports() -> None:
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", LangGraphDeprecationWarning)
+        importlib.reload(checkpointer_module)
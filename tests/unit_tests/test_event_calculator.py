@@ -0,0 +1,52 @@
+from hypothesis import given
+from hypothesis import strategies as st
+
+from memory_agent.event_calculator import estimate_event, parse_event_request
+
+categories = st.sampled_from(["Red", "White", "Rose", "Sparkling"])
+mixes = st.dictionaries(categories, st.floats(min_value=0.1, max_value=10), min_size=1)
+wines = st.lists(
+    st.fixed_dictionaries(
+        {
+            "title": st.text(min_size=1, max_size=10),
+            "wine_color": categories,
+            "price": st.one_of(st.none(), st.floats(min_value=1, max_value=500)),
+            "bottle_volume": st.sampled_from([375, 750, 1500]),
+        }
+    ),
+    max_size=6,
+)
+
+
+@given(st.integers(0, 500), st.floats(0, 12), mixes, wines)
+def test_bottles_cover_consumption(guests, hours, mix, selected) -> None:
+    estimate = estimate_event(guests, hours, mix, selected)
+    for category in estimate.categories:
+        assert category.bottles * 750 >= category.ml - 1e-6
+        allocated = [a for a in estimate.allocations if a.category == category.category]
+        if allocated:
+            assert sum(a.bottles * a.bottle_ml for a in allocated) >= category.ml - 1e-6
+    assert abs(sum(c.share for c in estimate.categories) - 1) < 1e-9
+    if guests == 0:
+        assert estimate.total_bottles == 0 and estimate.cost_per_guest is None
+
+
+@given(st.integers(0, 300), st.integers(1, 50), st.floats(0, 12), mixes)
+def test_more_guests_never_need_fewer_bottles(guests, extra, hours, mix) -> None:
+    assert estimate_event(guests + extra, hours, mix).total_bottles >= estimate_event(guests, hours, mix).total_bottles
+
+
+@given(st.integers(1, 300), st.floats(1, 500))
+def test_cost_is_sum_of_allocations(guests, price) -> None:
+    estimate = estimate_event(guests, 3, wines=[{"title": "A", "wine_color": "Red", "price": price}])
+    assert estimate.total_cost == round(estimate.allocations[0].bottles * price, 2)
+    assert estimate.unallocated == []
+
+
+def test_parse_event_request() -> None:
+    assert parse_event_request("Calculate bottles for 40 guests over a 4-hour dinner, 60% red and 40% white") == {
+        "guests": 40,
+        "duration_hours": 4.0,
+        "mix": {"Red": 60.0, "White": 40.0},
+    }
+    assert parse_event_request("Search sparkling wines for 40 guests") is None
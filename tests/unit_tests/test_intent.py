@@ -0,0 +1,19 @@
+from src.planner_old.intent import UserContext, merge_user_context
+from src.planner_old.tools import WineColor
+
+
+def test_merge_replaces_and_clears_fields() -> None:
+    context = merge_user_context(
+        UserContext(),
+        {"occasion": "dinner", "budget": 200, "preferred_colors": ["RED"], "taste_preferences": {"body": 4}},
+    )
+    assert context.preferences.preferred_colors == [WineColor.RED]
+
+    context = merge_user_context(context, {"preferred_colors": ["WHITE"], "budget": None, "guests": 8})
+    assert context.preferences.preferred_colors == [WineColor.WHITE]
+    assert (context.occasion, context.budget, context.guests) == ("dinner", None, 8)
+    assert context.preferences.taste_preferences.body == 4
+
+    context = merge_user_context(context, {"preferred_colors": [], "taste_preferences": {"body": None}})
+    assert context.preferences.preferred_colors == []
+    assert context.preferences.taste_preferences is None
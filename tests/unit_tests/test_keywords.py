@@ -0,0 +1,30 @@
+import json
+
+from memory_agent.keywords import KEYWORDS_FILE, KeywordAutomaton, KeywordMatcher, keyword_reference
+
+
+def test_automaton_finds_overlapping_keywords():
+    automaton = KeywordAutomaton([("he", 1), ("she", 2), ("hers", 3), ("his", 4)])
+    assert sorted(automaton.iter_matches("ushers")) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
+
+
+def test_matcher_prefers_longest_keyword_at_word_boundaries():
+    matcher = KeywordMatcher.load()
+    slots = matcher.match("Rehearsal dinner: Oysters, blue cheese and a Crème Brûlée; no catfish")
+    assert [(m.entry.kind, m.entry.name, m.keyword) for m in slots.matches] == [
+        ("occasions", "wedding", "rehearsal dinner"),
+        ("foods", "Seafood", "oyster"),
+        ("foods", "Cheese", "blue cheese"),
+        ("foods", "Dessert", "creme brulee"),
+    ]
+    assert matcher.match("steak and fish").filters() == {"wine_colors": ["Red"]}
+    filters = matcher.match("Napa cabernet or a Bordeaux").filters()
+    assert filters["grapes"] == ["Cabernet Sauvignon"] and filters["regions"] == ["Napa Valley", "Bordeaux"]
+    assert matcher.match("steak and fish") is matcher.match("steak and fish")
+
+
+def test_keyword_reference_lists_the_data_file():
+    data = json.loads(KEYWORDS_FILE.read_text(encoding="utf8"))
+    reference = keyword_reference()
+    for kind in ("foods", "grapes", "regions"):
+        assert all(entry["name"] in reference for entry in data[kind])
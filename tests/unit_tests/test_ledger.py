@@ -0,0 +1,44 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.graph import MessagesState, StateGraph
+
+from memory_agent import ledger as ledger_module
+from memory_agent.ledger import Budget, LedgerCallbackHandler, LLMCall, LLMLedger, call_cost
+
+
+def test_calls_are_rolled_up_per_turn_and_thread_with_one_budget_alert(tmp_path):
+    usage = {"input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200}
+    model = GenericFakeChatModel(messages=iter([AIMessage(content="a red", usage_metadata=usage)] * 3))
+
+    builder = StateGraph(MessagesState)
+    builder.add_node("assistant", lambda state: {"messages": [model.invoke(state["messages"])]})
+    builder.set_entry_point("assistant")
+    alerts = []
+    ledger = LLMLedger(tmp_path / "ledger.jsonl", Budget(thread_tokens=2000), alert_hooks=[alerts.append])
+    graph = builder.compile(InMemorySaver()).with_config(callbacks=[LedgerCallbackHandler(ledger)])
+
+    config = {"configurable": {"thread_id": "t1"}, "metadata": {"user_id": "u1"}}
+    for message in ["wine for lamb", "cheaper", "thanks"]:
+        graph.invoke({"messages": [("user", message)]}, config)
+
+    assert [(c.node, c.thread_id, c.user_id, c.input_tokens) for c in ledger.calls] == [("assistant", "t1", "u1", 1000)] * 3
+    assert len(ledger.by_turn) == 3
+    assert ledger.report("thread")[0][0] == "t1" and ledger.by_thread["t1"].total_tokens == 3600
+    assert [(a.scope, a.limit, a.usage.calls) for a in alerts] == [("thread", "thread_tokens", 2)]
+    assert len((tmp_path / "ledger.jsonl").read_text().splitlines()) == 3
+
+
+def test_call_cost_uses_cached_input_price():
+    assert call_cost("gemini-2.0-flash", 1_000_000, 0, cached_tokens=1_000_000) == 0.025
+    assert call_cost("models/gemini-2.0-flash", 0, 1_000_000) == 0.40
+    assert call_cost("unknown-model", 10, 10) is None
+
+
+def test_alerts_are_forgotten_with_their_rollups(monkeypatch):
+    monkeypatch.setattr(ledger_module, "MAX_THREADS", 2)
+    ledger = LLMLedger(budget=Budget(turn_tokens=10), alert_hooks=[])
+    for turn in range(5):
+        ledger.record(LLMCall(model="m", thread_id="t1", turn_id=str(turn), input_tokens=20))
+    assert list(ledger.by_turn) == ["3", "4"]
+    assert ledger._alerted == {("turn", "3", "turn_tokens"), ("turn", "4", "turn_tokens")}
@@ -0,0 +1,42 @@
+import logging
+import queue
+
+from memory_agent.logs import DroppingQueueHandler, Sampler, Truncated
+
+
+def test_truncated_renders_lazily_and_caps_the_payload():
+    class Payload:
+        rendered = 0
+
+        def __str__(self):
+            Payload.rendered += 1
+            return "x" * 50
+
+    logger = logging.getLogger("test_logs")
+    logger.setLevel(logging.INFO)
+    logger.debug("payload %s", Truncated(Payload(), limit=10))
+    assert Payload.rendered == 0
+    assert str(Truncated(Payload(), limit=10)) == "xxxxxxxxxx... (40 more chars)"
+    assert str(Truncated({"wines": ["Rioja"]})) == '{"wines": ["Rioja"]}'
+
+
+def test_sampler_keeps_one_in_every_n_events():
+    quarter, every, never = Sampler(0.25), Sampler(1), Sampler(0)
+    assert sum(quarter() for _ in range(100)) == 25
+    assert all(every() for _ in range(10))
+    assert not any(never() for _ in range(10))
+
+
+def test_queued_records_keep_the_arguments_of_the_call():
+    records = queue.Queue()
+    handler = DroppingQueueHandler(records)
+    logger = logging.getLogger("test_logs.queue")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        wines = ["Rioja"]
+        logger.warning("wines %s %s", wines, Truncated(wines))
+        wines.append("Barolo")
+    finally:
+        logger.removeHandler(handler)
+    assert records.get_nowait().getMessage() == "wines ['Rioja'] [\"Rioja\"]"
@@ -0,0 +1,25 @@
+from memory_agent.metrics import MetricsRegistry
+
+
+def test_registry_renders_labelled_series_in_prometheus_text_format(tmp_path):
+    registry = MetricsRegistry()
+    calls = registry.counter("tool_calls_total", "Tool calls.", ["tool"])
+    latency = registry.histogram("search_seconds", "Search latency.", buckets=(0.1, 1))
+    sessions = registry.gauge("active_sessions", "Active sessions.")
+    calls.labels("wine_search").inc()
+    calls.labels(tool="wine_search").inc()
+    calls.labels('say "hi"').inc()
+    for seconds in (0.05, 0.5, 5):
+        latency.observe(seconds)
+    sessions.set_function(lambda: 3)
+
+    text = registry.render()
+    assert "# TYPE tool_calls_total counter" in text
+    assert 'tool_calls_total{tool="wine_search"} 2.0' in text
+    assert 'tool_calls_total{tool="say \\"hi\\""} 1.0' in text
+    assert 'search_seconds_bucket{le="0.1"} 1\nsearch_seconds_bucket{le="1.0"} 2\nsearch_seconds_bucket{le="+Inf"} 3' in text
+    assert "search_seconds_sum 5.55\nsearch_seconds_count 3" in text
+    assert "active_sessions 3.0" in text
+
+    registry.write(tmp_path / "metrics.prom")
+    assert (tmp_path / "metrics.prom").read_text() == text
@@ -0,0 +1,71 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TypedDict
+
+from langgraph.graph import START, StateGraph
+
+from memory_agent.profiling import ProfilingCallbackHandler, ProfilingConfig
+
+
+class State(TypedDict):
+    total: int
+
+
+def busy(state: State) -> dict:
+    return {"total": sum(len(str(i)) for i in range(200_000))}
+
+
+def also_busy(state: State) -> dict:
+    busy(state)
+    return {}
+
+
+def test_only_selected_threads_are_profiled(tmp_path):
+    builder = StateGraph(State)
+    builder.add_node("busy", busy)
+    builder.add_edge(START, "busy")
+    config = ProfilingConfig(thread_ids=frozenset({"slow"}), output_dir=tmp_path, interval_seconds=0.001)
+    graph = builder.compile().with_config(callbacks=[ProfilingCallbackHandler(config)])
+
+    graph.invoke({"total": 0}, {"configurable": {"thread_id": "other"}})
+    assert not list(tmp_path.iterdir())
+
+    graph.invoke({"total": 0}, {"configurable": {"thread_id": "slow"}})
+    (folded,) = tmp_path.glob("*-slow-*.folded")
+    (allocations,) = tmp_path.glob("*-slow-*.allocations.txt")
+    stacks = [line.rsplit(" ", 1) for line in folded.read_text().splitlines()]
+    assert stacks and all(count.isdigit() for _, count in stacks)
+    assert any("busy (test_profiling.py" in stack for stack, _ in stacks)
+    assert "peak traced memory" in allocations.read_text()
+
+
+def test_only_threads_running_the_turn_are_sampled(tmp_path):
+    builder = StateGraph(State)
+    builder.add_node("busy", busy)
+    builder.add_node("also_busy", also_busy)
+    builder.add_edge(START, "busy")
+    builder.add_edge(START, "also_busy")
+    config = ProfilingConfig(thread_ids=frozenset({"slow"}), output_dir=tmp_path, interval_seconds=0.001)
+    graph = builder.compile().with_config(callbacks=[ProfilingCallbackHandler(config)])
+
+    stop = threading.Event()
+
+    def unrelated() -> None:
+        while not stop.is_set():
+            sum(range(1000))
+
+    with ThreadPoolExecutor() as executor:
+        executor.submit(unrelated)
+        try:
+            graph.invoke({"total": 0}, {"configurable": {"thread_id": "slow"}})
+        finally:
+            stop.set()
+    (folded,) = tmp_path.glob("*-slow-*.folded")
+    stacks = folded.read_text()
+    assert "ThreadPoolExecutor" in stacks and "busy (test_profiling.py" in stacks
+    assert "unrelated" not in stacks
+
+
+def test_profiling_is_off_by_default():
+    assert not ProfilingConfig().enabled
+    assert not ProfilingConfig().should_profile("any")
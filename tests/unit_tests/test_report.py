@@ -0,0 +1,37 @@
+import json
+
+from langchain_core.messages import AIMessage, ToolMessage
+
+from memory_agent.event_calculator import estimate_event
+from models import QuantityRecord
+from report import records_from_allocations, records_from_messages, render_report_rows
+
+
+def _search(call_id: str, filters: dict, titles: list[str]) -> list:
+    return [
+        AIMessage("", tool_calls=[{"name": "wine_search", "args": {"query": "wine", "filters": filters}, "id": call_id}]),
+        ToolMessage(
+            json.dumps([{"title": title, "price": 20.0} for title in titles]), tool_call_id=call_id, name="wine_search"
+        ),
+    ]
+
+
+def test_search_results_get_the_colour_of_their_filters() -> None:
+    messages = _search("1", {"wine_colors": ["Red"]}, ["Merlot"]) + _search(
+        "2", {"wine_colors": ["White", "Rose"]}, ["Blend"]
+    )
+    wines, _ = records_from_messages(messages)
+    assert [(w.title, w.wine_color) for w in wines] == [("Merlot", "Red"), ("Blend", None)]
+
+    # The calculator allocates the event's bottles to the wines of each colour
+    wines = [w.model_dump(exclude_none=True) for w in wines]
+    estimate = estimate_event(20, 3, {"Red": 1}, wines)
+    assert [(q.title, q.quantity > 0) for q in records_from_allocations(estimate.allocations)] == [("Merlot", True)]
+
+
+def test_report_lists_only_selected_wines() -> None:
+    wines, _ = records_from_messages(_search("1", {}, ["Merlot", "Syrah", "Malbec"]))
+    rows = list(render_report_rows(wines, [QuantityRecord(title="syrah", quantity=3)]))
+    assert len(rows) == 5
+    assert rows[2].startswith("| Syrah |") and "$60.00" in rows[2]
+    assert rows[-1] == "**Total: 3 bottles, $60.00**"
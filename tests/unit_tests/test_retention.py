@@ -0,0 +1,61 @@
+import sqlite3
+import time
+
+from langgraph.checkpoint.base import empty_checkpoint
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from memory_agent.retention import CheckpointRetention, RetentionPolicy, checkpoint_timestamp
+
+
+def _saver_with_checkpoints(threads: dict[str, int]) -> SqliteSaver:
+    conn = sqlite3.connect(":memory:", check_same_thread=False)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+    saver = SqliteSaver(conn)
+    for thread_id, count in threads.items():
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        for step in range(count):
+            checkpoint = empty_checkpoint()
+            checkpoint["channel_values"] = {"messages": ["x" * 1000]}
+            config = saver.put(config, checkpoint, {"step": step}, {})
+            saver.put_writes(config, [("messages", "y" * 100)], task_id=f"task-{step}")
+    return saver
+
+
+def test_checkpoint_timestamp() -> None:
+    checkpoint = empty_checkpoint()
+    assert abs(checkpoint_timestamp(checkpoint["id"]) - time.time()) < 5
+
+
+def test_run_once_keeps_latest_checkpoints_and_compacts_writes() -> None:
+    saver = _saver_with_checkpoints({"a": 8, "b": 2})
+    retention = CheckpointRetention(saver, RetentionPolicy(keep_last=3))
+
+    result = retention.run_once()
+
+    assert result["pruned_checkpoints"] == 5
+    assert result["compacted_writes"] == 5
+    stats = retention.db_stats()
+    assert stats["checkpoints"] == 5
+    assert stats["writes"] == 5
+    kept = list(saver.list({"configurable": {"thread_id": "a"}}))
+    assert [c.metadata["step"] for c in kept] == [7, 6, 5]
+    # Older kept checkpoints keep their writes so they can be replayed
+    assert all(c.pending_writes for c in kept)
+
+
+def test_expire_idle_threads() -> None:
+    saver = _saver_with_checkpoints({"a": 1, "b": 1})
+    retention = CheckpointRetention(saver, RetentionPolicy(thread_ttl_seconds=60))
+
+    assert retention.expire_threads(now=time.time()) == []
+    assert sorted(retention.expire_threads(now=time.time() + 120)) == ["a", "b"]
+    assert retention.db_stats()["threads"] == 0
+
+
+def test_thread_footprints_sorted_by_size() -> None:
+    saver = _saver_with_checkpoints({"small": 1, "large": 4})
+    footprints = CheckpointRetention(saver).thread_footprints()
+
+    assert [f["thread_id"] for f in footprints] == ["large", "small"]
+    assert footprints[0]["checkpoints"] == 4
+    assert footprints[0]["write_bytes"] > 0
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from sandbox import SandboxLimits, SandboxPool, resource
+
+
+@pytest.fixture
+def pool():
+    pool = SandboxPool(size=1, limits=SandboxLimits(wall_seconds=10), max_executions=3)
+    yield pool
+    pool.close()
+
+
+def test_namespaces_persist_per_thread(pool) -> None:
+    assert pool.run("x = 2", thread_id="a").error is None
+    assert pool.run("print(x * 21)", thread_id="a").output == "42\n"
+    assert "NameError" in pool.run("print(x)", thread_id="b").error
+
+
+def test_workers_do_not_inherit_secrets(monkeypatch) -> None:
+    monkeypatch.setenv("GEMINI_API_KEY", "secret")
+    pool = SandboxPool(size=1)
+    try:
+        result = pool.run("import os; print(os.environ.get('GEMINI_API_KEY'), os.environ['OMP_NUM_THREADS'])")
+        assert result.output == "None 1\n"
+    finally:
+        pool.close()
+
+
+def test_wall_time_limit_kills_the_worker(pool) -> None:
+    pool.run("x = 1", thread_id="a")
+    result = pool.run("import time; time.sleep(5)", thread_id="a", limits=SandboxLimits(wall_seconds=0.5))
+    assert result.timed_out
+    assert pool.recycled == 1
+    # The replacement worker starts with an empty namespace
+    assert "NameError" in pool.run("print(x)", thread_id="a").error
+
+
+@pytest.mark.skipif(resource is None, reason="rlimits are not available")
+def test_memory_limit(pool) -> None:
+    result = pool.run("b = bytearray(1024 * 2**20)", limits=SandboxLimits(memory_mb=64))
+    assert "MemoryError" in result.error
+    assert pool.run("print('still alive')").output == "still alive\n"
+
+
+def test_workers_are_recycled_after_max_executions(pool) -> None:
+    for _ in range(3):
+        pool.run("x = 1", thread_id="a")
+    assert pool.recycled == 1
+    assert "NameError" in pool.run("print(x)", thread_id="a").error
+
+
+def test_workers_cannot_read_project_files(tmp_path, monkeypatch) -> None:
+    (tmp_path / ".env").write_text("GEMINI_API_KEY=secret\n")
+    (tmp_path / "conf.yaml").write_text("api_key: secret\n")
+    monkeypatch.chdir(tmp_path)
+    pool = SandboxPool(size=1)
+    try:
+        for path in (".env", "conf.yaml", "./.env"):
+            assert "FileNotFoundError" in pool.run(f"print(open({path!r}).read())").error
+        cwd = pool.run("import os; print(os.getcwd())").output.strip()
+        assert os.path.isdir(cwd) and cwd != str(tmp_path)
+    finally:
+        pool.close()
+    # The working directory goes with the worker
+    assert not os.path.exists(cwd)
@@ -0,0 +1,51 @@
+import itertools
+import random
+
+from memory_agent.selection import select_within_budget
+
+
+def _best_by_enumeration(prices, scores, budget, max_per_wine, min_bottles, max_bottles):
+    best = None
+    for quantities in itertools.product(range(max_per_wine + 1), repeat=len(prices)):
+        bottles = sum(quantities)
+        cost = sum(q * p for q, p in zip(quantities, prices))
+        if cost > budget or bottles < min_bottles or (max_bottles is not None and bottles > max_bottles):
+            continue
+        score = sum(q * s for q, s in zip(quantities, scores))
+        best = score if best is None else max(best, score)
+    return best
+
+
+def test_selection_is_optimal_on_small_instances() -> None:
+    rng = random.Random(0)
+    for _ in range(40):
+        n = rng.randint(1, 5)
+        prices = [rng.choice([10, 15, 20, 25, 40, 60]) for _ in range(n)]
+        scores = [rng.choice([3.5, 4.0, 4.2, 4.6]) for _ in range(n)]
+        budget = rng.choice([5, 30, 50, 100])
+        max_per_wine = rng.randint(1, 3)
+        min_bottles = rng.choice([0, 0, 1, 2])
+        max_bottles = rng.choice([None, 0, 1, 3, 6])
+        selection = select_within_budget(prices, scores, budget, max_per_wine, min_bottles, max_bottles)
+        best = _best_by_enumeration(prices, scores, budget, max_per_wine, min_bottles, max_bottles)
+        assert selection.feasible == (best is not None)
+        if best is not None:
+            assert abs(selection.total_score - best) < 1e-9
+            assert selection.total_cost <= budget
+            assert min_bottles <= selection.bottles <= (max_bottles or selection.bottles)
+
+
+def test_selection_skips_missing_prices() -> None:
+    selection = select_within_budget([None, 30.0, 25.0], [4.8, 4.0, None], budget=60)
+    assert selection.skipped == [0]
+    # An unrated wine adds nothing to the score, so it is only bought to reach min_bottles
+    assert selection.quantities == [0, 1, 0]
+    assert select_within_budget([None, 30.0, 25.0], [4.8, 4.0, None], budget=60, min_bottles=2).quantities == [0, 1, 1]
+
+
+def test_selection_is_infeasible_when_nothing_can_be_bought() -> None:
+    for prices in ([None, None], [80.0, 90.0]):
+        selection = select_within_budget(prices, [4.0, 4.5], budget=50, min_bottles=1)
+        assert not selection.feasible
+        assert selection.quantities == [0, 0]
+    assert select_within_budget([80.0, 90.0], [4.0, 4.5], budget=50).feasible
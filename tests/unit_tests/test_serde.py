@@ -0,0 +1,46 @@
+import json
+
+import pytest
+from langchain_core.messages import HumanMessage, ToolMessage
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
+
+from memory_agent.serde import CompressedSerializer, train_dictionary
+
+RECORDS = [json.dumps({"title": f"Chateau {i}", "wine_color": "Red", "price": i}).encode() for i in range(50)]
+CHECKPOINT = {
+    "channel_values": {
+        "messages": [
+            HumanMessage("red wine under 30 dollars"),
+            ToolMessage("[" + ",".join(r.decode() for r in RECORDS) + "]", tool_call_id="1", name="wine_search"),
+        ]
+    }
+}
+
+
+@pytest.mark.parametrize("codec", ["zlib", "zstd"])
+@pytest.mark.parametrize("with_dictionary", [False, True])
+def test_round_trip(codec: str, with_dictionary: bool) -> None:
+    dictionaries = [train_dictionary(RECORDS)] if with_dictionary else []
+    serde = CompressedSerializer(codec=codec, dictionaries=dictionaries)
+
+    type_, data = serde.dumps_typed(CHECKPOINT)
+
+    assert "+" in type_
+    assert (".d" in type_) == with_dictionary
+    assert len(data) < len(JsonPlusSerializer().dumps_typed(CHECKPOINT)[1])
+    assert serde.loads_typed((type_, data)) == CHECKPOINT
+
+
+def test_reads_legacy_uncompressed_checkpoints() -> None:
+    legacy = JsonPlusSerializer().dumps_typed(CHECKPOINT)
+
+    assert CompressedSerializer().loads_typed(legacy) == CHECKPOINT
+
+
+def test_older_dictionaries_stay_readable() -> None:
+    old = train_dictionary(RECORDS[:25])
+    written = CompressedSerializer(codec="zlib", dictionaries=[old]).dumps_typed(CHECKPOINT)
+
+    assert CompressedSerializer(codec="zlib", dictionaries=[old, train_dictionary(RECORDS)]).loads_typed(written) == CHECKPOINT
+    with pytest.raises(ValueError):
+        CompressedSerializer(codec="zlib").loads_typed(written)
@@ -0,0 +1,23 @@
+from src.planner_old.tools import WineColor, WineSearchResult, WineShoppingPrice, estimate_shopping
+
+
+def test_bottles_come_from_the_event_calculator() -> None:
+    wines = [
+        WineSearchResult(id="1", title="Rioja", color=WineColor.RED, price=20.0),
+        WineSearchResult(id="2", title="Rioja", color=WineColor.RED, price=10.0),
+        WineSearchResult(id="3", title="Unknown", shopping_prices=[WineShoppingPrice(price_amount=15.0)]),
+    ]
+    # 12 guests over 3 hours drink 48 glasses, 7.2L, half red and half of unknown colour
+    estimate = estimate_shopping(wines, 12)
+    assert [(a.title, a.category, a.bottles, a.subtotal) for a in estimate.allocations] == [
+        ("0", "Red", 3, 60.0),
+        ("1", "Red", 3, 30.0),
+        ("2", "Any", 5, 75.0),
+    ]
+    assert estimate.total_bottles == 11
+
+
+def test_no_wines() -> None:
+    estimate = estimate_shopping([], 12)
+    assert estimate.allocations == [] and estimate.total_bottles == 10
+    assert estimate_shopping([], 0).total_bottles == 0
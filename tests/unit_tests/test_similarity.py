@@ -0,0 +1,63 @@
+import json
+
+import numpy as np
+import pytest
+
+from memory_agent import similarity as similarity_module
+from memory_agent.similarity import SimilarityIndex, _synthetic_catalog, build_similarity_index, cKDTree, get_similarity_index
+from memory_agent.tools import similar_wines
+
+VINTAGES = [
+    {"id": "1", "title": "Bold red", "wine_color": "Red", "taste": {"body": 4.5, "tannin": 4.2}, "price": 60},
+    {"id": "2", "title": "Bold red too", "wine_color": "Red", "taste": {"body": 4.3, "tannin": 4.0}, "price": 55},
+    {"id": "3", "title": "Light red", "wine_color": "Red", "taste": {"body": 1.5, "tannin": 1.2}, "price": 20},
+    {"id": "4", "title": "Bold white", "wine_color": "White", "taste": {"body": 4.5, "tannin": 1.0}, "price": 60},
+]
+
+
+def test_similar_wines_by_taste_and_colour() -> None:
+    index = SimilarityIndex.from_vintages(VINTAGES)
+    assert [r[0] for r in index.query("1", k=3)] == ["2", "3", "4"]
+    assert [r[0] for r in index.query("1", k=3, filters={"price_max": 30})] == ["3"]
+    with pytest.raises(ValueError):
+        index.query("missing")
+
+
+def test_similar_wines_tool(tmp_path, monkeypatch) -> None:
+    index_path = tmp_path / "similarity_index.npz"
+    monkeypatch.setattr(similarity_module, "similarity_index_path", lambda: index_path)
+    get_similarity_index.cache_clear()
+    try:
+        assert "No similarity index built" in similar_wines.invoke({"vintage_id": "1"})
+
+        catalog = tmp_path / "catalog.json"
+        catalog.write_text(json.dumps([{"data_type": "vintage", "data": v} for v in VINTAGES]))
+        assert build_similarity_index(catalog) == index_path
+        get_similarity_index.cache_clear()
+        results = similar_wines.invoke({"vintage_id": "1", "k": 3, "filters": {"wine_colors": ["Red"], "price_max": 58}})
+        assert [(r["id"], r["title"]) for r in results] == [("2", "Bold red too"), ("3", "Light red")]
+        assert "Unknown vintage" in similar_wines.invoke({"vintage_id": "missing"})
+    finally:
+        get_similarity_index.cache_clear()
+
+
+def test_save_and_load_without_pickle(tmp_path) -> None:
+    raw = _synthetic_catalog(50, np.random.default_rng(2))
+    ids = [str(i) for i in range(len(raw))]
+    index = SimilarityIndex(ids, raw, [f"Wine {i}" for i in ids])
+    index.save(tmp_path / "index.npz")
+
+    # np.load refuses object arrays unless allow_pickle is set
+    loaded = SimilarityIndex.load(tmp_path / "index.npz")
+    assert loaded.query("3", k=5) == index.query("3", k=5)
+
+
+@pytest.mark.skipif(cKDTree is None, reason="scipy is not installed")
+def test_kdtree_matches_brute_force() -> None:
+    raw = _synthetic_catalog(2000, np.random.default_rng(1))
+    ids = [str(i) for i in range(len(raw))]
+    brute = SimilarityIndex(ids, raw, ids, backend="brute")
+    tree = SimilarityIndex(ids, raw, ids, backend="kdtree")
+    for vintage_id in ("0", "17", "1999"):
+        for filters in (None, {"wine_colors": ["White"], "user_rating": 4}):
+            assert [r[0] for r in tree.query(vintage_id, 10, filters)] == [r[0] for r in brute.query(vintage_id, 10, filters)]
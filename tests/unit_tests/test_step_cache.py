@@ -0,0 +1,43 @@
+import step_cache as step_cache_module
+from models import Step, StepType
+from step_cache import StepCache, normalise_text
+
+
+def _step(title: str, description: str = "Find red wines under $29.99.", step_type=StepType.RESEARCH, result=None) -> Step:
+    return Step(need_search=True, title=title, description=description, step_type=step_type, execution_res=result)
+
+
+def test_normalise_text_keeps_prices_and_drops_sentence_periods() -> None:
+    assert normalise_text("Find  Red wines under $29.99. Then, rank them!") == "find red wines under $29.99 then rank them"
+    assert normalise_text("Pick 2.5 bottles... per 10% of guests.") == "pick 2.5 bottles per 10% of guests"
+
+
+def test_keys() -> None:
+    found = [_step("Earlier", result="Rioja at $20")]
+    research = _step("Search Rioja")
+    assert StepCache.key("researcher", research, []) == StepCache.key("researcher", _step("search  rioja."), found)
+    assert StepCache.key("researcher", research, []) != StepCache.key("researcher", _step("Search Rioja", "Find red wines under $30."), [])
+
+    # Processing steps depend on the findings they are given
+    processing = _step("Rank", step_type=StepType.PROCESSING)
+    assert StepCache.key("calculator", processing, []) != StepCache.key("calculator", processing, found)
+    assert StepCache.cacheable("researcher") and not StepCache.cacheable("coder")
+
+
+def test_hits_misses_expiry_and_eviction(monkeypatch) -> None:
+    now = [0.0]
+    monkeypatch.setattr(step_cache_module.time, "monotonic", lambda: now[0])
+    cache = StepCache(ttl_seconds=10, max_entries=2)
+
+    assert cache.get("a") is None
+    cache.put("a", "A")
+    cache.put("b", "B")
+    assert cache.get("a") == "A"
+    # "b" is the least recently used
+    cache.put("c", "C")
+    assert cache.get("b") is None and len(cache) == 2
+
+    now[0] = 11
+    assert cache.get("a") is None
+    assert (cache.metrics.hits, cache.metrics.misses, cache.metrics.expired, cache.metrics.evicted) == (1, 3, 1, 1)
+    assert cache.metrics.stores == 3 and cache.metrics.hit_rate == 0.25
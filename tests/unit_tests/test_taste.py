@@ -0,0 +1,65 @@
+import pytest
+
+from memory_agent.constants import acidity_adj, body_adj, intensity_adj, sweetness_adj, tannin_adj
+from memory_agent.taste import FlavorIndex, Taste, TasteProfileName, get_adj_text_for_taste_profile
+
+ADJ_LISTS = {
+    TasteProfileName.sweetness: sweetness_adj,
+    TasteProfileName.intensity: intensity_adj,
+    TasteProfileName.body: body_adj,
+    TasteProfileName.acidity: acidity_adj,
+    TasteProfileName.tannin: tannin_adj,
+}
+
+
+def _linear_adj(adj_list, value):
+    for adj, adj_value in adj_list:
+        if value < adj_value:
+            return adj
+    return adj_list[-1][0]
+
+
+@pytest.mark.parametrize("name", list(ADJ_LISTS))
+def test_adj_lookup_matches_linear_scan(name) -> None:
+    for i in range(1, 61):
+        value = i / 10
+        assert get_adj_text_for_taste_profile(name, value) == _linear_adj(ADJ_LISTS[name], value)
+
+
+def test_adj_lookup_alcohol_and_empty() -> None:
+    assert get_adj_text_for_taste_profile(TasteProfileName.alcohol, "VH") == "very high"
+    assert get_adj_text_for_taste_profile(TasteProfileName.body, 0) == "No Body"
+    with pytest.raises(ValueError):
+        get_adj_text_for_taste_profile(TasteProfileName.alcohol, "XX")
+
+
+def test_parse_many_matches_parse() -> None:
+    page = [
+        {"acidity": 3.2, "body": 4, "tannin": 0, "alcohol": "MH"},
+        {"sweetness": 1.5, "intensity": 5, "alcohol": "L"},
+        {"acidity": 3.2, "body": 4, "alcohol": "MH"},
+        {},
+    ]
+    assert Taste.parse_many(page) == [Taste.parse(dict(values)) for values in page]
+    profiles = Taste.parse_many(page)[0].profiles
+    assert profiles[-1].step == 3 and profiles[-1].value == "Medium High"
+
+
+def test_flavor_index_round_trip(tmp_path) -> None:
+    index = FlavorIndex.from_mapping({"lemon": "citrus", "oak": "oaky", "lime": "citrus"})
+    assert index.sub_groups("citrus") == ("lemon", "lime")
+    assert index.group("oak") == "oaky"
+    index.save(tmp_path / "index.json")
+    loaded = FlavorIndex.load(tmp_path / "index.json")
+    assert loaded.sub_group_to_group == index.sub_group_to_group
+    assert loaded.group("unknown") == loaded.group("unknown") == ""
+    assert loaded.unknown_sub_groups["unknown"] == 2
+
+
+def test_unknown_sub_groups_are_capped(monkeypatch) -> None:
+    monkeypatch.setattr("memory_agent.taste.MAX_UNKNOWN_SUB_GROUPS", 2)
+    index = FlavorIndex({})
+    for sub_group in ["a", "b", "c", "a", "d"]:
+        assert index.group(sub_group) == ""
+    assert index.unknown_sub_groups == {"a": 2, "b": 1}
+    assert index.unknown_overflow == 2
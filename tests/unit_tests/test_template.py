@@ -0,0 +1,44 @@
+import dataclasses
+from datetime import datetime
+
+import pytest
+from langchain_core.messages import HumanMessage, SystemMessage
+
+import template as template_module
+from config import Configuration
+from template import PROMPTS, apply_prompt_template, env
+
+
+class FixedDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 6, 1, 18, 30)
+
+
+def _jinja_messages(prompt_name: str, state: dict, configurable: Configuration) -> list:
+    # The rendering before prompts were compiled: the whole state and configuration
+    state_vars = {"CURRENT_TIME": FixedDatetime.now().strftime("%a %b %d %Y %H:%M:%S %z"), **state}
+    state_vars.update(dataclasses.asdict(configurable))
+    system_prompt = env.get_template(f"prompts/{prompt_name}.md").render(**state_vars)
+    return [SystemMessage(content=system_prompt)] + state["messages"]
+
+
+@pytest.mark.parametrize("prompt_name", sorted(PROMPTS))
+def test_compiled_prompts_render_like_jinja(prompt_name, monkeypatch) -> None:
+    monkeypatch.setattr(template_module, "datetime", FixedDatetime)
+    state = {
+        "messages": [HumanMessage("Wine for 12 guests <under> $200 & no oak")],
+        "locale": "en-US",
+        "observations": ["Rioja at $20"],
+    }
+    configurable = Configuration(max_plan_iterations=2, max_step_num=5)
+
+    assert apply_prompt_template(prompt_name, state, configurable) == _jinja_messages(prompt_name, state, configurable)
+
+
+def test_static_parts_match_the_template() -> None:
+    compiled = [prompt for prompt in PROMPTS.values() if prompt.static_parts is not None]
+    assert compiled
+    for prompt in compiled:
+        context = {name: f"<{name} & value>" for name in prompt.variables}
+        assert prompt.render(context) == prompt.template.render(**context)
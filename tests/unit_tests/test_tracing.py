@@ -0,0 +1,30 @@
+import pytest
+
+from memory_agent.tracing import JsonlExporter, OtlpJsonExporter, Tracer, critical_path, load_spans
+
+
+@pytest.mark.parametrize("exporter", [JsonlExporter, OtlpJsonExporter])
+def test_nested_spans_are_exported_with_their_critical_path(tmp_path, exporter):
+    path = tmp_path / "spans.jsonl"
+    tracer = Tracer(exporter(path))
+    with tracer.span("turn", kind="graph"):
+        with tracer.span("assistant", kind="node"):
+            pass
+        with tracer.span("tools", kind="node"), tracer.span("search", kind="http", response_bytes=10):
+            pass
+        assert not path.exists()
+
+    spans = load_spans(path)
+    assert len(spans) == 4 and len({s["trace_id"] for s in spans}) == 1
+    assert [(depth, span["name"]) for depth, span, _ in critical_path(spans)] == [
+        (0, "turn"),
+        (1, "assistant"),
+        (1, "tools"),
+        (2, "search"),
+    ]
+    assert next(s for s in spans if s["name"] == "search")["attributes"] == {"response_bytes": 10}
+
+
+def test_disabled_tracer_records_nothing():
+    with Tracer().span("turn") as span:
+        assert span is None
@@ -0,0 +1,44 @@
+import json
+from dataclasses import asdict
+
+import pytest
+from pydantic import ValidationError
+
+import utils
+from models import Plan
+from utils import JsonParseMetrics, parse_json_output, strip_code_fence
+
+PLAN = {"has_enough_context": True, "thought": "Enough", "title": "Dinner", "steps": []}
+
+
+@pytest.fixture(autouse=True)
+def metrics(monkeypatch) -> JsonParseMetrics:
+    metrics = JsonParseMetrics()
+    monkeypatch.setattr(utils, "json_parse_metrics", metrics)
+    return metrics
+
+
+def test_strip_code_fence() -> None:
+    assert strip_code_fence('```json\n{"a": 1}\n```') == '{"a": 1}'
+    assert strip_code_fence('Here is the plan:\n```\n[1, 2]\n```\nDone.') == "[1, 2]"
+    assert strip_code_fence('```ts\n{"a": 1}') == '{"a": 1}'
+    assert strip_code_fence('{"a": 1}') == '{"a": 1}'
+
+
+def test_parse_json_output(metrics) -> None:
+    assert parse_json_output(json.dumps(PLAN)) == PLAN
+    assert parse_json_output(f"```json\n{json.dumps(PLAN)}\n```") == PLAN
+    assert parse_json_output(f"Here is the plan:\n```\n{json.dumps(PLAN)}\n```") == PLAN
+    assert parse_json_output('{"title": "Dinner", "steps": [1, 2,]') == {"title": "Dinner", "steps": [1, 2]}
+    with pytest.raises(json.JSONDecodeError):
+        parse_json_output("I could not make a plan.")
+
+    assert asdict(metrics) == {"strict": 1, "fenced": 2, "repaired": 1, "failed": 1}
+    assert metrics.repair_rate == 2 / 5
+
+
+def test_json_that_is_not_a_plan_fails_validation() -> None:
+    # human_feedback_node treats these as an invalid plan
+    for content in ("[1, 2]", '{"title": "Dinner"}'):
+        with pytest.raises(ValidationError):
+            Plan.model_validate(parse_json_output(content))